@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+class AnalysisCache:
+    def __init__(self, db_path: str = "cache/analysis_cache.sqlite3",
+                 max_entries: int = 1000, ttl_seconds: Optional[int] = 30 * 24 * 3600):
+        """
+        Disk-backed cache of LLM analyses, shared by every process using the same file.
+
+        Args:
+            db_path (str): Path to the SQLite database file
+            max_entries (int): Maximum number of cached analyses before the least recently used are evicted
+            ttl_seconds (Optional[int]): Age after which an entry expires, or None to keep entries forever
+        """
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS analyses (
+                    key TEXT PRIMARY KEY,
+                    analysis TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_accessed ON analyses (accessed_at)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # A short-lived connection per operation keeps the cache safe to use from
+        # threads and from forked gunicorn workers.
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(**parts) -> str:
+        """Build a cache key from every input that affects the analysis."""
+        payload = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached analysis for a key, or None if missing or expired."""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT analysis, created_at FROM analyses WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is not None and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM analyses WHERE key = ?", (key,))
+                row = None
+
+            if row is None:
+                with self._lock:
+                    self.misses += 1
+                return None
+
+            conn.execute("UPDATE analyses SET accessed_at = ? WHERE key = ?", (now, key))
+
+        with self._lock:
+            self.hits += 1
+        return row[0]
+
+    def set(self, key: str, analysis: str):
+        """Store an analysis and evict expired and least recently used entries."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO analyses (key, analysis, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, analysis, now, now)
+            )
+            if self.ttl_seconds is not None:
+                conn.execute("DELETE FROM analyses WHERE created_at < ?", (now - self.ttl_seconds,))
+            conn.execute("""
+                DELETE FROM analyses WHERE key IN (
+                    SELECT key FROM analyses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+
+    def clear(self):
+        """Remove every cached analysis."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM analyses")
+
+    def stats(self) -> Dict:
+        """Return hit and miss counts for this process and the number of stored entries."""
+        with self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': entries}
@@ -1,15 +1,78 @@
-from fastapi import FastAPI, UploadFile, File
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import JSONResponse, FileResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from typing import Optional, List
+from fastapi.concurrency import run_in_threadpool
+from typing import Optional, List, BinaryIO
 import os
-from main import analyze_document
-import re
+import json
+import time
+import hashlib
+import asyncio
+from pipeline import AnalysisPipeline, PipelineSaturated
+from jobs import JobQueue
+from single_flight import SingleFlight
+from risk_analyzer import parse_analysis
+import main
+import metrics
 import shutil
+import uuid
 
 app = FastAPI()
 
+# Uploads are analyzed in memory; set RETAIN_UPLOADS=true to also keep a copy in documents/
+RETAIN_UPLOADS = os.getenv("RETAIN_UPLOADS", "false").lower() in ("1", "true", "yes")
+
+# Runs analyses off the event loop with bounded per-stage concurrency
+pipeline = AnalysisPipeline.from_env()
+
+# Background queue for multi-document batches
+job_queue = JobQueue.from_env(pipeline)
+
+# Identical uploads analyzed at the same time, by this worker or another, share one analysis
+single_flight = SingleFlight.from_env()
+
+# Reference documents ingested during warm-up
+REFERENCE_DIR = os.getenv("REFERENCE_DIR", "reference_docs")
+
+metrics.CallbackMetric(
+    "risk_pending_analyses", "Analyses admitted to the pipeline and not yet finished", "gauge", [],
+    lambda: [({}, pipeline.pending)]
+)
+metrics.CallbackMetric(
+    "risk_unfinished_jobs", "Batch jobs queued or running", "gauge", [],
+    lambda: [({}, job_queue.unfinished_count())]
+)
+
+@app.middleware("http")
+async def record_timings(request: Request, call_next):
+    # Stages of the request record their durations into its timings; they are returned as a Server-Timing header
+    started = time.perf_counter()
+    with metrics.track_request() as timings:
+        response = await call_next(request)
+    elapsed = time.perf_counter() - started
+    
+    route = request.scope.get("route")
+    metrics.REQUEST_SECONDS.observe(
+        elapsed, endpoint=route.path if route is not None else "unmatched", status=response.status_code
+    )
+    if timings:
+        response.headers["Server-Timing"] = metrics.server_timing({**timings, 'total': elapsed})
+    return response
+
+@app.on_event("startup")
+async def start_job_queue():
+    job_queue.start()
+
+@app.on_event("startup")
+async def start_warm_up():
+    # Warm up in the background: /health answers at once, /ready once the models and index are loaded
+    app.state.warm_up = asyncio.ensure_future(run_in_threadpool(main.warm_up, REFERENCE_DIR))
+
+@app.on_event("shutdown")
+async def stop_job_queue():
+    await job_queue.stop()
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:8000", "http://127.0.0.1:8000"], 
@@ -27,82 +90,205 @@ app.mount("/static", StaticFiles(directory="static_frontend"), name="static")
 async def read_index():
     return FileResponse("static_frontend/index.html")
 
-def parse_analysis(analysis_text: str) -> dict:
-    """Parse the analysis text to extract risk score, and fully formatted risky clauses from LLM output."""
-    result = {
-        "risk_score": 0,
-        "risky_clauses": [],
-        "risk_categories": [],
-        "clause_severity": []
-    }
-
-    # Extract risk score
-    score_match = re.search(r"Risk Score:\s*(\d+)", analysis_text)
-    if score_match:
-        result["risk_score"] = int(score_match.group(1))
-
-    # Extract fully formatted risky clauses, categories, and severity
-    clauses = []
-    categories = []
-    severity_tags = []
-
-    # Regex to capture: Clause Text, Severity, Category, Explanation
-    # Format: [Clause Text] [Severity] [Category] - [Explanation]
-    # This regex is strict and requires all parts to be present after removing leading numbers/document numbers.
-    full_clause_regex = re.compile(r'(.+?)\s*\[([^\]]+)\]\s*\[([^\]]+)\]\s*-\s*(.+)')
+def retain_upload(filename: str, file: BinaryIO):
+    """Keep a copy of an upload in the documents folder when RETAIN_UPLOADS is enabled."""
+    if not RETAIN_UPLOADS:
+        return
+    
+    os.makedirs("documents", exist_ok=True)
+    
+    # Prefix a unique id so concurrent uploads with the same name do not overwrite each other
+    file_path = os.path.join("documents", f"{uuid.uuid4().hex}_{os.path.basename(filename)}")
+    file.seek(0)
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(file, buffer)
+    file.seek(0)
 
-    for line in analysis_text.split('\n'):
-        # Only process lines that look like numbered list items from the LLM
-        if re.match(r'^\d+\.\s*', line.strip()):
-            # Remove the LLM's list number and dot prefix
-            line_cleaned = re.sub(r'^\d+\.\s*', '', line.strip())
+def analysis_response(analysis: dict, debug: bool = False) -> dict:
+    """Parse an analysis into the API response, noting how it was produced."""
+    with metrics.stage("parse"):
+        result = parse_analysis(analysis['analysis'])
+    result["mode"] = analysis.get("mode", "llm")
+    if analysis.get("fallback_reason"):
+        result["fallback_reason"] = analysis["fallback_reason"]
+    
+    return add_timings(result, debug)
 
-            # Remove potential original document numbering at the beginning of the line
-            line_cleaned = re.sub(r'^(\d+(\.\d+)*\s+)', '', line_cleaned)
+def add_timings(result: dict, debug: bool) -> dict:
+    """Add the per-stage durations of this request when debugging slow analyses."""
+    timings = metrics.current_timings()
+    if debug and timings is not None:
+        result["timings_ms"] = {name: round(seconds * 1000, 1) for name, seconds in timings.items()}
+    return result
 
-            # Attempt to match the strict full format
-            match = full_clause_regex.match(line_cleaned)
+@app.post("/analyze")
+async def analyze(file: UploadFile = File(...), latency_budget_ms: Optional[int] = Form(None), debug: bool = False):
+    await run_in_threadpool(retain_upload, file.filename, file.file)
+    
+    # Uploads of the same bytes, format and budget get the same analysis; concurrent ones share a single run
+    content = await file.read()
+    key = ":".join([
+        hashlib.sha256(content).hexdigest(),
+        os.path.splitext(file.filename)[1].lower(),
+        str(latency_budget_ms)
+    ])
+    
+    async def analyze_upload() -> dict:
+        # Analyze the upload straight from memory, off the event loop, rejecting it if the server is saturated
+        analysis = await pipeline.analyze(
+            content, file.filename,
+            latency_budget=latency_budget_ms / 1000 if latency_budget_ms is not None else None
+        )
+        return analysis_response(analysis)
+    
+    try:
+        result = await single_flight.run(key, analyze_upload)
+    except PipelineSaturated:
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy analyzing other documents. Please retry shortly.",
+            headers={"Retry-After": "5"}
+        )
+    except ValueError as e:
+        # Unsupported or unreadable document, e.g. a legacy .doc file
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Copy the shared result before adding this request's timings
+    return JSONResponse(content=add_timings(dict(result), debug))
 
-            if match:
-                # Extract groups: (Clause Text), (Severity), (Category), (Explanation)
-                clause_text = match.group(1).strip()
-                severity = match.group(2).strip()
-                category = match.group(3).strip()
-                explanation = match.group(4).strip()
+def sse_event(event: str, data: dict) -> str:
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-                # Combine clause text and explanation for the risky_clauses array
-                full_clause_entry = f"{clause_text} - {explanation}"
+@app.post("/analyze/stream")
+async def analyze_stream(file: UploadFile = File(...)):
+    """
+    Analyze a document, sending its progress as server-sent events.
 
-                clauses.append(full_clause_entry)
-                severity_tags.append(severity)
-                categories.append(category)
-            # If the line is a numbered list item but doesn't match the strict regex, it's excluded.
+    Events: 'stage' as extraction, retrieval and the LLM call start; 'score' with the
+    model's score before calibration; 'clause' for each risky clause as soon as the
+    model has written it; then 'result' with the same body as POST /analyze, or
+    'error' if the analysis failed.
+    """
+    await run_in_threadpool(retain_upload, file.filename, file.file)
+    
+    # The upload is closed once this handler returns, before the events are sent
+    content = await file.read()
+    events = pipeline.analyze_stream(content, file.filename)
+    try:
+        first_event = await events.__anext__()
+    except PipelineSaturated:
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy analyzing other documents. Please retry shortly.",
+            headers={"Retry-After": "5"}
+        )
+    
+    async def stream():
+        yield sse_event(*first_event)
+        try:
+            async for event, data in events:
+                if event == 'analysis':
+                    event, data = 'result', analysis_response(data)
+                yield sse_event(event, data)
+        except ValueError as e:
+            yield sse_event('error', {'detail': str(e)})
+        except Exception as e:
+            yield sse_event('error', {'detail': f"Analysis failed: {e}"})
+        finally:
+            # Release the pipeline slot at once if the client went away
+            await events.aclose()
+    
+    # Tell proxies not to buffer the events
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-    result["risky_clauses"] = clauses
-    result["risk_categories"] = categories
-    result["clause_severity"] = severity_tags
+@app.post("/prescore")
+async def prescore(file: UploadFile = File(...), debug: bool = False):
+    """Return an immediate keyword-based risk estimate without calling the LLM."""
+    try:
+        analysis = await pipeline.prescore(file.file, file.filename)
+    except PipelineSaturated:
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy analyzing other documents. Please retry shortly.",
+            headers={"Retry-After": "5"}
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return JSONResponse(content=analysis_response(analysis, debug))
 
-    return result
+def job_status(job: dict) -> dict:
+    """Public view of a job record."""
+    return {
+        "job_id": job["job_id"],
+        "batch_id": job["batch_id"],
+        "filename": job["filename"],
+        "status": job["status"],
+        "error": job["error"],
+    }
 
-@app.post("/analyze")
-async def analyze(file: UploadFile = File(...)):
-    # Create documents directory if it doesn't exist
-    os.makedirs("documents", exist_ok=True)
+@app.post("/batch")
+async def submit_batch(files: List[UploadFile] = File(...)):
+    # Read uploads into memory now, the request's temporary files are closed once it returns
+    documents = []
+    for file in files:
+        await run_in_threadpool(retain_upload, file.filename, file.file)
+        documents.append((file.filename, await file.read()))
     
-    # Save the uploaded file to the documents folder
-    file_path = os.path.join("documents", file.filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    try:
+        batch = job_queue.submit_batch(documents)
+    except PipelineSaturated:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many documents are queued. Please retry shortly.",
+            headers={"Retry-After": "30"}
+        )
     
-    # Analyze the document using the globally initialized components from main
-    analysis = analyze_document(file_path)
+    return JSONResponse(status_code=202, content=batch)
+
+@app.get("/batches/{batch_id}")
+async def batch_status(batch_id: str):
+    jobs = job_queue.get_batch(batch_id)
+    if jobs is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
     
-    # Parse the analysis
-    result = parse_analysis(analysis['analysis'])
+    return {
+        "batch_id": batch_id,
+        "jobs": [job_status(job) for job in jobs],
+    }
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_queue.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_status(job)
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    job = job_queue.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    # A failed document is a job outcome, not a server error: answer with its status and error
+    if job["status"] == "failed":
+        return JSONResponse(content=job_status(job))
+    if job["status"] != "done":
+        return JSONResponse(status_code=202, content=job_status(job))
     
-    # Return the response
-    return JSONResponse(content=result)
+    return JSONResponse(content=analysis_response(job["analysis"]))
 
 @app.get("/health")
 async def health():
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics of this worker process."""
+    return PlainTextResponse(metrics.render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/ready")
+async def ready():
+    status = main.readiness()
+    return JSONResponse(status, status_code=200 if status['ready'] else 503)
\ No newline at end of file
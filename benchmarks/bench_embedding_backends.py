@@ -0,0 +1,147 @@
+"""
+Check the quantized ONNX embedding backend against PyTorch sentence-transformers.
+
+Parity: every text is encoded by both backends and the cosine similarity of each
+pair of embeddings is reported, along with how often both agree on a text's
+nearest neighbours. The script exits non-zero when the lowest similarity is
+below --min-similarity, so it can gate a new export.
+
+Throughput: texts per second of each backend at several batch sizes.
+
+Texts are the chunks of the documents in --documents, or synthetic contract
+clauses when no directory is given.
+
+Usage:
+    python benchmarks/bench_embedding_backends.py --documents reference_docs --batch-sizes 1 8 32 64
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embedding_backends import create_embedding_backend
+
+CLAUSE_PARTS = [
+    "The Supplier may terminate this Agreement immediately and without cause",
+    "The Client shall indemnify and hold harmless the Supplier against all claims",
+    "Payment is due within thirty days of the invoice date",
+    "Either party may assign its rights with the prior written consent of the other",
+    "The Supplier's liability is unlimited for breaches of confidentiality",
+    "The Client waives any right to a jury trial",
+    "Notices shall be delivered in writing to the addresses set out above",
+    "The Supplier shall use reasonable efforts to meet the delivery dates",
+]
+
+def synthetic_texts(count: int) -> list:
+    """Build contract-like texts of varied length from stock clauses."""
+    rng = np.random.default_rng(0)
+    texts = []
+    for _ in range(count):
+        parts = rng.choice(len(CLAUSE_PARTS), size=rng.integers(1, 8))
+        texts.append(". ".join(CLAUSE_PARTS[i] for i in parts) + ".")
+    return texts
+
+def document_texts(directory: str, count: int) -> list:
+    """Return up to count chunks of the documents in a directory."""
+    from document_processor import DocumentProcessor
+
+    processor = DocumentProcessor()
+    texts = []
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(('.pdf', '.docx', '.txt')):
+            texts.extend(chunk['text'] for chunk in processor.process_document(os.path.join(directory, filename)))
+    return texts[:count]
+
+def parity(reference: np.ndarray, candidate: np.ndarray, k: int) -> dict:
+    """Compare two embeddings of the same texts: pairwise cosine and top-k neighbour overlap."""
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosine = (reference * candidate).sum(axis=1)
+
+    # Each text queries all the others, as the reference search does
+    k = min(k, len(reference) - 1)
+    overlap = 1.0
+    if k > 0:
+        neighbours = []
+        for embeddings in (reference, candidate):
+            similarities = embeddings @ embeddings.T
+            np.fill_diagonal(similarities, -np.inf)
+            neighbours.append(np.argsort(-similarities, axis=1)[:, :k])
+        overlap = float(np.mean([
+            len(set(a) & set(b)) / k for a, b in zip(*neighbours)
+        ]))
+
+    return {
+        'cosine_mean': float(cosine.mean()),
+        'cosine_min': float(cosine.min()),
+        'cosine_p1': float(np.percentile(cosine, 1)),
+        f'top{k}_overlap': overlap,
+    }
+
+def throughput(backend, texts: list, batch_size: int, repeats: int) -> float:
+    """Return the median texts per second of encoding all texts at a batch size."""
+    backend.encode(texts[:batch_size], batch_size=batch_size)  # warm up
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        backend.encode(texts, batch_size=batch_size)
+        timings.append(time.perf_counter() - start)
+    return len(texts) / statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding backend parity and throughput benchmark")
+    parser.add_argument("--documents", help="Directory of documents whose chunks are encoded")
+    parser.add_argument("--texts", type=int, default=512, help="Number of texts to encode")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32, 64, 128])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--k", type=int, default=5, help="Neighbours compared for retrieval agreement")
+    parser.add_argument("--min-similarity", type=float, default=0.98,
+                        help="Fail when any text's ONNX embedding is less similar than this to PyTorch's")
+    parser.add_argument("--backends", nargs="+", default=["sentence-transformers", "onnx"])
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    texts = document_texts(args.documents, args.texts) if args.documents else synthetic_texts(args.texts)
+    print(f"Encoding {len(texts)} texts")
+
+    results = {'texts': len(texts), 'backends': {}}
+    embeddings = {}
+    for name in args.backends:
+        start = time.perf_counter()
+        try:
+            backend = create_embedding_backend(name)
+        except ImportError as e:
+            print(f"Skipping {name}: {e}")
+            continue
+        load_s = time.perf_counter() - start
+
+        embeddings[name] = backend.encode(texts)
+        rates = {}
+        for batch_size in args.batch_sizes:
+            rates[batch_size] = throughput(backend, texts, batch_size, args.repeats)
+            print(f"{name:>21}  batch={batch_size:>4}  {rates[batch_size]:9.1f} texts/s")
+        results['backends'][name] = {'model': backend.name, 'load_s': load_s, 'texts_per_s': rates}
+        print(f"{name:>21}  load={load_s:.2f}s")
+
+    failed = False
+    if len(embeddings) == 2:
+        reference, candidate = (embeddings[name] for name in args.backends)
+        results['parity'] = parity(reference, candidate, args.k)
+        print("Parity: " + ", ".join(f"{key}={value:.4f}" for key, value in results['parity'].items()))
+        failed = results['parity']['cosine_min'] < args.min_similarity
+        if failed:
+            print(f"FAILED: lowest similarity is below {args.min_similarity}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
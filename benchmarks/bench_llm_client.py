@@ -0,0 +1,151 @@
+"""
+Measure how rate limits, retries and hedging in LLMClient hold up against a misbehaving server.
+
+A fake chat completions server (scripts/fake_llm_server.py) runs in process with
+injected latency, a slow tail and 429/503 errors. The same --calls are made at
+--concurrency through HTTPBackend in each configuration:
+
+    plain      no retries, no hedging
+    retries    up to --max-retries retries with jittered backoff
+    hedged     retries, and a duplicate request after the p95 latency
+
+Each server is started with the same seed, so every configuration faces the same
+sequence of injected faults. Reported: successful calls, latency percentiles of
+the successful calls, the client's statistics and the requests the server saw.
+
+Usage:
+    python benchmarks/bench_llm_client.py --calls 200 --concurrency 16 --slow-rate 0.05 --error-rate 0.05
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import threading
+from typing import Dict, List
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, "scripts"))
+
+CONFIGURATIONS = {
+    'plain': {'max_retries': 0, 'hedge': False},
+    'retries': {'hedge': False},
+    'hedged': {'hedge': True},
+}
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+def start_server(app) -> tuple:
+    """Serve app on a free local port in a background thread; return the server and its URL."""
+    import uvicorn
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, f"http://127.0.0.1:{port}"
+
+async def run_calls(client, prompt: str, calls: int, concurrency: int) -> Dict:
+    """Make calls through the client, at most concurrency at a time."""
+    latencies = []
+    failures: Dict[str, int] = {}
+    queue = list(range(calls))
+
+    async def worker():
+        while queue:
+            queue.pop()
+            start = time.perf_counter()
+            try:
+                await client.generate_async(prompt)
+            except Exception as e:
+                failures[type(e).__name__] = failures.get(type(e).__name__, 0) + 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    return {
+        'succeeded': len(latencies),
+        'failures': failures,
+        'elapsed_s': elapsed,
+        'latency_ms': {
+            'p50': percentile(latencies, 50) * 1000,
+            'p95': percentile(latencies, 95) * 1000,
+            'p99': percentile(latencies, 99) * 1000,
+            'max': max(latencies) * 1000,
+        } if latencies else {},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM client retry, hedging and rate limit benchmark")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--configurations", nargs="+", default=list(CONFIGURATIONS), choices=list(CONFIGURATIONS))
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds the fake server takes per request")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="Share of requests in the slow tail")
+    parser.add_argument("--slow-latency", type=float, default=3.0)
+    parser.add_argument("--error-rate", type=float, default=0.05, help="Share of requests answered 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.02, help="Share of requests answered 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=10.0, help="Seconds one attempt may take")
+    parser.add_argument("--requests-per-minute", type=float, default=0)
+    parser.add_argument("--tokens-per-minute", type=float, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    from fake_llm_server import create_app
+    from llm_backends import HTTPBackend
+    from llm_client import LLMClient
+    from synthetic_contracts import generate_contract
+
+    prompt = "Document to analyze:\n" + generate_contract(4000)
+    results = []
+    for name in args.configurations:
+        app = create_app(
+            latency=args.latency, jitter=args.jitter, slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+            error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+        )
+        server, url = start_server(app)
+        backend = HTTPBackend(base_url=f"{url}/v1", model="fake", timeout=args.timeout,
+                              max_connections=2 * args.concurrency)
+        options = {
+            'requests_per_minute': args.requests_per_minute,
+            'tokens_per_minute': args.tokens_per_minute,
+            'timeout': args.timeout,
+            'max_retries': args.max_retries,
+            # Hedging starts once this many calls have answered
+            'hedge_min_samples': 20,
+            **CONFIGURATIONS[name],
+        }
+        client = LLMClient(backend, **options)
+
+        result = {'configuration': name, **asyncio.run(run_calls(client, prompt, args.calls, args.concurrency))}
+        result['client'] = client.stats()
+        result['server'] = dict(app.state.stats)
+        server.should_exit = True
+        results.append(result)
+
+        latency = result['latency_ms']
+        print(f"{name:>8}  ok={result['succeeded']:>4}/{args.calls}  "
+              f"p50={latency.get('p50', 0):.0f}ms  p95={latency.get('p95', 0):.0f}ms  p99={latency.get('p99', 0):.0f}ms  "
+              f"retries={result['client']['retries']}  hedges={result['client']['hedges']} "
+              f"(won {result['client']['hedge_wins']})  failures={result['failures']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'config': vars(args), 'results': results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
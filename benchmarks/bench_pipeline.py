@@ -0,0 +1,260 @@
+"""
+Time each stage of the analysis pipeline and the API under concurrent load, offline.
+
+Synthetic contracts (see synthetic_contracts.py) are generated at each size and
+format, and the offline LocalBackend stands in for Gemini, so no API key is needed.
+Stages are timed separately on every document:
+
+    extract      text extraction (DocumentProcessor.iter_pages)
+    chunk        ClauseSplitter over the extracted text
+    embed        encoding every chunk (the embedding cache is off unless --embedding-cache)
+    retrieve     vector store query, reference merge and pre-filter
+    prompt       prompt assembly for the candidate chunks
+    parse        parse_analysis of the stand-in LLM's answer
+    end_to_end   main.analyze_document (the analysis cache is off)
+
+The API is then driven in process through httpx's ASGI transport: --requests
+uploads to POST /analyze at each --concurrency, reporting throughput, latency
+percentiles and status codes. The stand-in LLM waits --llm-latency seconds per call.
+Each upload differs by a trailing line so identical uploads are not coalesced;
+--duplicate-uploads sends the same bytes every time to measure coalescing instead.
+
+Results are written as JSON with the git commit; --compare prints the change
+against an earlier results file.
+
+Usage:
+    python benchmarks/bench_pipeline.py --sizes 10000 100000 --concurrency 1 8 32 --output results.json
+    python benchmarks/bench_pipeline.py --compare results.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import importlib
+import tempfile
+import statistics
+import subprocess
+from typing import Callable, Dict, List
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+def time_stage(func: Callable, repeats: int):
+    """Run func repeats times; return its last result and the median seconds."""
+    timings = []
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return result, statistics.median(timings)
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+def bench_stages(paths: List[str], repeats: int) -> List[Dict]:
+    """Time every pipeline stage on each document."""
+    import main
+    from document_processor import DocumentProcessor
+    from risk_analyzer import parse_analysis
+
+    processor = DocumentProcessor()
+    embedding_manager = main.get_embedding_manager()
+    risk_analyzer = main.get_risk_analyzer()
+
+    results = []
+    for path in paths:
+        stages = {}
+        pages, stages['extract'] = time_stage(lambda: list(processor.iter_pages(path)), repeats)
+        text = "".join(page_text for _, page_text in pages)
+        _, stages['chunk'] = time_stage(lambda: processor.text_splitter.split_text(text), repeats)
+        chunks = processor.process_document(path)
+        texts = [chunk['text'] for chunk in chunks]
+        embeddings, stages['embed'] = time_stage(lambda: embedding_manager.encode(texts), repeats)
+
+        def retrieve():
+            hits = embedding_manager.store.query(embeddings, main.REFERENCE_CONTEXT_SIZE)
+            similar_docs = embedding_manager.merge_top_k(hits, main.REFERENCE_CONTEXT_SIZE)
+            candidates, _ = main.chunk_filter.select(chunks, hits)
+            return similar_docs, candidates
+        (similar_docs, candidates), stages['retrieve'] = time_stage(retrieve, repeats)
+
+        (prompts, _), stages['prompt'] = time_stage(
+            lambda: risk_analyzer._prepare_analysis(candidates, similar_docs), repeats
+        )
+        answer = risk_analyzer.backend.generate(prompts[0])
+        _, stages['parse'] = time_stage(lambda: parse_analysis(answer), repeats)
+        _, stages['end_to_end'] = time_stage(lambda: main.analyze_document(path), repeats)
+
+        result = {
+            'document': os.path.basename(path),
+            'bytes': os.path.getsize(path),
+            'chars': len(text),
+            'chunks': len(chunks),
+            'stages_ms': {name: seconds * 1000 for name, seconds in stages.items()},
+        }
+        results.append(result)
+        print(f"{result['document']:>28}  chunks={len(chunks):>5}  " +
+              "  ".join(f"{name}={ms:.1f}ms" for name, ms in result['stages_ms'].items()))
+    return results
+
+async def bench_api(path: str, concurrency: int, requests: int, duplicate: bool = False) -> Dict:
+    """Send requests uploads of one document to POST /analyze, at most concurrency at a time."""
+    import httpx
+    import api
+
+    with open(path, 'rb') as f:
+        content = f.read()
+    filename = os.path.basename(path)
+    latencies = []
+    statuses: Dict[int, int] = {}
+    queue = list(range(requests))
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://bench",
+                                 timeout=None) as client:
+        async def worker():
+            while queue:
+                number = queue.pop()
+                # A distinct trailing line makes each upload a new analysis rather than a coalesced duplicate
+                upload = content if duplicate else content + f"\nUpload {number}.\n".encode()
+                start = time.perf_counter()
+                response = await client.post("/analyze", files={'file': (filename, upload)})
+                latencies.append(time.perf_counter() - start)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+
+    result = {
+        'document': filename,
+        'concurrency': concurrency,
+        'requests': requests,
+        'duplicate_uploads': duplicate,
+        'throughput_rps': requests / elapsed,
+        'latency_ms': {
+            'p50': percentile(latencies, 50) * 1000,
+            'p95': percentile(latencies, 95) * 1000,
+            'max': max(latencies) * 1000,
+        },
+        'status_codes': {str(code): count for code, count in sorted(statuses.items())},
+    }
+    print(f"{filename:>28}  concurrency={concurrency:>3}  {result['throughput_rps']:7.2f} req/s  "
+          f"p50={result['latency_ms']['p50']:.0f}ms  p95={result['latency_ms']['p95']:.0f}ms  "
+          f"status={result['status_codes']}")
+    return result
+
+def flatten(results: Dict) -> Dict[str, float]:
+    """Flatten a results file into comparable metrics keyed by name."""
+    metrics = {}
+    for stage_result in results.get('stages', []):
+        for name, ms in stage_result['stages_ms'].items():
+            metrics[f"{stage_result['document']} {name}_ms"] = ms
+    for api_result in results.get('api', []):
+        key = f"{api_result['document']} c={api_result['concurrency']}"
+        metrics[f"{key} rps"] = api_result['throughput_rps']
+        metrics[f"{key} p95_ms"] = api_result['latency_ms']['p95']
+    return metrics
+
+def compare(results: Dict, baseline_path: str):
+    """Print the change of every metric against a baseline results file."""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} (commit {baseline.get('commit')}):")
+    before = flatten(baseline)
+    for name, value in flatten(results).items():
+        if before.get(name):
+            print(f"  {name:>50}  {before[name]:10.2f} -> {value:10.2f}  ({(value / before[name] - 1) * 100:+6.1f}%)")
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline stage and API throughput benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000], help="Approximate characters per contract")
+    parser.add_argument("--formats", nargs="+", default=["txt", "docx", "pdf"])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=64, help="Uploads per concurrency level")
+    parser.add_argument("--api-size", type=int, default=10000, help="Size of the contract uploaded in the API test")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds the stand-in LLM waits per call")
+    parser.add_argument("--duplicate-uploads", action="store_true", help="Upload identical bytes in the API test")
+    parser.add_argument("--vector-store", default="numpy")
+    parser.add_argument("--embedding-cache", action="store_true", help="Keep the embedding cache on")
+    parser.add_argument("--skip-api", action="store_true")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    workdir = tempfile.mkdtemp(prefix="risk-bench-")
+
+    # Offline, isolated configuration; set before the pipeline modules read it
+    os.environ.update({
+        'LLM_BACKEND': 'local',
+        'LOCAL_LLM_LATENCY': '0',
+        'VECTOR_STORE': args.vector_store,
+        'ANALYSIS_CACHE_PATH': os.path.join(workdir, "analysis_cache.sqlite3"),
+        'ANALYSIS_CACHE_MAX_ENTRIES': '0',
+        'EMBEDDING_CACHE_DIR': os.path.join(workdir, "embeddings"),
+        'SINGLE_FLIGHT_PATH': os.path.join(workdir, "single_flight.sqlite3"),
+    })
+    if not args.embedding_cache:
+        os.environ['EMBEDDING_CACHE_CAPACITY'] = '0'
+
+    from synthetic_contracts import generate_contract, write_contract
+
+    # Imported only for its side effect: api mounts the frontend relative to the working
+    # directory, so it must be loaded before moving to the scratch directory. run_api
+    # imports it again by name once it is cached.
+    os.chdir(REPO_DIR)
+    if not args.skip_api:
+        importlib.import_module("api")
+    import main as pipeline_main
+    os.chdir(workdir)
+    pipeline_main.process_reference_docs(os.path.join(REPO_DIR, "reference_docs"))
+
+    paths = []
+    for size in args.sizes:
+        text = generate_contract(size)
+        for file_format in args.formats:
+            path = os.path.join(workdir, f"contract_{size}.{file_format}")
+            write_contract(path, text)
+            paths.append(path)
+
+    results = {
+        'commit': git_commit(),
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'config': vars(args),
+        'stages': bench_stages(paths, args.repeats),
+        'api': [],
+    }
+
+    if not args.skip_api:
+        pipeline_main.get_risk_analyzer().backend.latency = args.llm_latency
+        api_path = os.path.join(workdir, f"contract_{args.api_size}.txt")
+        write_contract(api_path, generate_contract(args.api_size, seed=1))
+
+        # One event loop for every level: the pipeline's semaphores stay bound to the loop that first used them
+        async def run_levels():
+            return [await bench_api(api_path, concurrency, args.requests, args.duplicate_uploads)
+                    for concurrency in args.concurrency]
+        results['api'] = asyncio.run(run_levels())
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if baseline:
+        compare(results, baseline)
+
+if __name__ == "__main__":
+    main()
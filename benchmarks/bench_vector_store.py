@@ -0,0 +1,84 @@
+"""
+Compare query latency of the vector store backends at growing corpus sizes.
+
+Random normalized vectors stand in for chunk embeddings, so no model is loaded.
+Chroma is skipped when chromadb is not installed.
+
+Usage:
+    python benchmarks/bench_vector_store.py --sizes 100 1000 10000 --queries 64
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vector_store import create_vector_store
+
+def time_queries(store, queries: np.ndarray, n_results: int, repeats: int) -> dict:
+    """Time batched queries against a store, returning per-batch and per-query latency."""
+    store.query(queries, n_results)  # warm up
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        store.query(queries, n_results)
+        timings.append(time.perf_counter() - start)
+    median = statistics.median(timings)
+    return {
+        'batch_ms': median * 1000,
+        'per_query_us': median / len(queries) * 1e6,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Vector store query benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 50000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=64, help="Queries per batch")
+    parser.add_argument("--n-results", type=int, default=3)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--backends", nargs="+", default=["numpy", "chroma"])
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    results = []
+    for size in args.sizes:
+        corpus = rng.normal(size=(size, args.dim)).astype(np.float32)
+        corpus /= np.linalg.norm(corpus, axis=1, keepdims=True)
+        queries = rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+        ids = [f"chunk_{i}" for i in range(size)]
+        documents = [f"chunk {i}" for i in range(size)]
+        metadatas = [{'file_name': 'synthetic.txt'} for _ in range(size)]
+
+        for backend in args.backends:
+            with tempfile.TemporaryDirectory() as directory:
+                try:
+                    store = create_vector_store(backend, directory, "benchmark")
+                except ImportError as e:
+                    print(f"Skipping {backend}: {e}")
+                    continue
+
+                start = time.perf_counter()
+                # Chroma limits the size of a single add call
+                for offset in range(0, size, 5000):
+                    end = offset + 5000
+                    store.add(ids[offset:end], corpus[offset:end], documents[offset:end], metadatas[offset:end])
+                build_s = time.perf_counter() - start
+
+                timing = time_queries(store, queries, args.n_results, args.repeats)
+                result = {'backend': backend, 'corpus_size': size, 'build_s': build_s, **timing}
+                results.append(result)
+                print(f"{backend:>6}  size={size:>7}  build={build_s:8.2f}s  "
+                      f"batch={timing['batch_ms']:9.3f}ms  per_query={timing['per_query_us']:9.1f}us")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Generate synthetic contracts of a given size as TXT, DOCX or PDF.
+
+Contracts are numbered sections of clauses filled in from templates, about one
+clause in six containing a phrase from risk_rules.json, so extraction, the
+pre-filter and the rules engine all see realistic input. Output is deterministic
+for a given seed.
+
+Usage:
+    python benchmarks/synthetic_contracts.py --sizes 10000 100000 --formats txt docx pdf --output-dir /tmp/contracts
+"""
+import os
+import random
+import argparse
+import textwrap
+from typing import List
+
+PARTIES = ["Acme Corporation", "Globex Ltd", "Initech LLC", "Umbrella Holdings", "Stark Industries", "Wayne Enterprises"]
+
+SECTION_TITLES = [
+    "Definitions", "Services", "Fees and Payment", "Term and Termination", "Confidentiality",
+    "Intellectual Property", "Warranties", "Limitation of Liability", "Indemnification",
+    "Data Protection", "Assignment", "Notices", "Governing Law", "General",
+]
+
+STANDARD_CLAUSES = [
+    "The {supplier} shall provide the Services described in Schedule {n} in accordance with good industry practice.",
+    "The {client} shall pay each undisputed invoice within {days} days of receipt.",
+    "All fees are exclusive of value added tax, which shall be payable in addition at the applicable rate.",
+    "Each party shall keep the Confidential Information of the other party secret for {years} years after termination.",
+    "Neither party shall be liable for any delay caused by events beyond its reasonable control.",
+    "The {supplier} shall maintain insurance with a reputable insurer for not less than {amount} per claim.",
+    "Any notice under this Agreement shall be in writing and delivered to the registered office of the recipient.",
+    "This Agreement shall be governed by the laws of England and Wales.",
+    "The {client} may request changes to the Services by written notice, subject to a change control procedure.",
+    "The {supplier} shall comply with all applicable laws and the {client}'s reasonable site policies.",
+    "Each party warrants that it has full power and authority to enter into this Agreement.",
+    "The {supplier} shall report on its performance against the service levels every {days} days.",
+    "Personal data shall be processed only on the documented instructions of the {client}.",
+    "No variation of this Agreement shall be effective unless agreed in writing by both parties.",
+    "If any provision is found to be invalid, the remaining provisions shall continue in full force.",
+]
+
+RISKY_CLAUSES = [
+    "The {supplier} may terminate this Agreement immediately and without cause by notice to the {client}.",
+    "The {client} shall indemnify and hold harmless the {supplier} against all losses arising from the Services.",
+    "The {client}'s liability under this Agreement shall be unlimited.",
+    "The {client} waives any right to claim damages for late delivery of the Services.",
+    "The {supplier} may change the fees at any time without notice to the {client}.",
+    "Notwithstanding any other provision, the {supplier} shall have exclusive ownership of all deliverables.",
+    "The {client} shall have no rights to audit the {supplier}'s compliance with this Agreement.",
+    "A penalty of {amount} shall be payable by the {client} for each day of delay in payment.",
+    "The {supplier} may suspend the Services at its sole discretion.",
+    "The {supplier} shall use reasonable efforts to meet the service levels but gives no guarantee.",
+]
+
+def generate_contract(target_chars: int, seed: int = 0, risky_ratio: float = 1 / 6) -> str:
+    """
+    Generate contract text of roughly target_chars characters.
+
+    Args:
+        target_chars (int): Approximate length of the text
+        seed (int): Random seed; the same seed gives the same contract
+        risky_ratio (float): Share of clauses drawn from the risky templates
+
+    Returns:
+        str: Contract text, one clause per line
+    """
+    rng = random.Random(seed)
+    supplier, client = rng.sample(PARTIES, 2)
+    lines = [f"MASTER SERVICES AGREEMENT between {supplier} (the Supplier) and {client} (the Client).", ""]
+    length = len(lines[0]) + 1
+    section = 0
+
+    while length < target_chars:
+        section += 1
+        title = f"{section}. {SECTION_TITLES[(section - 1) % len(SECTION_TITLES)]}"
+        lines.extend(["", title])
+        length += len(title) + 2
+        for clause_number in range(1, rng.randint(4, 10) + 1):
+            templates = RISKY_CLAUSES if rng.random() < risky_ratio else STANDARD_CLAUSES
+            clause = rng.choice(templates).format(
+                supplier="Supplier", client="Client",
+                n=rng.randint(1, 9), days=rng.choice([14, 30, 45, 60, 90]),
+                years=rng.randint(2, 7), amount=f"GBP {rng.randint(1, 500) * 1000:,}",
+            )
+            line = f"{section}.{clause_number} {clause}"
+            lines.append(line)
+            length += len(line) + 1
+
+    return "\n".join(lines) + "\n"
+
+def write_txt(path: str, text: str):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+def write_docx(path: str, text: str):
+    from docx import Document
+
+    document = Document()
+    for line in text.split("\n"):
+        document.add_paragraph(line)
+    document.save(path)
+
+def _pdf_escape(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def write_pdf(path: str, text: str, lines_per_page: int = 60, line_width: int = 95):
+    """Write text as a minimal PDF in Helvetica, without any PDF library."""
+    lines: List[str] = []
+    for paragraph in text.split("\n"):
+        lines.extend(textwrap.wrap(paragraph, line_width) or [""])
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+
+    # Objects 1-3 are the catalog, the page tree and the font; each page adds a page and a content stream
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    page_ids = []
+    for page_lines in pages:
+        stream = "BT /F1 10 Tf 12 TL 50 762 Td " + " ".join(
+            f"({_pdf_escape(line)}) '" for line in page_lines
+        ) + " ET"
+        data = stream.encode('latin-1', errors='replace')
+        objects.append(b"<< /Length %d >>\nstream\n" % len(data) + data + b"\nendstream")
+        content_id = len(objects)
+        objects.append((
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>"
+        ).encode())
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(page_ids)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+
+    with open(path, 'wb') as f:
+        f.write(out)
+
+WRITERS = {'txt': write_txt, 'docx': write_docx, 'pdf': write_pdf}
+
+def write_contract(path: str, text: str):
+    """Write contract text in the format given by the path's extension."""
+    WRITERS[os.path.splitext(path)[1].lower().lstrip('.')](path, text)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic contracts")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000], help="Approximate characters per contract")
+    parser.add_argument("--formats", nargs="+", default=["txt", "docx", "pdf"], choices=sorted(WRITERS))
+    parser.add_argument("--count", type=int, default=1, help="Contracts per size and format")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output-dir", default="synthetic_contracts")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for size in args.sizes:
+        for i in range(args.count):
+            text = generate_contract(size, seed=args.seed + i)
+            for file_format in args.formats:
+                path = os.path.join(args.output_dir, f"contract_{size}_{i}.{file_format}")
+                write_contract(path, text)
+                print(f"Wrote {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+from typing import Dict, List, Tuple
+from token_budget import estimate_tokens
+
+class ChunkFilter:
+    def __init__(self, token_budget: int = 8000):
+        """
+        Selects the chunks most likely to be risky before they reach the LLM.
+
+        Chunks are ranked by their distance to the closest chunk of the risky-clause
+        reference corpus; the closest are kept until the token budget is used up.
+
+        Args:
+            token_budget (int): Estimated document tokens forwarded to the LLM, or 0 to forward everything
+        """
+        self.token_budget = token_budget
+
+    def select(self, chunks: List[Dict], hits_per_chunk: List[List[Dict]]) -> Tuple[List[Dict], Dict]:
+        """
+        Pick the candidate chunks of a document.
+
+        Args:
+            chunks (List[Dict]): Document chunks, in document order
+            hits_per_chunk (List[List[Dict]]): Reference matches for each chunk, as returned by query_batch
+
+        Returns:
+            Tuple[List[Dict], Dict]: The kept chunks in document order, and counts of what was removed
+        """
+        tokens = [estimate_tokens(chunk['text']) for chunk in chunks]
+        has_reference = any(hits_per_chunk)
+
+        if self.token_budget <= 0 or sum(tokens) <= self.token_budget or not has_reference:
+            kept = list(range(len(chunks)))
+        else:
+            def best_distance(i: int) -> float:
+                distances = [hit['distance'] for hit in hits_per_chunk[i]]
+                return min(distances) if distances else float('inf')
+
+            kept = []
+            used = 0
+            for i in sorted(range(len(chunks)), key=best_distance):
+                if used + tokens[i] > self.token_budget:
+                    continue
+                kept.append(i)
+                used += tokens[i]
+            kept.sort()
+
+        selected = [chunks[i] for i in kept]
+        total_chars = sum(len(chunk['text']) for chunk in chunks)
+        kept_chars = sum(len(chunk['text']) for chunk in selected)
+        stats = {
+            'chunks_total': len(chunks),
+            'chunks_kept': len(selected),
+            'chunks_removed': len(chunks) - len(selected),
+            'chars_total': total_chars,
+            'chars_removed': total_chars - kept_chars,
+        }
+        return selected, stats
@@ -0,0 +1,190 @@
+import re
+from typing import Iterable, Iterator, List, Tuple
+
+# The break between two blocks: a blank line, or the line break before a line opening a
+# numbered clause, a section/article reference or an all-caps heading. Matches start at a
+# newline, so the scan only stops at line ends, and take the whitespace around the break.
+BLOCK_BOUNDARY = re.compile(
+    r"\n(?:[ \t]*\n\s*|[ \t]*(?=(?:"
+    r"\d+(?:\.\d+)*[.)]?[ \t]"
+    r"|(?i:section|article|clause|schedule|exhibit|annex|appendix)[ \t]+[0-9IVXivx]+"
+    r"|[A-Z][A-Z0-9 ,&'/()-]{2,}$"
+    r")))",
+    re.MULTILINE
+)
+
+# Whitespace after sentence-ending punctuation (and any closing quote or bracket)
+SENTENCE_BREAK = re.compile(r"""(?<=[.!?;:])["')\]]*\s+""")
+
+# Characters that end a complete line of prose rather than a heading
+TERMINAL_PUNCTUATION = '.;:!?,'
+
+class ClauseSplitter:
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200, heading_max_chars: int = 80):
+        """
+        Splits contract text into chunks along its structure.
+
+        The text is cut into blocks at numbered clauses, headings and blank lines;
+        a heading is joined to the block after it. Blocks are packed whole into
+        chunks of up to chunk_size characters, so a clause is only divided when it
+        is longer than a chunk by itself, and then at sentence boundaries (or, for
+        a single overlong sentence, at whitespace). Consecutive chunks share whole
+        trailing pieces of up to chunk_overlap characters.
+
+        Args:
+            chunk_size (int): Maximum characters per chunk
+            chunk_overlap (int): Maximum characters repeated from the end of the previous chunk
+            heading_max_chars (int): Longest single line without final punctuation treated as a heading
+        """
+        if chunk_overlap >= chunk_size:
+            raise ValueError("chunk_overlap must be smaller than chunk_size")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.heading_max_chars = heading_max_chars
+
+    def split_text(self, text: str) -> List[str]:
+        """Split text into chunks."""
+        return [text[start:end] for start, end in self.split_offsets(text)]
+
+    def split_offsets(self, text: str) -> List[Tuple[int, int]]:
+        """
+        Split text into chunks in one pass.
+
+        Returns:
+            List[Tuple[int, int]]: (start, end) offsets into text of each chunk
+        """
+        return self._pack(self._units(text, self._blocks(text, 0, len(text))))
+
+    def iter_offsets(self, pieces: Iterable[str]) -> Iterator[Tuple[int, int, str]]:
+        """
+        Split text arriving in pieces, e.g. page by page, yielding each chunk once it is final.
+
+        The chunks are the ones split_offsets gives for the joined text, but only the
+        text from the oldest chunk not yet yielded onwards is kept in memory.
+
+        Yields:
+            Tuple[int, int, str]: Start and end offsets of the chunk in the joined text, and its text
+        """
+        buffer = ""
+        offset = 0  # Offset of buffer[0] in the joined text
+        scan = 0  # Buffer position where the blocks not yet read begin
+        units: List[Tuple[int, int]] = []  # Read units not yet in a yielded chunk
+        flush_at = 4 * self.chunk_size
+
+        for piece in pieces:
+            buffer += piece
+            if len(buffer) < flush_at:
+                continue
+            # Wait for more text when nothing could be read, without rescanning at every piece
+            flush_at = len(buffer) + max(4 * self.chunk_size, len(buffer) - scan)
+
+            # Only complete lines are read, and the last block is left for later as it may continue
+            blocks = self._blocks(buffer, scan, buffer.rfind('\n', scan) + 1)[:-1]
+            if not blocks:
+                continue
+            units.extend(self._units(buffer, blocks))
+            scan = blocks[-1][1]
+
+            # The last chunk is held back, as later units may still be packed into it
+            chunks = self._pack(units)
+            for start, end in chunks[:-1]:
+                yield offset + start, offset + end, buffer[start:end]
+            held = chunks[-1][0]
+            units = [unit for unit in units if unit[0] >= held]
+
+            cut = min(held, scan)
+            buffer = buffer[cut:]
+            offset += cut
+            scan -= cut
+            flush_at -= cut
+            units = [(start - cut, end - cut) for start, end in units]
+
+        units.extend(self._units(buffer, self._blocks(buffer, scan, len(buffer))))
+        for start, end in self._pack(units):
+            yield offset + start, offset + end, buffer[start:end]
+
+    @staticmethod
+    def _trim(text: str, start: int, end: int) -> Tuple[int, int]:
+        """Shrink a span so it neither starts nor ends with whitespace."""
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        return start, end
+
+    def _blocks(self, text: str, start: int, end: int) -> List[Tuple[int, int]]:
+        """Return the structural blocks of text[start:end], each heading joined to the block after it."""
+        if end <= start:
+            return []
+        spans = [match.span() for match in BLOCK_BOUNDARY.finditer(text, start, end)]
+        spans.append((end, end))
+
+        blocks = []
+        heading_start = None
+        block_start = start
+        for block_end, next_start in spans:
+            if block_start < block_end and (text[block_start].isspace() or text[block_end - 1].isspace()):
+                block_start, block_end = self._trim(text, block_start, block_end)
+            if block_start < block_end:
+                if heading_start is not None:
+                    block_start, heading_start = heading_start, None
+                # A heading is a short single line without final punctuation
+                if (block_end - block_start <= self.heading_max_chars
+                        and text[block_end - 1] not in TERMINAL_PUNCTUATION
+                        and text.find('\n', block_start, block_end) < 0):
+                    heading_start = block_start
+                else:
+                    blocks.append((block_start, block_end))
+            block_start = next_start
+        if heading_start is not None:
+            blocks.append(self._trim(text, heading_start, end))
+        return blocks
+
+    def _units(self, text: str, blocks: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """Return the pieces chunks are packed from: whole blocks, or sentences of blocks too long for one chunk."""
+        units = []
+        for block_start, block_end in blocks:
+            if block_end - block_start <= self.chunk_size:
+                units.append((block_start, block_end))
+                continue
+
+            sentence_start = block_start
+            breaks = [match.end() for match in SENTENCE_BREAK.finditer(text, block_start, block_end)]
+            for sentence_end in breaks + [block_end]:
+                sentence_start, end = self._trim(text, sentence_start, sentence_end)
+                # A sentence longer than a chunk is cut at the last whitespace that fits
+                while end - sentence_start > self.chunk_size:
+                    limit = sentence_start + self.chunk_size
+                    cut = max(text.rfind(' ', sentence_start + 1, limit + 1), text.rfind('\n', sentence_start + 1, limit + 1))
+                    if cut <= sentence_start:
+                        cut = limit
+                    piece_start, piece_end = self._trim(text, sentence_start, cut)
+                    units.append((piece_start, piece_end))
+                    sentence_start, end = self._trim(text, cut, end)
+                if sentence_start < end:
+                    units.append((sentence_start, end))
+                sentence_start = sentence_end
+        return units
+
+    def _pack(self, units: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """Greedily pack consecutive units into chunks, repeating trailing units as overlap."""
+        chunks = []
+        first = 0
+        while first < len(units):
+            chunk_start = units[first][0]
+            last = first + 1
+            while last < len(units) and units[last][1] - chunk_start <= self.chunk_size:
+                last += 1
+            chunks.append((chunk_start, units[last - 1][1]))
+            if last == len(units):
+                break
+
+            # Start the next chunk with the trailing units that fit in the overlap,
+            # leaving room for at least the next new unit
+            overlap = last
+            while (overlap - 1 > first
+                   and units[last - 1][1] - units[overlap - 1][0] <= self.chunk_overlap
+                   and units[last][1] - units[overlap - 1][0] <= self.chunk_size):
+                overlap -= 1
+            first = overlap
+        return chunks
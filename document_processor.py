@@ -1,77 +1,303 @@
+import io
 import os
-from typing import List, Dict
-from docx import Document
+import bisect
+import zipfile
+import tempfile
+import threading
+import multiprocessing
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, BinaryIO, Iterator, Optional, Tuple, Union
 from PyPDF2 import PdfReader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from clause_splitter import ClauseSplitter
+
+# Process pool shared by every DocumentProcessor for page-parallel PDF extraction
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+_pdf_pool_workers = 0
+_pdf_pool_lock = threading.Lock()
+
+def _get_pdf_pool(workers: int) -> ProcessPoolExecutor:
+    """Return the shared PDF extraction pool, creating it on first use."""
+    global _pdf_pool, _pdf_pool_workers
+    # Extraction runs in executor threads, which must not each create a pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None or _pdf_pool_workers != workers:
+            if _pdf_pool is not None:
+                _pdf_pool.shutdown(wait=False)
+            # Spawn rather than fork: the parent may hold model threads that do not survive a fork
+            _pdf_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pdf_pool_workers = workers
+        return _pdf_pool
+
+def _extract_pdf_page_range(path: str, start: int, end: int) -> List[str]:
+    """Extract the text of pages [start, end) of a PDF file."""
+    pdf_reader = PdfReader(path)
+    return [pdf_reader.pages[i].extract_text() for i in range(start, end)]
+
+def _iter_docx_xml(xml: BinaryIO) -> Iterator[str]:
+    """
+    Yield the text of a WordprocessingML document part in document order.
+
+    Body paragraphs are yielded as lines. Each table row is yielded as one line
+    of its cells separated by " | ", followed by a blank line so the row is a
+    block of its own for chunking. Elements are discarded once read, so memory
+    is bounded by the largest paragraph or table row rather than the document.
+    """
+    # Open paragraphs, table rows and cells, innermost last, with the text read into each
+    open_elements: List[Tuple[str, List[str]]] = []
+    runs = 0  # Depth of w:r elements; w:tab elsewhere is a tab stop definition
+    skipped = 0  # Depth of mc:Fallback elements, which repeat the content of mc:Choice
+    body = None
+
+    for event, element in ET.iterparse(xml, events=('start', 'end')):
+        name = element.tag.rpartition('}')[2]
+        if event == 'start':
+            if name == 'Fallback':
+                skipped += 1
+            elif skipped:
+                continue
+            elif name in ('p', 'tr', 'tc'):
+                open_elements.append((name, []))
+            elif name == 'r':
+                runs += 1
+            elif name == 'body':
+                body = element
+            continue
+
+        if name == 'Fallback':
+            skipped -= 1
+            continue
+        if skipped:
+            continue
+        if name == 'r':
+            runs -= 1
+        elif name == 't' and runs:
+            open_elements[-1][1].append(element.text or '')
+        elif name == 'tab' and runs:
+            open_elements[-1][1].append('\t')
+        elif name in ('br', 'cr') and runs:
+            open_elements[-1][1].append('\n')
+        elif name in ('p', 'tr', 'tc'):
+            _, parts = open_elements.pop()
+            if name == 'p':
+                text = ''.join(parts)
+            elif name == 'tc':
+                text = ' '.join(part for part in parts if part)
+            else:
+                text = ' | '.join(parts)
+            element.clear()
+
+            if open_elements:
+                # A cell's paragraphs, a row's cells, or a text box inside a paragraph
+                open_elements[-1][1].append(text + '\n' if open_elements[-1][0] == 'p' else text)
+            elif name == 'p':
+                yield text + '\n'
+                body.clear()
+            elif name == 'tr':
+                yield text + '\n\n'
+                body.clear()
 
 class DocumentProcessor:
-    def __init__(self):
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-        )
-
-    def process_document(self, file_path: str) -> List[Dict]:
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200, heading_max_chars: int = 80,
+                 pdf_workers: Optional[int] = None, pdf_parallel_min_pages: int = 100):
+        """
+        Args:
+            chunk_size (int): Maximum characters per chunk
+            chunk_overlap (int): Maximum characters of whole clauses or sentences repeated between consecutive chunks
+            heading_max_chars (int): Longest line without final punctuation kept with the clause below it as a heading
+            pdf_workers (Optional[int]): Processes used to extract large PDFs; defaults to PDF_WORKERS, 1 disables
+            pdf_parallel_min_pages (int): Page count from which PDFs are extracted in parallel
+        """
+        self.text_splitter = ClauseSplitter(chunk_size, chunk_overlap, heading_max_chars)
+        self.chunk_size = chunk_size
+        if pdf_workers is None:
+            pdf_workers = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+        self.pdf_workers = pdf_workers
+        self.pdf_parallel_min_pages = pdf_parallel_min_pages
+        # Identifies the chunking behaviour; stored chunks built with another version are re-embedded
+        self.version = f"clauses-{chunk_size}-{chunk_overlap}-{heading_max_chars}"
+
+    def process_document(self, source: Union[str, bytes, BinaryIO], filename: Optional[str] = None) -> List[Dict]:
         """
         Process a document (PDF, Word, or TXT) and return its content in chunks.
-        
+
         Args:
-            file_path (str): Path to the document
-            
+            source (Union[str, bytes, BinaryIO]): Path to the document, or its content as bytes or a binary file object
+            filename (Optional[str]): Name of the document, used for its format; required unless source is a path
+
         Returns:
             List[Dict]: List of document chunks with metadata
         """
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"Document not found: {file_path}")
-        
-        file_extension = os.path.splitext(file_path)[1].lower()
-        
-        if file_extension == '.pdf':
-            text = self._extract_pdf_text(file_path)
-        elif file_extension in ['.docx', '.doc']:
-            text = self._extract_word_text(file_path)
-        elif file_extension == '.txt':
-            text = self._extract_txt_text(file_path)
-        else:
-            raise ValueError(f"Unsupported file format: {file_extension}")
-        
-        # Split text into chunks
-        chunks = self.text_splitter.split_text(text)
-        
-        # Create chunks with metadata
-        processed_chunks = []
-        for i, chunk in enumerate(chunks):
-            processed_chunks.append({
+        return list(self.iter_chunks(source, filename))
+
+    def iter_chunks(self, source: Union[str, bytes, BinaryIO], filename: Optional[str] = None) -> Iterator[Dict]:
+        """
+        Extract and chunk a document, yielding chunks as the text arrives.
+
+        The whole document text is never held at once. Chunks record their
+        character offsets in the document text, and PDF chunks the pages they
+        span, in their metadata.
+
+        Args:
+            source (Union[str, bytes, BinaryIO]): Path to the document, or its content as bytes or a binary file object
+            filename (Optional[str]): Name of the document, used for its format; required unless source is a path
+
+        Yields:
+            Dict: Document chunks with metadata
+        """
+        source, filename = self._open(source, filename)
+        file_extension = os.path.splitext(filename)[1].lower()
+        pages = self._iter_pages(source, file_extension)
+
+        for i, (chunk, start_offset, end_offset, page_start, page_end) in enumerate(self._chunk_pages(pages)):
+            metadata = {
+                'file_name': os.path.basename(filename),
+                'file_type': file_extension[1:],
+                'start_offset': start_offset,
+                'end_offset': end_offset,
+            }
+            if page_start is not None:
+                metadata['page_start'] = page_start
+                metadata['page_end'] = page_end
+
+            yield {
                 'text': chunk,
                 'chunk_id': i,
-                'source': file_path,
-                'metadata': {
-                    'file_name': os.path.basename(file_path),
-                    'file_type': file_extension[1:],
-                }
-            })
-        
-        return processed_chunks
-
-    def _extract_pdf_text(self, file_path: str) -> str:
-        """Extract text from PDF file."""
-        text = ""
-        with open(file_path, 'rb') as file:
-            pdf_reader = PdfReader(file)
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-        return text
-
-    def _extract_word_text(self, file_path: str) -> str:
-        """Extract text from Word document."""
-        doc = Document(file_path)
-        text = ""
-        for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
-        return text
-
-    def _extract_txt_text(self, file_path: str) -> str:
-        """Extract text from TXT file."""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read() 
\ No newline at end of file
+                'source': filename,
+                'metadata': metadata
+            }
+
+    def iter_pages(self, source: Union[str, bytes, BinaryIO], filename: Optional[str] = None) -> Iterator[Tuple[Optional[int], str]]:
+        """
+        Extract a document's text without chunking it.
+
+        Yields:
+            Tuple[Optional[int], str]: Page number (PDFs only, else None) and a piece of text
+        """
+        source, filename = self._open(source, filename)
+        yield from self._iter_pages(source, os.path.splitext(filename)[1].lower())
+
+    def _open(self, source: Union[str, bytes, BinaryIO], filename: Optional[str]) -> Tuple[Union[str, BinaryIO], str]:
+        """Check a document source and return it as a path or a file object positioned at the start, with its name."""
+        if isinstance(source, str):
+            if not os.path.exists(source):
+                raise FileNotFoundError(f"Document not found: {source}")
+            filename = filename or source
+        elif filename is None:
+            raise ValueError("A filename is required when processing a document from memory")
+        elif isinstance(source, bytes):
+            source = io.BytesIO(source)
+        else:
+            # Read file objects such as an upload's SpooledTemporaryFile from the start
+            source.seek(0)
+        return source, filename
+
+    def _iter_pages(self, source: Union[str, BinaryIO], file_extension: str) -> Iterator[Tuple[Optional[int], str]]:
+        """Dispatch to the text extractor for a file extension."""
+        if file_extension == '.pdf':
+            return self._iter_pdf_pages(source)
+        if file_extension in ['.docx', '.doc']:
+            return self._iter_word_text(source)
+        if file_extension == '.txt':
+            return self._iter_txt_text(source)
+        raise ValueError(f"Unsupported file format: {file_extension}")
+
+    def _chunk_pages(self, pages: Iterator[Tuple[Optional[int], str]]) -> Iterator[Tuple[str, int, int, Optional[int], Optional[int]]]:
+        """
+        Split a stream of (page number, text) pieces into chunks.
+
+        The chunks match splitting the whole text at once, but only the text
+        of the chunk being built is held.
+
+        Yields:
+            Tuple[str, int, int, Optional[int], Optional[int]]: Chunk text, its start and end
+            offsets in the document text, and the first and last page it spans
+        """
+        page_offsets: List[int] = []  # Document offsets where pages start
+        page_numbers: List[Optional[int]] = []
+        length = 0
+
+        def page_at(offset: int) -> Optional[int]:
+            index = bisect.bisect_right(page_offsets, offset) - 1
+            return page_numbers[max(index, 0)]
+
+        def texts() -> Iterator[str]:
+            nonlocal length
+            for page_number, text in pages:
+                page_offsets.append(length)
+                page_numbers.append(page_number)
+                length += len(text)
+                yield text
+
+        for start, end, chunk in self.text_splitter.iter_offsets(texts()):
+            yield chunk, start, end, page_at(start), page_at(end - 1)
+
+    def _iter_pdf_pages(self, source: Union[str, BinaryIO]) -> Iterator[Tuple[int, str]]:
+        """Yield (page number, text) for each page of a PDF, extracting large PDFs across processes."""
+        pdf_reader = PdfReader(source)
+        page_count = len(pdf_reader.pages)
+
+        if self.pdf_workers <= 1 or page_count < self.pdf_parallel_min_pages:
+            for i, page in enumerate(pdf_reader.pages):
+                yield i + 1, page.extract_text() + "\n"
+            return
+
+        # Workers open the PDF by path rather than receiving its bytes, and each parses it
+        # once for a single range of pages; an upload held in memory is written to a temporary file
+        temp_path = None
+        if isinstance(source, str):
+            path = os.path.abspath(source)
+        else:
+            source.seek(0)
+            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+                while True:
+                    block = source.read(1 << 20)
+                    if not block:
+                        break
+                    f.write(block)
+            path = temp_path = f.name
+
+        try:
+            step = -(-page_count // self.pdf_workers)
+            starts = list(range(0, page_count, step))
+            ends = [min(start + step, page_count) for start in starts]
+
+            pool = _get_pdf_pool(self.pdf_workers)
+            page_number = 1
+            for texts in pool.map(_extract_pdf_page_range, [path] * len(starts), starts, ends):
+                for text in texts:
+                    yield page_number, text + "\n"
+                    page_number += 1
+        finally:
+            if temp_path is not None:
+                os.remove(temp_path)
+
+    def _iter_word_text(self, source: Union[str, BinaryIO]) -> Iterator[Tuple[None, str]]:
+        """Yield the text of a Word document's paragraphs and tables, streamed from its document.xml."""
+        if not zipfile.is_zipfile(source):
+            raise ValueError("Not a .docx document. Legacy binary Word (.doc) files are not supported; "
+                             "save the document as .docx or PDF and upload it again.")
+        with zipfile.ZipFile(source) as archive:
+            try:
+                xml = archive.open('word/document.xml')
+            except KeyError:
+                raise ValueError("Not a Word document: word/document.xml is missing")
+            with xml:
+                for text in _iter_docx_xml(xml):
+                    yield None, text
+
+    def _iter_txt_text(self, source: Union[str, BinaryIO], block_size: int = 64 * 1024) -> Iterator[Tuple[None, str]]:
+        """Yield the text of a TXT file in blocks."""
+        if isinstance(source, str):
+            f = open(source, 'r', encoding='utf-8')
+        else:
+            f = io.TextIOWrapper(source, encoding='utf-8')
+        try:
+            for block in iter(lambda: f.read(block_size), ''):
+                yield None, block
+        finally:
+            if isinstance(source, str):
+                f.close()
+            else:
+                # Leave the caller's file object open
+                f.detach()
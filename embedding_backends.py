@@ -0,0 +1,127 @@
+import os
+import json
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+
+# Where scripts/export_onnx_model.py writes the quantized model by default
+DEFAULT_ONNX_MODEL_DIR = os.path.join("models", f"{EMBEDDING_MODEL}-onnx-int8")
+
+class EmbeddingBackend:
+    """Interface for the sentence encoders EmbeddingManager can use."""
+
+    # Identifies the model and its numerics; part of the embedding cache and reference manifest keys
+    name = "base"
+    dim = 0
+
+    def encode(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        """Return one L2-normalized float32 embedding row per text."""
+        raise NotImplementedError
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    def __init__(self, model_name: str = EMBEDDING_MODEL):
+        from sentence_transformers import SentenceTransformer
+
+        self.name = model_name
+        self.model = SentenceTransformer(model_name)
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        return np.asarray(self.model.encode(texts, batch_size=batch_size), dtype=np.float32)
+
+class OnnxEmbeddingBackend(EmbeddingBackend):
+    """
+    Int8-quantized ONNX export of the sentence-transformer, run with ONNX Runtime.
+
+    Needs only onnxruntime and tokenizers, not PyTorch. The model directory is
+    written by scripts/export_onnx_model.py and holds model.onnx, tokenizer.json
+    and embedding_config.json. Pooling and normalization match the
+    sentence-transformers pipeline (mean over tokens, then L2 norm).
+    """
+
+    def __init__(self, model_dir: str = DEFAULT_ONNX_MODEL_DIR):
+        """
+        Args:
+            model_dir (str): Directory holding the exported model
+        """
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError(f"EMBEDDING_BACKEND=onnx needs {e.name}; install requirements-onnx.txt") from e
+
+        with open(os.path.join(model_dir, "embedding_config.json"), 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        self.name = config['name']
+        self.dim = config['dim']
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=config['max_seq_length'])
+        self.tokenizer.enable_padding(pad_id=config.get('pad_token_id', 0))
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, "model.onnx"), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def encode(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+
+        # Batch texts of similar length together so little compute goes to padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            encodings = self.tokenizer.encode_batch([texts[i] for i in batch])
+            attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+            inputs = {
+                'input_ids': np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+                'attention_mask': attention_mask,
+                'token_type_ids': np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+            }
+            token_embeddings = self.session.run(
+                None, {name: value for name, value in inputs.items() if name in self.input_names}
+            )[0]
+
+            # Mean over the real tokens, then normalize
+            mask = attention_mask[:, :, None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+            embeddings[batch] = pooled
+
+        return embeddings
+
+def create_embedding_backend(name: Optional[str] = None) -> EmbeddingBackend:
+    """
+    Create the embedding backend selected by name or the EMBEDDING_BACKEND environment variable.
+
+    Args:
+        name (Optional[str]): 'sentence-transformers' (default) or 'onnx'
+
+    Returns:
+        EmbeddingBackend: The backend
+    """
+    name = (name or os.getenv("EMBEDDING_BACKEND", "sentence-transformers")).lower()
+    if name == "sentence-transformers":
+        return SentenceTransformerBackend()
+    if name == "onnx":
+        return OnnxEmbeddingBackend(os.getenv("EMBEDDING_MODEL_DIR", DEFAULT_ONNX_MODEL_DIR))
+    raise ValueError(f"Unknown embedding backend: {name}")
+
+# Backends are loaded once per process and shared by every EmbeddingManager; one loaded
+# before a fork (e.g. in the gunicorn master) is shared copy-on-write by the workers
+_backends: Dict[str, EmbeddingBackend] = {}
+_backends_lock = threading.Lock()
+
+def load_embedding_backend(name: Optional[str] = None) -> EmbeddingBackend:
+    """Return the selected embedding backend, creating it on first use."""
+    name = (name or os.getenv("EMBEDDING_BACKEND", "sentence-transformers")).lower()
+    if name not in _backends:
+        with _backends_lock:
+            if name not in _backends:
+                _backends[name] = create_embedding_backend(name)
+    return _backends[name]
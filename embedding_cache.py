@@ -0,0 +1,143 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+import numpy as np
+
+class EmbeddingCache:
+    def __init__(self, directory: str, model_id: str, dim: int, capacity: int = 100000):
+        """
+        Persistent cache of chunk embeddings, shared by every process using the same directory.
+
+        Vectors live in a memory-mapped float32 matrix with one row per slot; a
+        SQLite index maps chunk keys to slots and tracks last use for LRU eviction.
+
+        Args:
+            directory (str): Directory holding the matrix and index files
+            model_id (str): Embedding model identifier; each model gets its own files
+            dim (int): Embedding dimension
+            capacity (int): Number of embeddings kept before the least recently used are evicted
+        """
+        self.model_id = model_id
+        self.dim = dim
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        name = re.sub(r'[^A-Za-z0-9_.-]', '_', model_id)
+        self.index_path = os.path.join(directory, f"{name}.index.sqlite3")
+        matrix_path = os.path.join(directory, f"{name}.f32")
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (dim INTEGER, capacity INTEGER)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    slot INTEGER UNIQUE NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries (accessed_at)")
+
+            # Start over if the matrix was laid out for another dimension or capacity
+            conn.execute("BEGIN IMMEDIATE")
+            meta = conn.execute("SELECT dim, capacity FROM meta").fetchone()
+            if meta != (dim, capacity) or not os.path.exists(matrix_path):
+                conn.execute("DELETE FROM entries")
+                conn.execute("DELETE FROM meta")
+                conn.execute("INSERT INTO meta (dim, capacity) VALUES (?, ?)", (dim, capacity))
+                np.memmap(matrix_path, dtype=np.float32, mode='w+', shape=(capacity, dim)).flush()
+
+        self.matrix = np.memmap(matrix_path, dtype=np.float32, mode='r+', shape=(capacity, dim))
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.index_path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def key(self, text: str) -> str:
+        """Return the cache key of a chunk: a hash of its whitespace-normalized text and the model id."""
+        normalized = " ".join(text.split())
+        return hashlib.sha256(f"{self.model_id}\0{normalized}".encode()).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Return the cached embeddings for whichever keys are present."""
+        unique_keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._connect() as conn:
+            # Hold the write lock while copying rows, so a concurrent put_many cannot evict and reuse a slot mid-read
+            conn.execute("BEGIN IMMEDIATE")
+            for start in range(0, len(unique_keys), 500):
+                batch = unique_keys[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT key, slot FROM entries WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for key, slot in rows:
+                    found[key] = np.array(self.matrix[slot])
+            if found:
+                now = time.time()
+                conn.executemany("UPDATE entries SET accessed_at = ? WHERE key = ?", [(now, key) for key in found])
+
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(unique_keys) - len(found)
+        return found
+
+    def put_many(self, keys: List[str], embeddings: np.ndarray):
+        """Store embeddings, evicting the least recently used entries when full."""
+        if not keys:
+            return
+
+        with self._connect() as conn:
+            # Take the write lock up front so slot allocation is consistent across processes
+            conn.execute("BEGIN IMMEDIATE")
+            existing = set()
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                existing.update(key for (key,) in conn.execute(
+                    f"SELECT key FROM entries WHERE key IN ({','.join('?' * len(batch))})", batch
+                ))
+            new = [(key, embedding) for key, embedding in dict(zip(keys, embeddings)).items() if key not in existing]
+            new = new[-self.capacity:]
+            if not new:
+                return
+
+            used = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            free = self.capacity - used
+            slots = list(range(used, used + min(free, len(new))))
+            if len(slots) < len(new):
+                evicted = conn.execute(
+                    "SELECT key, slot FROM entries ORDER BY accessed_at LIMIT ?", (len(new) - len(slots),)
+                ).fetchall()
+                conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in evicted])
+                slots.extend(slot for _, slot in evicted)
+
+            # Write the vectors before the index rows that point at them become visible
+            for (_, embedding), slot in zip(new, slots):
+                self.matrix[slot] = embedding
+            self.matrix.flush()
+
+            now = time.time()
+            conn.executemany(
+                "INSERT INTO entries (key, slot, accessed_at) VALUES (?, ?, ?)",
+                [(key, slot, now) for (key, _), slot in zip(new, slots)]
+            )
+
+    def stats(self) -> Dict:
+        """Return hit and miss counts for this process and the number of stored embeddings."""
+        with self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': entries}
@@ -1,45 +1,93 @@
 import os
-from typing import List, Dict
-import chromadb
-from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
+import heapq
+from typing import List, Dict, Optional
+import numpy as np
 from dotenv import load_dotenv
+from embedding_backends import EmbeddingBackend, load_embedding_backend
+from embedding_cache import EmbeddingCache
+from vector_store import VectorStore, create_vector_store
+import metrics
 
 load_dotenv()
 
 class EmbeddingManager:
-    def __init__(self, collection_name: str = "document_embeddings"):
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.client = chromadb.Client(Settings(
-            persist_directory="vector_db",
-            is_persistent=True
-        ))
-        self.collection = self.client.get_or_create_collection(
-            name=collection_name,
-            metadata={"hnsw:space": "cosine"}
+    def __init__(self, collection_name: str = "document_embeddings", persist_directory: str = "vector_db",
+                 vector_store: Optional[VectorStore] = None, embedding_backend: Optional[EmbeddingBackend] = None):
+        # PyTorch sentence-transformers by default; EMBEDDING_BACKEND=onnx selects the quantized ONNX Runtime model
+        self.backend = embedding_backend or load_embedding_backend()
+        # The backend name keys cached embeddings and the reference manifest, so switching backends re-embeds
+        self.model_name = self.backend.name
+        self.persist_directory = persist_directory
+        
+        # Chroma by default; VECTOR_STORE=numpy selects the in-process exact-search index
+        self.store = vector_store or create_vector_store(
+            os.getenv("VECTOR_STORE", "chroma"), persist_directory, collection_name
         )
+        
+        # Persistent cache of chunk embeddings so recurring boilerplate is only encoded once
+        cache_capacity = int(os.getenv("EMBEDDING_CACHE_CAPACITY", "100000"))
+        self.embedding_cache = None
+        if cache_capacity > 0:
+            self.embedding_cache = EmbeddingCache(
+                os.getenv("EMBEDDING_CACHE_DIR", "cache/embeddings"),
+                model_id=self.model_name,
+                dim=self.backend.dim,
+                capacity=cache_capacity
+            )
+
+    def encode(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        """
+        Embed texts, reusing cached embeddings and encoding only the misses in one batch.
+        
+        Args:
+            texts (List[str]): Texts to embed
+            batch_size (int): Encoder batch size
+            
+        Returns:
+            np.ndarray: One embedding row per text
+        """
+        if self.embedding_cache is None:
+            return self.backend.encode(texts, batch_size=batch_size)
+        
+        keys = [self.embedding_cache.key(text) for text in texts]
+        cached = self.embedding_cache.get_many(keys)
+        
+        # Encode each distinct missing text once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            encoded = self.backend.encode(list(missing.values()), batch_size=batch_size)
+            self.embedding_cache.put_many(list(missing.keys()), encoded)
+            cached.update(zip(missing.keys(), encoded))
+        
+        return np.stack([cached[key] for key in keys]).astype(np.float32)
 
-    def add_documents(self, documents: List[Dict]):
+    def add_documents(self, documents: List[Dict]) -> List[str]:
         """
         Add documents to the vector database.
         
         Args:
             documents (List[Dict]): List of document chunks with metadata
+            
+        Returns:
+            List[str]: Ids of the added chunks
         """
+        if not documents:
+            return []
+        
         texts = [doc['text'] for doc in documents]
         metadatas = [doc['metadata'] for doc in documents]
         ids = [f"{doc['source']}_{doc['chunk_id']}" for doc in documents]
         
         # Generate embeddings
-        embeddings = self.model.encode(texts).tolist()
-        
-        # Add to collection
-        self.collection.add(
-            embeddings=embeddings,
-            documents=texts,
-            metadatas=metadatas,
-            ids=ids
-        )
+        embeddings = self.encode(texts)
+        
+        # Add to the vector store
+        self.store.add(ids, embeddings, texts, metadatas)
+        
+        return ids
 
     def search_similar(self, query: str, n_results: int = 5) -> List[Dict]:
         """
@@ -52,26 +100,96 @@ class EmbeddingManager:
         Returns:
             List[Dict]: List of similar documents with metadata
         """
-        # Generate query embedding
-        query_embedding = self.model.encode(query).tolist()
+        return self.query_batch([query], n_results=n_results)[0]
+
+    def query_batch(self, queries: List[str], n_results: int = 5, batch_size: int = 64) -> List[List[Dict]]:
+        """
+        Search for similar documents for many queries at once.
         
-        # Search in collection
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=n_results
-        )
+        All queries are encoded in a single batched pass and sent to the
+        vector store in one query call.
+        
+        Args:
+            queries (List[str]): Query texts
+            n_results (int): Number of results to return per query
+            batch_size (int): Encoder batch size
+            
+        Returns:
+            List[List[Dict]]: Similar documents for each query, in query order
+        """
+        if not queries:
+            return []
+        
+        # Nothing to match against yet
+        if self.store.count() == 0:
+            return [[] for _ in queries]
+        
+        # Generate all query embeddings in one batched pass
+        with metrics.stage("embed"):
+            query_embeddings = self.encode(queries, batch_size=batch_size)
+        
+        # Search the vector store with every query embedding at once
+        with metrics.stage("vector_search"):
+            return self.store.query(query_embeddings, n_results)
+
+    @staticmethod
+    def merge_top_k(per_query: List[List[Dict]], k: int) -> List[Dict]:
+        """
+        Merge per-query results into a global top-k by distance.
+        
+        A reference chunk matched by several queries is kept once, with its
+        best (smallest) distance.
+        
+        Args:
+            per_query (List[List[Dict]]): Results from query_batch
+            k (int): Number of results to keep
+            
+        Returns:
+            List[Dict]: Unique similar documents, closest first
+        """
+        best = {}
+        for hits in per_query:
+            for hit in hits:
+                current = best.get(hit['id'])
+                if current is None or hit['distance'] < current['distance']:
+                    best[hit['id']] = hit
+        
+        return heapq.nsmallest(k, best.values(), key=lambda hit: hit['distance'])
+
+    def query_groups(self, groups: List[List[str]], n_results: int = 5, batch_size: int = 64) -> List[List[List[Dict]]]:
+        """
+        Search for similar documents for several groups of queries at once.
+        
+        Queries from every group are encoded and sent to the vector store together.
+        
+        Args:
+            groups (List[List[str]]): Query texts grouped by document
+            n_results (int): Number of results to return per query
+            batch_size (int): Encoder batch size
+            
+        Returns:
+            List[List[List[Dict]]]: Similar documents for each query, grouped like the input
+        """
+        queries = [query for group in groups for query in group]
+        per_query = self.query_batch(queries, n_results=n_results, batch_size=batch_size)
         
-        # Format results
-        similar_docs = []
-        for i in range(len(results['documents'][0])):
-            similar_docs.append({
-                'text': results['documents'][0][i],
-                'metadata': results['metadatas'][0][i],
-                'distance': results['distances'][0][i] if 'distances' in results else None
-            })
+        grouped = []
+        offset = 0
+        for group in groups:
+            grouped.append(per_query[offset:offset + len(group)])
+            offset += len(group)
         
-        return similar_docs
+        return grouped
+
+    def delete_documents(self, ids: List[str]):
+        """Remove chunks from the vector database by id."""
+        if ids:
+            self.store.delete(ids)
+
+    def count(self) -> int:
+        """Return the number of chunks in the vector database."""
+        return self.store.count()
 
     def clear_collection(self):
         """Clear all documents from the collection."""
-        self.collection.delete() 
\ No newline at end of file
+        self.delete_documents(self.store.ids())
@@ -0,0 +1,30 @@
+import gc
+import os
+import multiprocessing
+
+# Run with: gunicorn -c gunicorn.conf.py api:app
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(4, multiprocessing.cpu_count()))))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = 120
+
+# Import the app in the master so workers are forked with the code already loaded
+preload_app = True
+
+def when_ready(server):
+    """Load the embedding model weights in the master before any worker is forked."""
+    from embedding_backends import load_embedding_backend
+
+    # ONNX Runtime starts its thread pools when a session is created, which does not survive
+    # a fork; the int8 model is small, so each worker loads its own during warm-up
+    if os.getenv("EMBEDDING_BACKEND", "sentence-transformers").lower() == "onnx":
+        return
+
+    # Loading only reads the weights; no inference threads exist yet, so forking is safe.
+    # Vector store and LLM clients are opened per worker, during its warm-up.
+    load_embedding_backend()
+
+    # Keep the preloaded objects out of the workers' garbage collection so their pages stay shared
+    gc.freeze()
+    server.log.info("Embedding model loaded in master")
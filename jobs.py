@@ -0,0 +1,382 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import main
+import metrics
+from pipeline import AnalysisPipeline, PipelineSaturated
+
+# Columns of a job record, in table order
+JOB_FIELDS = ('job_id', 'batch_id', 'filename', 'status', 'error', 'analysis', 'submitted_at', 'finished_at')
+
+# Error recorded for jobs whose worker stopped before finishing them; their uploads are gone
+ORPHANED_ERROR = "The worker running this job stopped before it finished; submit the document again"
+
+class JobStore:
+    def __init__(self, db_path: str = "cache/jobs.sqlite3", lease_seconds: float = 30.0):
+        """
+        Job records and results in SQLite, shared by every process using the same file.
+
+        A batch runs in the worker that accepted it, but any worker can answer
+        status and result requests for it. Each job records its worker, and each
+        worker renews a heartbeat; unfinished jobs of a worker whose heartbeat is
+        older than lease_seconds can never finish and are marked failed.
+
+        Args:
+            db_path (str): Path to the SQLite database file
+            lease_seconds (float): Time after which a worker that did not renew its heartbeat is considered gone
+        """
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    batch_id TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    error TEXT,
+                    analysis TEXT,
+                    submitted_at REAL NOT NULL,
+                    finished_at REAL,
+                    owner TEXT
+                )
+            """)
+            # Files created before jobs recorded their worker
+            if 'owner' not in [column[1] for column in conn.execute("PRAGMA table_info(jobs)")]:
+                conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs (batch_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, finished_at)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS workers (
+                    owner TEXT PRIMARY KEY,
+                    heartbeat_at REAL NOT NULL
+                )
+            """)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # A short-lived connection per operation, as in AnalysisCache
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _record(row: tuple) -> Dict:
+        job = dict(zip(JOB_FIELDS, row))
+        job['analysis'] = json.loads(job['analysis']) if job['analysis'] is not None else None
+        return job
+
+    def add(self, jobs: List[Dict], owner: str):
+        """Store new job records, run by the worker owner."""
+        with self._connect() as conn:
+            conn.executemany(
+                f"INSERT INTO jobs ({', '.join(JOB_FIELDS)}, owner) VALUES ({', '.join('?' * (len(JOB_FIELDS) + 1))})",
+                [tuple(job[field] for field in JOB_FIELDS) + (owner,) for job in jobs]
+            )
+
+    def heartbeat(self, owner: str):
+        """Record that the worker owner is alive."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO workers (owner, heartbeat_at) VALUES (?, ?) "
+                "ON CONFLICT (owner) DO UPDATE SET heartbeat_at = excluded.heartbeat_at",
+                (owner, time.time())
+            )
+
+    def fail_orphans(self) -> int:
+        """Mark failed the unfinished jobs of workers whose heartbeat expired, and forget those workers."""
+        now = time.time()
+        with self._connect() as conn:
+            failed = conn.execute("""
+                UPDATE jobs SET status = 'failed', error = ?, finished_at = ?
+                WHERE status IN ('queued', 'running')
+                AND (owner IS NULL OR owner NOT IN (SELECT owner FROM workers WHERE heartbeat_at > ?))
+            """, (ORPHANED_ERROR, now, now - self.lease_seconds)).rowcount
+            conn.execute("DELETE FROM workers WHERE heartbeat_at <= ?", (now - self.lease_seconds,))
+        return failed
+
+    def release(self, owner: str) -> int:
+        """Mark failed the unfinished jobs of a stopping worker, and forget the worker."""
+        with self._connect() as conn:
+            failed = conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? "
+                "WHERE status IN ('queued', 'running') AND owner = ?",
+                (ORPHANED_ERROR, time.time(), owner)
+            ).rowcount
+            conn.execute("DELETE FROM workers WHERE owner = ?", (owner,))
+        return failed
+
+    def set_status(self, job_ids: List[str], status: str):
+        with self._connect() as conn:
+            conn.executemany("UPDATE jobs SET status = ? WHERE job_id = ?", [(status, job_id) for job_id in job_ids])
+
+    def finish(self, job_id: str, analysis: Optional[Dict], error: Optional[str]):
+        """Record a job's result or error."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, analysis = ?, finished_at = ? WHERE job_id = ?",
+                ('failed' if error is not None else 'done', error,
+                 json.dumps(analysis) if analysis is not None else None, time.time(), job_id)
+            )
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Return a job record, or None if unknown."""
+        with self._connect() as conn:
+            row = conn.execute(f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._record(row) if row is not None else None
+
+    def get_batch(self, batch_id: str) -> Optional[List[Dict]]:
+        """Return the job records of a batch in submission order, or None if unknown."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE batch_id = ? ORDER BY rowid", (batch_id,)
+            ).fetchall()
+        return [self._record(row) for row in rows] or None
+
+    def unfinished_count(self) -> int:
+        """Return the number of queued or running jobs of live workers, across all workers."""
+        with self._connect() as conn:
+            return conn.execute("""
+                SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')
+                AND owner IN (SELECT owner FROM workers WHERE heartbeat_at > ?)
+            """, (time.time() - self.lease_seconds,)).fetchone()[0]
+
+    def evict_finished(self, max_finished: int):
+        """Drop the oldest finished jobs beyond max_finished."""
+        with self._connect() as conn:
+            conn.execute("""
+                DELETE FROM jobs WHERE job_id IN (
+                    SELECT job_id FROM jobs WHERE status IN ('done', 'failed')
+                    ORDER BY finished_at DESC LIMIT -1 OFFSET ?
+                )
+            """, (max_finished,))
+
+class JobQueue:
+    def __init__(self, pipeline: AnalysisPipeline, store: JobStore, workers: int = 1, group_size: int = 16,
+                 max_queued: int = 1000, max_finished: int = 5000):
+        """
+        Background queue analyzing batches of documents.
+
+        Jobs share the pipeline's executor and stage limits, and through it the
+        globally loaded EmbeddingManager and RiskAnalyzer. Documents are taken in
+        groups: a group is extracted in parallel, embedded and queried together,
+        and its LLM calls run concurrently within the pipeline's LLM limit.
+        Uploads wait in the memory of the accepting worker; job records and
+        results are kept in the shared store. Jobs left unfinished when this
+        worker stops are marked failed then, or by another worker once this
+        worker's heartbeat expires if it dies.
+
+        Args:
+            pipeline (AnalysisPipeline): Pipeline providing the executor and stage limits
+            store (JobStore): Shared store of job records and results
+            workers (int): Groups processed at the same time
+            group_size (int): Documents embedded together in one retrieval batch
+            max_queued (int): Unfinished jobs, across all workers, accepted before new batches are rejected
+            max_finished (int): Finished jobs kept for status and result lookups
+        """
+        self.pipeline = pipeline
+        self.store = store
+        self.workers = workers
+        self.group_size = group_size
+        self.max_queued = max_queued
+        self.max_finished = max_finished
+        # Jobs accepted by this worker and not yet finished, with their uploads
+        self.pending: Dict[str, Dict] = {}
+        self.queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._owner_pid: Optional[int] = None
+        self._owner_id = ""
+
+    @property
+    def owner_id(self) -> str:
+        """Identity of this worker in the store; regenerated after a fork, as in SingleFlight."""
+        if self._owner_pid != os.getpid():
+            self._owner_pid = os.getpid()
+            self._owner_id = f"{self._owner_pid}-{uuid.uuid4().hex}"
+        return self._owner_id
+
+    @classmethod
+    def from_env(cls, pipeline: AnalysisPipeline) -> 'JobQueue':
+        """Create a job queue configured from environment variables."""
+        return cls(
+            pipeline,
+            JobStore(
+                os.getenv("JOB_STORE_PATH", "cache/jobs.sqlite3"),
+                lease_seconds=float(os.getenv("JOB_LEASE_SECONDS", "30")),
+            ),
+            workers=int(os.getenv("JOB_WORKERS", "1")),
+            group_size=int(os.getenv("JOB_GROUP_SIZE", "16")),
+            max_queued=int(os.getenv("MAX_QUEUED_JOBS", "1000")),
+            max_finished=int(os.getenv("MAX_FINISHED_JOBS", "5000")),
+        )
+
+    def start(self):
+        """Start the background workers on the running event loop, failing jobs left by stopped workers."""
+        self.store.heartbeat(self.owner_id)
+        failed = self.store.fail_orphans()
+        if failed:
+            print(f"Marked {failed} batch jobs of stopped workers as failed")
+        self.queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    async def stop(self):
+        """Cancel the background workers and fail the jobs they had not finished."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.pending.clear()
+        await asyncio.to_thread(self.store.release, self.owner_id)
+
+    def unfinished_count(self) -> int:
+        """Return the number of queued or running jobs across all workers."""
+        return self.store.unfinished_count()
+
+    def submit_batch(self, documents: List[Tuple[str, bytes]]) -> Dict:
+        """
+        Queue a batch of documents for analysis.
+
+        Args:
+            documents (List[Tuple[str, bytes]]): (file name, file content) for each document
+
+        Returns:
+            Dict: The batch id and the job id for each document
+        """
+        unfinished = self.unfinished_count()
+        if unfinished + len(documents) > self.max_queued:
+            raise PipelineSaturated(f"{unfinished} jobs already queued")
+
+        batch_id = uuid.uuid4().hex
+        jobs = []
+        for filename, content in documents:
+            jobs.append({
+                'job_id': uuid.uuid4().hex,
+                'batch_id': batch_id,
+                'filename': filename,
+                'status': 'queued',
+                'error': None,
+                'analysis': None,
+                'submitted_at': time.time(),
+                'finished_at': None,
+            })
+            self.pending[jobs[-1]['job_id']] = {**jobs[-1], 'content': content}
+        self.store.add(jobs, self.owner_id)
+
+        job_ids = [job['job_id'] for job in jobs]
+        for start in range(0, len(job_ids), self.group_size):
+            self.queue.put_nowait(job_ids[start:start + self.group_size])
+
+        self.store.evict_finished(self.max_finished)
+        return {'batch_id': batch_id, 'job_ids': job_ids}
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """Return a job record, or None if unknown."""
+        return self.store.get(job_id)
+
+    def get_batch(self, batch_id: str) -> Optional[List[Dict]]:
+        """Return the job records of a batch, or None if unknown."""
+        return self.store.get_batch(batch_id)
+
+    def _finish(self, job: Dict, analysis: Optional[Dict] = None, error: Optional[BaseException] = None):
+        self.pending.pop(job['job_id'], None)
+        self.store.finish(job['job_id'], analysis, str(error) if error is not None else None)
+
+    async def _heartbeat(self):
+        """Renew this worker's heartbeat and fail the jobs of workers that died."""
+        while True:
+            await asyncio.sleep(self.store.lease_seconds / 3)
+            try:
+                await asyncio.to_thread(self.store.heartbeat, self.owner_id)
+                failed = await asyncio.to_thread(self.store.fail_orphans)
+                if failed:
+                    print(f"Marked {failed} batch jobs of stopped workers as failed")
+            except Exception as e:
+                print(f"Error renewing the batch worker heartbeat: {e}")
+
+    async def _worker(self):
+        while True:
+            job_ids = await self.queue.get()
+            jobs = [self.pending[job_id] for job_id in job_ids if job_id in self.pending]
+            try:
+                await self._run_group(jobs)
+            except Exception as e:
+                # Fail the group's remaining jobs and keep serving the queue
+                print(f"Error processing a group of {len(jobs)} batch jobs: {e}")
+                for job in jobs:
+                    if job['job_id'] in self.pending:
+                        try:
+                            self._finish(job, error=e)
+                        except Exception as finish_error:
+                            print(f"Error recording failed batch job {job['job_id']}: {finish_error}")
+                            self.pending.pop(job['job_id'], None)
+            finally:
+                self.queue.task_done()
+
+    async def _run_group(self, jobs: List[Dict]):
+        self.store.set_status([job['job_id'] for job in jobs], 'running')
+        for job in jobs:
+            metrics.record_queue_wait('job', time.time() - job['submitted_at'])
+
+        # Extract and chunk every document in the group in parallel
+        extracted = await asyncio.gather(*[
+            self.pipeline.run_blocking(self.pipeline.extract_slots, main.extract_chunks, job['content'], job['filename'])
+            for job in jobs
+        ], return_exceptions=True)
+
+        # The raw uploads are no longer needed once extracted
+        for job in jobs:
+            job['content'] = None
+
+        ready = []
+        for job, chunks in zip(jobs, extracted):
+            if isinstance(chunks, BaseException):
+                self._finish(job, error=chunks)
+            else:
+                ready.append((job, chunks))
+        if not ready:
+            return
+
+        # Embed and query all chunks of the group together
+        try:
+            contexts = await self.pipeline.run_blocking(
+                self.pipeline.embed_slots, main.retrieve_context_groups, [chunks for _, chunks in ready]
+            )
+        except Exception as e:
+            for job, _ in ready:
+                self._finish(job, error=e)
+            return
+
+        # Run the LLM calls concurrently within the pipeline's LLM limit
+        async def analyze(job: Dict, similar_docs: List[Dict], candidates: List[Dict], prefilter_stats: Dict):
+            try:
+                async with metrics.acquire(self.pipeline.llm_slots, 'llm'):
+                    result = await main.get_risk_analyzer().analyze_document_async(candidates, similar_docs)
+                self._finish(job, analysis={
+                    'analysis': result['analysis'],
+                    'risk_score': result['risk_score'],
+                    'mode': result['mode'],
+                    'prefilter': prefilter_stats,
+                })
+            except Exception as e:
+                self._finish(job, error=e)
+
+        await asyncio.gather(*[
+            analyze(job, *context)
+            for (job, _), context in zip(ready, contexts)
+        ])
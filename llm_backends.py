@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import asyncio
+from typing import AsyncIterator, Dict, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# HTTP statuses of a failure that may pass on retry: rate limited, or the server overloaded or briefly down
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+class RetryableLLMError(Exception):
+    """A model call failed in a way a later attempt may not, e.g. a rate limit or an overloaded server."""
+
+    def __init__(self, message: str, status: Optional[int] = None, retry_after: Optional[float] = None):
+        """
+        Args:
+            message (str): What failed
+            status (Optional[int]): HTTP status of the failure, if any
+            retry_after (Optional[float]): Seconds the server asked the client to wait before retrying
+        """
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+class LLMBackend:
+    """Interface for the models RiskAnalyzer can call."""
+
+    # Identifies the model and its settings; part of the analysis cache key
+    name = "base"
+    config: Dict = {}
+
+    def generate(self, prompt: str) -> str:
+        """Return the model's completion for a prompt."""
+        raise NotImplementedError
+
+    async def generate_async(self, prompt: str) -> str:
+        """Return the model's completion for a prompt without blocking the event loop."""
+        return await asyncio.to_thread(self.generate, prompt)
+
+    async def stream_async(self, prompt: str) -> AsyncIterator[str]:
+        """Yield the model's completion for a prompt in pieces as it is generated."""
+        yield await self.generate_async(prompt)
+
+class GeminiBackend(LLMBackend):
+    def __init__(self, model_name: str = 'gemini-2.0-flash', generation_config: Optional[Dict] = None):
+        import google.generativeai as genai
+
+        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+        self.name = model_name
+        self.config = generation_config or {
+            'temperature': 0.1,  # Lower temperature for more focused responses
+            'top_p': 0.8,
+            'top_k': 40,
+            'max_output_tokens': 500,  # Limit output length
+        }
+        self.model = genai.GenerativeModel(model_name, generation_config=self.config)
+
+    def generate(self, prompt: str) -> str:
+        response = self.model.generate_content(prompt)
+        return response.text
+
+    async def generate_async(self, prompt: str) -> str:
+        response = await self.model.generate_content_async(prompt)
+        return response.text
+
+    async def stream_async(self, prompt: str) -> AsyncIterator[str]:
+        response = await self.model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            yield chunk.text
+
+class LocalBackend(LLMBackend):
+    """
+    Deterministic offline stand-in for the LLM, for tests and benchmarks.
+
+    Flags sentences of the analyzed document that match the keyword rules and
+    answers in the same format the system prompt asks of the real model.
+    """
+
+    name = "local"
+
+    def __init__(self, latency: float = 0.0, stream_piece_chars: int = 20):
+        """
+        Args:
+            latency (float): Seconds to wait before answering, to simulate a remote model
+            stream_piece_chars (int): Characters per piece when streaming; the latency is spread over the pieces
+        """
+        from risk_rules import RiskRules
+
+        self.latency = latency
+        self.stream_piece_chars = stream_piece_chars
+        self.rules = RiskRules.load()
+        self.config = {'latency': latency, 'rules_version': self.rules.version}
+
+    def _document_text(self, prompt: str) -> str:
+        """Return the part of the prompt holding the document to analyze."""
+        text = prompt.split("Document to analyze:", 1)[-1]
+        return text.split("Reference Documents:", 1)[0]
+
+    def _complete(self, prompt: str) -> str:
+        return self.rules.heuristic_analysis([self._document_text(prompt)])['analysis']
+
+    def generate(self, prompt: str) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._complete(prompt)
+
+    async def generate_async(self, prompt: str) -> str:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._complete(prompt)
+
+    async def stream_async(self, prompt: str) -> AsyncIterator[str]:
+        # Fixed-size pieces, like a real model's, split lines at arbitrary points
+        completion = self._complete(prompt)
+        pieces = [completion[i:i + self.stream_piece_chars] for i in range(0, len(completion), self.stream_piece_chars)]
+        for piece in pieces:
+            if self.latency:
+                await asyncio.sleep(self.latency / len(pieces))
+            yield piece
+
+class HTTPBackend(LLMBackend):
+    """
+    Model served over an OpenAI-compatible chat completions API, e.g. vLLM, Ollama or a gateway.
+
+    Connections are pooled: each process keeps one HTTP client for blocking calls and
+    one per event loop for async calls. They are created on first use, so gunicorn
+    workers forked from a master that loaded the analyzer do not share sockets.
+    """
+
+    def __init__(self, base_url: str, model: str, api_key: Optional[str] = None,
+                 generation_config: Optional[Dict] = None, timeout: float = 60.0, max_connections: int = 32):
+        """
+        Args:
+            base_url (str): API root, e.g. http://localhost:8080/v1
+            model (str): Model name sent with each request
+            api_key (Optional[str]): Bearer token, if the server needs one
+            generation_config (Optional[Dict]): Sampling parameters sent with each request
+            timeout (float): Seconds to wait for the server before failing the call
+            max_connections (int): Connections kept open to the server per client
+        """
+        import httpx
+
+        self.httpx = httpx
+        self.name = model
+        self.config = generation_config or {
+            'temperature': 0.1,
+            'top_p': 0.8,
+            'max_tokens': 500,
+        }
+        self.client_options = {
+            'base_url': base_url.rstrip('/'),
+            'headers': {'Authorization': f"Bearer {api_key}"} if api_key else {},
+            'timeout': timeout,
+            'limits': httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        }
+        # Per kind: the (process, event loop) the client belongs to, and the client
+        self._clients: Dict[str, tuple] = {}
+
+    def _client(self, kind: str):
+        """Return the pooled 'sync' client of this process, or the 'async' client of its running event loop."""
+        owner = (os.getpid(), asyncio.get_running_loop() if kind == 'async' else None)
+        if kind not in self._clients or self._clients[kind][0] != owner:
+            client_class = self.httpx.AsyncClient if kind == 'async' else self.httpx.Client
+            self._clients[kind] = (owner, client_class(**self.client_options))
+        return self._clients[kind][1]
+
+    def _request(self, prompt: str, stream: bool = False) -> Dict:
+        body = {'model': self.name, 'messages': [{'role': 'user', 'content': prompt}], **self.config}
+        if stream:
+            body['stream'] = True
+        return body
+
+    def _check(self, response):
+        """Raise RetryableLLMError for statuses worth retrying, and httpx's error for other failures."""
+        if response.status_code in RETRYABLE_STATUS:
+            retry_after = response.headers.get('retry-after')
+            raise RetryableLLMError(
+                f"LLM server answered {response.status_code}",
+                status=response.status_code,
+                retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None
+            )
+        response.raise_for_status()
+
+    def generate(self, prompt: str) -> str:
+        try:
+            response = self._client('sync').post("/chat/completions", json=self._request(prompt))
+        except self.httpx.TransportError as e:
+            raise RetryableLLMError(f"LLM server unreachable: {e!r}") from e
+        self._check(response)
+        return response.json()['choices'][0]['message']['content']
+
+    async def generate_async(self, prompt: str) -> str:
+        try:
+            response = await self._client('async').post("/chat/completions", json=self._request(prompt))
+        except self.httpx.TransportError as e:
+            raise RetryableLLMError(f"LLM server unreachable: {e!r}") from e
+        self._check(response)
+        return response.json()['choices'][0]['message']['content']
+
+    async def stream_async(self, prompt: str) -> AsyncIterator[str]:
+        try:
+            async with self._client('async').stream(
+                "POST", "/chat/completions", json=self._request(prompt, stream=True)
+            ) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                self._check(response)
+                # Server-sent events, one "data: {...}" line per piece, ending with "data: [DONE]"
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    piece = json.loads(data)['choices'][0]['delta'].get('content')
+                    if piece:
+                        yield piece
+        except self.httpx.TransportError as e:
+            raise RetryableLLMError(f"LLM server unreachable: {e!r}") from e
+
+def create_backend(name: Optional[str] = None) -> LLMBackend:
+    """
+    Create the LLM backend selected by name or the LLM_BACKEND environment variable.
+
+    Args:
+        name (Optional[str]): 'gemini' (default), 'http' or 'local'
+
+    Returns:
+        LLMBackend: The backend
+    """
+    name = (name or os.getenv("LLM_BACKEND", "gemini")).lower()
+    if name == "gemini":
+        return GeminiBackend()
+    if name == "http":
+        return HTTPBackend(
+            base_url=os.getenv("LLM_HTTP_URL", "http://localhost:8080/v1"),
+            model=os.getenv("LLM_HTTP_MODEL", "default"),
+            api_key=os.getenv("LLM_HTTP_API_KEY"),
+            timeout=float(os.getenv("LLM_TIMEOUT_SECONDS", "60")),
+            max_connections=int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "32")),
+        )
+    if name == "local":
+        return LocalBackend(latency=float(os.getenv("LOCAL_LLM_LATENCY", "0")))
+    raise ValueError(f"Unknown LLM backend: {name}")
@@ -0,0 +1,384 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from llm_backends import LLMBackend, RetryableLLMError, RETRYABLE_STATUS
+from token_budget import estimate_tokens
+import metrics
+
+class LLMDeadlineExceeded(Exception):
+    """Raised when a model call cannot finish within its deadline, counting retries and rate-limit waits."""
+
+def is_retryable(error: BaseException) -> bool:
+    """Return whether a failed model call may succeed on another attempt."""
+    if isinstance(error, (RetryableLLMError, asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    # google.api_core errors carry their HTTP status as code, e.g. 429 for ResourceExhausted
+    return getattr(error, 'code', None) in RETRYABLE_STATUS
+
+def _retry_reason(error: BaseException) -> str:
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return "timeout"
+    if getattr(error, 'status', None) == 429 or getattr(error, 'code', None) == 429:
+        return "rate_limited"
+    return "error"
+
+class TokenBucket:
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        """
+        Limits the rate of something, e.g. requests or tokens per minute, allowing bursts up to capacity.
+
+        Callers reserve an amount and are told how long to wait until it is available.
+        The amount is taken at once, so the bucket may go negative and later callers
+        queue behind earlier ones in arrival order.
+
+        Args:
+            per_minute (float): Amount refilled per minute
+            capacity (Optional[float]): Largest burst; defaults to one minute's amount
+        """
+        self.rate = per_minute / 60
+        self.capacity = capacity or per_minute
+        self.available = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float, max_wait: Optional[float] = None) -> Optional[float]:
+        """
+        Take amount from the bucket.
+
+        Args:
+            amount (float): Amount needed; more than the capacity counts as the capacity
+            max_wait (Optional[float]): Take nothing and return None if the wait would be longer
+
+        Returns:
+            Optional[float]: Seconds to wait before using the amount
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+            self.updated = now
+            amount = min(amount, self.capacity)
+            wait = max(0.0, (amount - self.available) / self.rate)
+            if max_wait is not None and wait > max_wait:
+                return None
+            self.available -= amount
+            return wait
+
+    def adjust(self, amount: float):
+        """Give back (positive) or take (negative) an amount once the real usage is known."""
+        with self._lock:
+            self.available = min(self.capacity, self.available + amount)
+
+class LLMClient:
+    def __init__(self, backend: LLMBackend, requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 timeout: float = 60.0, deadline: float = 120.0, max_retries: int = 3,
+                 backoff_base: float = 0.5, backoff_max: float = 20.0, hedge: bool = False,
+                 hedge_percentile: float = 95, hedge_min_samples: int = 20, latency_window: int = 200,
+                 output_tokens: int = 500):
+        """
+        Calls a backend within rate limits, retrying transient failures and optionally hedging slow calls.
+
+        Every call waits for room under the requests and tokens per minute limits of the
+        provider's quota (per process, so divide it across workers). An attempt that
+        fails with a rate limit, an overloaded server or a timeout is retried after an
+        exponential backoff with full jitter, honouring any Retry-After, until
+        max_retries or the call's deadline. With hedging on, an async attempt that has
+        not answered after the hedge_percentile latency of recent calls is duplicated,
+        if the rate limits allow it at once; the first answer wins and the other
+        request is cancelled.
+
+        The blocking generate retries and rate-limits the same way, but cannot hedge or
+        interrupt a running attempt, so it relies on the backend's own timeout.
+
+        Args:
+            backend (LLMBackend): Backend making the calls
+            requests_per_minute (float): Requests allowed per minute (0 for no limit)
+            tokens_per_minute (float): Estimated prompt and answer tokens allowed per minute (0 for no limit)
+            timeout (float): Seconds one async attempt may take
+            deadline (float): Seconds a call may take in total, counting waits and retries
+            max_retries (int): Attempts after the first
+            backoff_base (float): Upper bound of the first retry's random delay; doubles per retry
+            backoff_max (float): Largest upper bound of a retry's random delay
+            hedge (bool): Duplicate async attempts slower than the hedge_percentile latency
+            hedge_percentile (float): Percentile of recent latencies after which an attempt is hedged
+            hedge_min_samples (int): Latencies observed before hedging starts
+            latency_window (int): Recent successful attempt latencies kept
+            output_tokens (int): Answer tokens reserved per call before the answer is known
+        """
+        self.backend = backend
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.output_tokens = output_tokens
+        self.latencies = deque(maxlen=latency_window)
+        self.counts = {
+            'calls': 0, 'attempts': 0, 'retries': 0, 'timeouts': 0, 'failures': 0,
+            'hedges': 0, 'hedge_wins': 0, 'rate_limited': 0, 'queued': 0, 'queue_wait_seconds': 0.0,
+        }
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, backend: LLMBackend) -> 'LLMClient':
+        """Create a client for a backend configured from environment variables."""
+        return cls(
+            backend,
+            requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0")),
+            tokens_per_minute=float(os.getenv("LLM_TOKENS_PER_MINUTE", "0")),
+            timeout=float(os.getenv("LLM_TIMEOUT_SECONDS", "60")),
+            deadline=float(os.getenv("LLM_DEADLINE_SECONDS", "120")),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "3")),
+            hedge=os.getenv("LLM_HEDGE", "false").lower() in ("1", "true", "yes"),
+            hedge_percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "95")),
+            output_tokens=int(backend.config.get('max_output_tokens') or backend.config.get('max_tokens') or 500),
+        )
+
+    def stats(self) -> Dict:
+        """Return call, retry, hedge and rate-limit queue counts since the client was created."""
+        with self._lock:
+            stats = dict(self.counts)
+        stats['hedge_delay_seconds'] = self._hedge_delay()
+        return stats
+
+    def _count(self, name: str, amount: float = 1):
+        with self._lock:
+            self.counts[name] += amount
+
+    def _reserve(self, tokens: int, max_wait: Optional[float]) -> Optional[float]:
+        """Reserve one request and its tokens; return the seconds to wait, or None (nothing taken) past max_wait."""
+        wait = 0.0
+        taken: List[Tuple[TokenBucket, float]] = []
+        for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+            if bucket is None:
+                continue
+            delay = bucket.reserve(amount, max_wait)
+            if delay is None:
+                for taken_bucket, taken_amount in taken:
+                    taken_bucket.adjust(taken_amount)
+                return None
+            taken.append((bucket, amount))
+            wait = max(wait, delay)
+        return wait
+
+    def _unreserve(self, tokens: int):
+        if self.requests is not None:
+            self.requests.adjust(1)
+        if self.tokens is not None:
+            self.tokens.adjust(min(tokens, self.tokens.capacity))
+
+    def _admit(self, tokens: int, deadline: float) -> float:
+        """Reserve room for an attempt under the rate limits; return the seconds to wait for it."""
+        if self.requests is None and self.tokens is None:
+            return 0.0
+        wait = self._reserve(tokens, max_wait=deadline - time.monotonic())
+        if wait is None:
+            self._count('failures')
+            raise LLMDeadlineExceeded("LLM rate limits would delay the call past its deadline")
+        metrics.record_queue_wait("llm_rate_limit", wait)
+        if wait > 0:
+            self._count('rate_limited')
+            self._count('queue_wait_seconds', wait)
+        return wait
+
+    async def _admit_async(self, tokens: int, deadline: float):
+        wait = self._admit(tokens, deadline)
+        if wait <= 0:
+            return
+        self._count('queued')
+        try:
+            await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            # The call was abandoned while queued; its reservation is not used
+            self._unreserve(tokens)
+            raise
+        finally:
+            self._count('queued', -1)
+
+    def _admit_sync(self, tokens: int, deadline: float):
+        wait = self._admit(tokens, deadline)
+        if wait <= 0:
+            return
+        self._count('queued')
+        try:
+            time.sleep(wait)
+        finally:
+            self._count('queued', -1)
+
+    def _retry_delay(self, error: Exception, attempt: int, deadline: float) -> float:
+        """Return how long to wait before retrying a failed attempt, or re-raise when it should not be retried."""
+        if not is_retryable(error) or attempt >= self.max_retries:
+            self._count('failures')
+            raise error
+        # Full jitter spreads out the retries of calls that failed together, e.g. on one rate limit
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        retry_after = getattr(error, 'retry_after', None)
+        if retry_after:
+            delay = max(delay, retry_after)
+        if time.monotonic() + delay >= deadline:
+            self._count('failures')
+            raise LLMDeadlineExceeded(f"LLM call did not succeed within {self.deadline:g}s: {error!r}") from error
+        reason = _retry_reason(error)
+        print(f"LLM attempt {attempt + 1} failed ({reason}), retrying in {delay:.2f}s: {error!r}")
+        metrics.LLM_RETRIES.inc(reason=reason)
+        self._count('retries')
+        return delay
+
+    def _succeeded(self, prompt: str, tokens: int, response: str):
+        """Settle the token reservation with the answer's real size."""
+        if self.tokens is not None:
+            # Reservations larger than the bucket took only its capacity
+            used = estimate_tokens(prompt) + estimate_tokens(response)
+            self.tokens.adjust(min(tokens, self.tokens.capacity) - min(used, self.tokens.capacity))
+
+    def _observe(self, seconds: float):
+        with self._lock:
+            self.latencies.append(seconds)
+
+    def _hedge_delay(self) -> Optional[float]:
+        """Return the latency after which an attempt is hedged, or None when hedging is off or unwarmed."""
+        with self._lock:
+            if not self.hedge or len(self.latencies) < self.hedge_min_samples:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(round(self.hedge_percentile / 100 * (len(ordered) - 1))))]
+
+    def generate(self, prompt: str) -> str:
+        """Return the model's completion for a prompt, blocking."""
+        deadline = time.monotonic() + self.deadline
+        tokens = estimate_tokens(prompt) + self.output_tokens
+        self._count('calls')
+        attempt = 0
+        while True:
+            self._admit_sync(tokens, deadline)
+            self._count('attempts')
+            start = time.monotonic()
+            try:
+                response = self.backend.generate(prompt)
+            except Exception as error:
+                time.sleep(self._retry_delay(error, attempt, deadline))
+                attempt += 1
+                continue
+            self._observe(time.monotonic() - start)
+            self._succeeded(prompt, tokens, response)
+            return response
+
+    async def generate_async(self, prompt: str) -> str:
+        """Return the model's completion for a prompt without blocking the event loop."""
+        deadline = time.monotonic() + self.deadline
+        tokens = estimate_tokens(prompt) + self.output_tokens
+        self._count('calls')
+        attempt = 0
+        while True:
+            await self._admit_async(tokens, deadline)
+            try:
+                response = await self._attempt_async(prompt, tokens, deadline)
+            except Exception as error:
+                await asyncio.sleep(self._retry_delay(error, attempt, deadline))
+                attempt += 1
+                continue
+            self._succeeded(prompt, tokens, response)
+            return response
+
+    async def _call_async(self, prompt: str) -> str:
+        self._count('attempts')
+        start = time.monotonic()
+        response = await self.backend.generate_async(prompt)
+        self._observe(time.monotonic() - start)
+        return response
+
+    async def _attempt_async(self, prompt: str, tokens: int, deadline: float) -> str:
+        """Make one attempt within the timeout, hedging it once if it is slower than usual."""
+        start = time.monotonic()
+        end = start + min(self.timeout, deadline - start)
+        hedge_delay = self._hedge_delay()
+        hedge_at = start + hedge_delay if hedge_delay is not None and start + hedge_delay < end else None
+
+        primary = asyncio.ensure_future(self._call_async(prompt))
+        running = [primary]
+        hedged = False
+        error: Optional[BaseException] = None
+        try:
+            while running:
+                wake = hedge_at if hedge_at is not None else end
+                done, _ = await asyncio.wait(
+                    running, timeout=max(0.0, wake - time.monotonic()), return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    running.remove(task)
+                    if task.exception() is None:
+                        if hedged:
+                            won = task is not primary
+                            metrics.LLM_HEDGES.inc(outcome="won" if won else "lost")
+                            if won:
+                                self._count('hedge_wins')
+                        return task.result()
+                    error = task.exception()
+                if done:
+                    continue
+
+                if hedge_at is not None:
+                    hedge_at = None
+                    # Hedge only if the rate limits have room now; a hedge is never worth queueing for
+                    if self._reserve(tokens, max_wait=0) is not None:
+                        hedged = True
+                        self._count('hedges')
+                        running.append(asyncio.ensure_future(self._call_async(prompt)))
+                elif time.monotonic() >= end:
+                    self._count('timeouts')
+                    raise asyncio.TimeoutError(f"LLM attempt took longer than {end - start:.1f}s")
+            if hedged:
+                metrics.LLM_HEDGES.inc(outcome="failed")
+            raise error
+        finally:
+            for task in running:
+                task.cancel()
+
+    async def stream_async(self, prompt: str) -> AsyncIterator[str]:
+        """
+        Yield the model's completion for a prompt in pieces as it is generated.
+
+        Attempts that fail or time out before their first piece are retried; once
+        pieces have been passed on, a failure is raised as is. Streams are not hedged.
+        """
+        deadline = time.monotonic() + self.deadline
+        tokens = estimate_tokens(prompt) + self.output_tokens
+        self._count('calls')
+        attempt = 0
+        while True:
+            await self._admit_async(tokens, deadline)
+            self._count('attempts')
+            pieces = self.backend.stream_async(prompt)
+            try:
+                timeout = min(self.timeout, deadline - time.monotonic())
+                first = await asyncio.wait_for(pieces.__anext__(), timeout)
+            except StopAsyncIteration:
+                first = ""
+            except Exception as error:
+                if isinstance(error, asyncio.TimeoutError):
+                    self._count('timeouts')
+                await pieces.aclose()
+                await asyncio.sleep(self._retry_delay(error, attempt, deadline))
+                attempt += 1
+                continue
+            break
+
+        answer = [first]
+        try:
+            if first:
+                yield first
+            async for piece in pieces:
+                answer.append(piece)
+                yield piece
+        finally:
+            await pieces.aclose()
+        self._succeeded(prompt, tokens, "".join(answer))
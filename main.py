@@ -1,64 +1,404 @@
 import os
+import glob
+import json
+import asyncio
 import argparse
-from typing import List
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, BinaryIO, Optional, Tuple, Union
 from document_processor import DocumentProcessor
 from embedding_manager import EmbeddingManager
-from risk_analyzer import RiskAnalyzer
+from risk_analyzer import RiskAnalyzer, parse_analysis
+from reference_manifest import ReferenceManifest
+from chunk_filter import ChunkFilter
+import metrics
 
-# Initialize components globally
-embedding_manager = EmbeddingManager()
-risk_analyzer = RiskAnalyzer()
+# Components are created on first use, so processes that only extract text
+# (such as batch worker processes re-importing this module) never load the models
+_embedding_manager: Optional[EmbeddingManager] = None
+_risk_analyzer: Optional[RiskAnalyzer] = None
+_components_lock = threading.Lock()
+
+def get_embedding_manager() -> EmbeddingManager:
+    """Return the shared EmbeddingManager, creating it on first use."""
+    global _embedding_manager
+    if _embedding_manager is None:
+        with _components_lock:
+            if _embedding_manager is None:
+                _embedding_manager = EmbeddingManager()
+    return _embedding_manager
+
+def get_risk_analyzer() -> RiskAnalyzer:
+    """Return the shared RiskAnalyzer, creating it on first use."""
+    global _risk_analyzer
+    if _risk_analyzer is None:
+        with _components_lock:
+            if _risk_analyzer is None:
+                _risk_analyzer = RiskAnalyzer()
+                if 0 < chunk_filter.token_budget <= _risk_analyzer.map_reduce_threshold:
+                    print(f"Warning: PREFILTER_TOKEN_BUDGET ({chunk_filter.token_budget}) is not above "
+                          f"MAP_REDUCE_THRESHOLD_TOKENS ({_risk_analyzer.map_reduce_threshold}), "
+                          "so filtered documents are never analyzed in shards")
+    return _risk_analyzer
+
+def _cache_stats() -> List[Tuple[str, Dict]]:
+    """Return (cache name, stats) for the caches of the components loaded so far."""
+    caches = []
+    if _risk_analyzer is not None:
+        caches.append(('analysis', _risk_analyzer.cache.stats()))
+    if _embedding_manager is not None and _embedding_manager.embedding_cache is not None:
+        caches.append(('embedding', _embedding_manager.embedding_cache.stats()))
+    return caches
+
+metrics.CallbackMetric(
+    "risk_cache_hits_total", "Cache hits in this process", "counter", ["cache"],
+    lambda: [({'cache': name}, stats['hits']) for name, stats in _cache_stats()]
+)
+metrics.CallbackMetric(
+    "risk_cache_misses_total", "Cache misses in this process", "counter", ["cache"],
+    lambda: [({'cache': name}, stats['misses']) for name, stats in _cache_stats()]
+)
+metrics.CallbackMetric(
+    "risk_cache_entries", "Entries stored in each cache", "gauge", ["cache"],
+    lambda: [({'cache': name}, stats['entries']) for name, stats in _cache_stats()]
+)
+
+metrics.CallbackMetric(
+    "risk_llm_queued_calls", "LLM calls waiting for room under the rate limits", "gauge", [],
+    lambda: [({}, _risk_analyzer.llm.stats()['queued'])] if _risk_analyzer is not None else []
+)
+
+# Set once warm_up has loaded the models and the reference index
+_ready = threading.Event()
+_warm_up_error: Optional[str] = None
+
+# Only chunks closest to the risky-clause reference corpus are sent to the LLM, within this budget
+chunk_filter = ChunkFilter(token_budget=int(os.getenv("PREFILTER_TOKEN_BUDGET", "8000")))
+
+# Number of reference documents passed to the analyzer as context
+REFERENCE_CONTEXT_SIZE = 3
+
+# Document formats the processor can read
+SUPPORTED_EXTENSIONS = ('.pdf', '.docx', '.doc', '.txt')
 
 def process_reference_docs(reference_dir: str):
-    """Process all reference documents and add them to the vector database."""
+    """
+    Bring the vector database in line with the reference documents.
+    
+    Only new or changed files are embedded; chunks of deleted files are removed.
+    A manifest of file hashes next to the vector database records what is stored.
+    """
     doc_processor = DocumentProcessor()
+    embedding_manager = get_embedding_manager()
     
-    if not os.path.exists(reference_dir) or not os.listdir(reference_dir):
+    if not os.path.exists(reference_dir):
         print(f"No reference documents found in {reference_dir}. Skipping processing.")
         return
         
     print("Processing reference documents...")
     
-    # Clear existing documents from the collection before adding new ones
-    embedding_manager.clear_collection() 
+    manifest = ReferenceManifest(
+        os.path.join(embedding_manager.persist_directory, f"reference_manifest_{embedding_manager.store.name}.json"),
+        chunker_version=doc_processor.version,
+        embedding_model=embedding_manager.model_name
+    )
     
-    for filename in os.listdir(reference_dir):
-        if filename.endswith(('.pdf', '.docx', '.doc', '.txt')):
+    with manifest.locked():
+        # Rebuild from scratch if the stored chunks were built differently or have gone missing
+        if not manifest.compatible or (manifest.files and embedding_manager.count() == 0):
+            print("Reference manifest missing or outdated, rebuilding the collection.")
+            embedding_manager.clear_collection()
+            manifest.files = {}
+        
+        current_files = {
+            filename for filename in os.listdir(reference_dir)
+            if filename.endswith(SUPPORTED_EXTENSIONS)
+        }
+        
+        # Remove chunks of reference documents that no longer exist
+        for filename in sorted(set(manifest.files) - current_files):
+            print(f"Removing deleted reference document: {filename}")
+            embedding_manager.delete_documents(manifest.ids_for(filename))
+            manifest.remove(filename)
+        
+        for filename in sorted(current_files):
             file_path = os.path.join(reference_dir, filename)
+            content_hash = manifest.file_hash(file_path)
+            if manifest.is_current(filename, content_hash):
+                continue
+            
             print(f"Processing reference document: {filename}")
             
+            # Drop the chunks of the previous version of this file
+            embedding_manager.delete_documents(manifest.ids_for(filename))
+            
             # Process document
             chunks = doc_processor.process_document(file_path)
             
             # Add to vector database
-            embedding_manager.add_documents(chunks)
+            ids = embedding_manager.add_documents(chunks)
+            manifest.record(filename, content_hash, ids)
+        
+        manifest.save()
     print("Finished processing reference documents.")
 
-def analyze_document(file_path: str):
-    """Analyze a document and provide risk assessment."""
+def warm_up(reference_dir: Optional[str] = None):
+    """
+    Load the models and bring the reference index up to date, so the first request does not pay for them.
+    
+    Failures are recorded for readiness() rather than raised.
+    
+    Args:
+        reference_dir (Optional[str]): Directory of reference documents to ingest, if any
+    """
+    global _warm_up_error
+    try:
+        embedding_manager = get_embedding_manager()
+        get_risk_analyzer()
+        if reference_dir and os.path.exists(reference_dir):
+            process_reference_docs(reference_dir)
+        # Run the encoder once so its lazy initialization happens now
+        embedding_manager.backend.encode(["warm up"])
+        _warm_up_error = None
+        _ready.set()
+        print(f"Warm-up finished: {embedding_manager.count()} reference chunks indexed")
+    except Exception as e:
+        _warm_up_error = str(e)
+        print(f"Warm-up failed: {e}")
+
+def readiness() -> Dict:
+    """Report whether warm-up has finished and which components are loaded."""
+    status = {
+        'ready': _ready.is_set(),
+        'embedding_model': _embedding_manager is not None,
+        'risk_analyzer': _risk_analyzer is not None,
+    }
+    if _ready.is_set():
+        status['reference_chunks'] = _embedding_manager.count()
+    if _warm_up_error:
+        status['error'] = _warm_up_error
+    return status
+
+def extract_chunks(source: Union[str, bytes, BinaryIO], filename: Optional[str] = None) -> List[Dict]:
+    """Extract and chunk a document from a path, bytes or a binary file object."""
     doc_processor = DocumentProcessor()
+    print(f"Processing document: {filename or source}")
+    with metrics.stage("extract"):
+        return doc_processor.process_document(source, filename)
+
+def retrieve_context_groups(chunk_groups: List[List[Dict]]) -> List[Tuple[List[Dict], List[Dict], Dict]]:
+    """
+    Retrieve reference context and pre-filter the chunks of several documents.
+    
+    All chunks are embedded and queried together in one batch.
     
+    Returns:
+        List[Tuple[List[Dict], List[Dict], Dict]]: For each document, its similar reference
+        documents, the candidate chunks to send to the LLM and the pre-filter counts
+    """
+    print(f"Finding similar documents for {len(chunk_groups)} document(s)...")
+    embedding_manager = get_embedding_manager()
+    grouped_hits = embedding_manager.query_groups(
+        [[chunk['text'] for chunk in chunks] for chunks in chunk_groups],
+        n_results=REFERENCE_CONTEXT_SIZE
+    )
+    
+    results = []
+    for chunks, hits in zip(chunk_groups, grouped_hits):
+        with metrics.stage("prefilter"):
+            similar_docs = embedding_manager.merge_top_k(hits, REFERENCE_CONTEXT_SIZE)
+            candidates, stats = chunk_filter.select(chunks, hits)
+        print(f"Pre-filter kept {stats['chunks_kept']}/{stats['chunks_total']} chunks, "
+              f"removed {stats['chars_removed']} of {stats['chars_total']} characters")
+        results.append((similar_docs, candidates, stats))
+    
+    return results
+
+def retrieve_context(chunks: List[Dict]) -> Tuple[List[Dict], List[Dict], Dict]:
+    """Retrieve reference context and pre-filter the chunks of one document."""
+    return retrieve_context_groups([chunks])[0]
+
+def analyze_document(file_path: str):
+    """Analyze a document and provide risk assessment."""
     # Process document
-    print(f"Processing document: {file_path}")
-    chunks = doc_processor.process_document(file_path)
+    chunks = extract_chunks(file_path)
     
-    # Find similar documents using the globally initialized embedding_manager
-    print("Finding similar documents...")
-    similar_docs = []
-    for chunk in chunks:
-        similar_docs.extend(embedding_manager.search_similar(chunk['text']))
+    # Find similar documents and the candidate risky chunks using the shared embedding_manager
+    similar_docs, candidates, prefilter_stats = retrieve_context(chunks)
     
-    # Analyze document using the globally initialized risk_analyzer
+    # Analyze document using the shared risk_analyzer
     print("Analyzing document...")
-    analysis = risk_analyzer.analyze_document(chunks, similar_docs)
+    analysis = get_risk_analyzer().analyze_document(candidates, similar_docs)
+    analysis['prefilter'] = prefilter_stats
     
     return analysis
 
+def find_batch_files(pattern: str) -> List[str]:
+    """Return the supported documents in a directory, or matching a glob pattern, in sorted order."""
+    if os.path.isdir(pattern):
+        paths = [os.path.join(pattern, filename) for filename in os.listdir(pattern)]
+    else:
+        paths = glob.glob(pattern, recursive=True)
+    return sorted(path for path in paths if os.path.isfile(path) and path.lower().endswith(SUPPORTED_EXTENSIONS))
+
+def load_completed(output_path: str) -> Dict[str, str]:
+    """Return {file path: content hash} of the documents already analyzed successfully in a results file."""
+    completed = {}
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by an interrupted run
+                continue
+            if record.get('status') == 'ok':
+                completed[record['file']] = record['sha256']
+    return completed
+
+def _extract_batch_file(path: str) -> List[Dict]:
+    """Extract and chunk one document in a batch worker process."""
+    # The batch pool already spreads documents over processes; extract each one sequentially
+    return DocumentProcessor(pdf_workers=1).process_document(path)
+
+async def _analyze_batch_async(files: List[Tuple[str, str]], output, workers: int,
+                               llm_concurrency: int, group_size: int) -> Dict:
+    """Run the batch pipeline over (path, content hash) pairs, appending one JSON record per document to output."""
+    loop = asyncio.get_running_loop()
+    llm_slots = asyncio.Semaphore(llm_concurrency)
+    counts = {'ok': 0, 'error': 0}
+    
+    def write(record: Dict):
+        # Every record is flushed as soon as it is known, so an interrupted run loses nothing
+        output.write(json.dumps(record) + "\n")
+        output.flush()
+        counts[record['status']] += 1
+        print(f"[{sum(counts.values())}/{len(files)}] {record['file']}: "
+              f"{record.get('risk_score', record.get('error'))}")
+    
+    async def analyze(path: str, content_hash: str, similar_docs: List[Dict], candidates: List[Dict], prefilter_stats: Dict):
+        record = {'file': path, 'sha256': content_hash}
+        try:
+            async with llm_slots:
+                analysis = await get_risk_analyzer().analyze_document_async(candidates, similar_docs)
+            record.update(status='ok', **parse_analysis(analysis['analysis']))
+            record['mode'] = analysis['mode']
+            record['prefilter'] = prefilter_stats
+        except Exception as e:
+            record.update(status='error', error=str(e))
+        write(record)
+    
+    # Spawn rather than fork: this process holds the embedding model's threads
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    pending = set()
+    try:
+        for start in range(0, len(files), group_size):
+            group = files[start:start + group_size]
+            
+            # Extract the group's documents across the process pool
+            extracted = await asyncio.gather(*[
+                loop.run_in_executor(pool, _extract_batch_file, path) for path, _ in group
+            ], return_exceptions=True)
+            
+            ready = []
+            for (path, content_hash), chunks in zip(group, extracted):
+                if isinstance(chunks, BaseException):
+                    write({'file': path, 'sha256': content_hash, 'status': 'error', 'error': str(chunks)})
+                else:
+                    ready.append((path, content_hash, chunks))
+            if not ready:
+                continue
+            
+            # Embed and query all chunks of the group in one batch
+            try:
+                contexts = await asyncio.to_thread(retrieve_context_groups, [chunks for _, _, chunks in ready])
+            except Exception as e:
+                for path, content_hash, _ in ready:
+                    write({'file': path, 'sha256': content_hash, 'status': 'error', 'error': str(e)})
+                continue
+            
+            # LLM calls run in the background while the next group is extracted
+            for (path, content_hash, _), context in zip(ready, contexts):
+                pending.add(asyncio.ensure_future(analyze(path, content_hash, *context)))
+            
+            # Bound the documents waiting on the LLM so memory stays flat on large batches
+            while len(pending) > max(llm_concurrency, group_size) * 2:
+                _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        
+        if pending:
+            await asyncio.wait(pending)
+    finally:
+        pool.shutdown()
+    
+    return counts
+
+def analyze_batch(pattern: str, output_path: str, workers: Optional[int] = None,
+                  llm_concurrency: int = 8, group_size: int = 32) -> Dict:
+    """
+    Analyze every document in a directory or matching a glob pattern.
+    
+    Documents are extracted and chunked across a process pool, the chunks of each
+    group of documents are embedded together, and LLM calls run with bounded
+    concurrency. One JSON record per document is appended to the output file;
+    documents already analyzed successfully with the same content are skipped,
+    so an interrupted run can be restarted with the same arguments.
+    
+    Args:
+        pattern (str): Directory or glob pattern of the documents
+        output_path (str): JSON Lines file the results are appended to
+        workers (Optional[int]): Extraction processes; defaults to the CPU count
+        llm_concurrency (int): Maximum LLM calls in flight
+        group_size (int): Documents embedded together in one batch
+        
+    Returns:
+        Dict: Number of documents 'ok', failed ('error') and 'skipped'
+    """
+    paths = find_batch_files(pattern)
+    completed = load_completed(output_path)
+    
+    files = []
+    for path in paths:
+        content_hash = ReferenceManifest.file_hash(path)
+        if completed.get(path) != content_hash:
+            files.append((path, content_hash))
+    skipped = len(paths) - len(files)
+    print(f"Batch: {len(paths)} document(s), {skipped} already analyzed, {len(files)} to analyze")
+    
+    counts = {'ok': 0, 'error': 0}
+    if files:
+        # Load the models once, before any work is scheduled
+        get_embedding_manager()
+        get_risk_analyzer()
+        
+        with open(output_path, 'a', encoding='utf-8') as output:
+            # Start on a fresh line if an interrupted run left a partial record
+            if output.tell() > 0:
+                with open(output_path, 'rb') as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        output.write("\n")
+            counts = asyncio.run(_analyze_batch_async(
+                files, output, workers or os.cpu_count() or 1, llm_concurrency, group_size
+            ))
+    
+    counts['skipped'] = skipped
+    return counts
+
 def main():
     parser = argparse.ArgumentParser(description="Document Risk Analysis System")
     parser.add_argument("--reference_dir", default="reference_docs",
                       help="Directory containing reference documents")
     parser.add_argument("--document", help="Path to document to analyze")
+    parser.add_argument("--batch", help="Directory or glob pattern of documents to analyze in batch")
+    parser.add_argument("--output", default="batch_results.jsonl",
+                      help="JSON Lines file batch results are appended to")
+    parser.add_argument("--workers", type=int, help="Processes used to extract batch documents")
+    parser.add_argument("--llm-concurrency", type=int, default=8,
+                      help="Maximum LLM calls in flight during a batch")
+    parser.add_argument("--group-size", type=int, default=32,
+                      help="Batch documents embedded together")
     args = parser.parse_args()
     
     # Create necessary directories
@@ -79,6 +419,10 @@ def main():
         print(f"Risk Score: {analysis['risk_score']}/100")
         print("\nDetailed Analysis:")
         print(analysis['analysis'])
+    elif args.batch:
+        counts = analyze_batch(args.batch, args.output, args.workers, args.llm_concurrency, args.group_size)
+        print(f"\nBatch finished: {counts['ok']} analyzed, {counts['error']} failed, "
+              f"{counts['skipped']} skipped. Results in {args.output}")
     else:
         print("No document provided for CLI analysis.")
 
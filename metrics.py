@@ -0,0 +1,208 @@
+import time
+import asyncio
+import threading
+from bisect import bisect_left
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Seconds; spans a cached lookup up to a long map-reduce LLM call
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Estimated tokens per LLM call
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+# Every metric, in registration order, rendered by render_metrics()
+_registry: List['Metric'] = []
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        name + '="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+class Metric:
+    """Base of the in-process Prometheus metrics; values are per process."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+        return tuple((name, str(labels[name])) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(key)} {value}" for key, value in self._values.items()]
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # Per label set: count in each bucket (non-cumulative, the last is +Inf), sum
+        self._values: Dict[Tuple, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[bisect_left(self.buckets, value)] += 1
+            total[0] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float('inf') else repr(float(bound))
+                    lines.append(f"{self.name}_bucket{_format_labels(key + (('le', le),))} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total[0]}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+class CallbackMetric(Metric):
+    """Values read from a callback at scrape time, e.g. counters the caches already keep."""
+
+    def __init__(self, name: str, documentation: str, kind: str, labelnames: Sequence[str],
+                 callback: Callable[[], List[Tuple[Dict[str, str], float]]]):
+        """
+        Args:
+            name (str): Metric name
+            documentation (str): Help text
+            kind (str): 'counter' or 'gauge'
+            labelnames (Sequence[str]): Label names
+            callback (Callable): Returns (labels, value) for each sample
+        """
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self.callback = callback
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self._key(labels))} {value}" for labels, value in self.callback()]
+
+def render_metrics() -> str:
+    """Render every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+STAGE_SECONDS = Histogram(
+    "risk_stage_duration_seconds", "Time spent in each analysis stage", ["stage"]
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "risk_queue_wait_seconds", "Time spent waiting for a pipeline slot or a batch worker", ["stage"]
+)
+REQUEST_SECONDS = Histogram(
+    "risk_request_duration_seconds", "Time to answer an API request", ["endpoint", "status"]
+)
+LLM_CALLS = Counter(
+    "risk_llm_calls_total", "LLM calls by backend and outcome", ["backend", "outcome"]
+)
+LLM_CHARACTERS = Counter(
+    "risk_llm_characters_total", "Characters sent to and received from the LLM", ["direction"]
+)
+LLM_TOKENS = Counter(
+    "risk_llm_tokens_total", "Estimated tokens sent to and received from the LLM", ["direction"]
+)
+LLM_PROMPT_TOKENS = Histogram(
+    "risk_llm_prompt_tokens", "Estimated tokens per LLM prompt", buckets=TOKEN_BUCKETS
+)
+PROMPT_TOKENS_SAVED = Counter(
+    "risk_prompt_tokens_saved_total", "Estimated prompt tokens saved in prompt assembly, by how", ["reason"]
+)
+LLM_RETRIES = Counter(
+    "risk_llm_retries_total", "LLM attempts retried, by why the previous attempt failed", ["reason"]
+)
+LLM_HEDGES = Counter(
+    "risk_llm_hedged_calls_total", "LLM attempts duplicated for being slow, by whether the duplicate answered first",
+    ["outcome"]
+)
+COALESCED_REQUESTS = Counter(
+    "risk_coalesced_requests_total",
+    "Analyses that ran (owner) or waited on an identical one in this process (waiter) or another (remote_waiter)",
+    ["role"]
+)
+
+# Stage durations of the request being handled, if it asked for them
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+@contextmanager
+def track_request() -> Iterator[Dict[str, float]]:
+    """Collect the stage durations (seconds) recorded while handling one request."""
+    timings: Dict[str, float] = {}
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+def current_timings() -> Optional[Dict[str, float]]:
+    """Return the stage durations collected so far for the current request, if tracked."""
+    return _request_timings.get()
+
+def record_stage(name: str, seconds: float):
+    """Record a stage duration in its histogram and in the current request's timings."""
+    STAGE_SECONDS.observe(seconds, stage=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+def record_queue_wait(name: str, seconds: float):
+    """Record time spent waiting for a slot before a stage."""
+    QUEUE_WAIT_SECONDS.observe(seconds, stage=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[f"{name}_wait"] = timings.get(f"{name}_wait", 0.0) + seconds
+
+@asynccontextmanager
+async def acquire(slots: asyncio.Semaphore, name: str) -> AsyncIterator[None]:
+    """Hold a pipeline slot, recording how long it took to get it."""
+    start = time.perf_counter()
+    async with slots:
+        record_queue_wait(name, time.perf_counter() - start)
+        yield
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the enclosed block as an analysis stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+def server_timing(timings: Dict[str, float]) -> str:
+    """Format stage durations as a Server-Timing header value."""
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
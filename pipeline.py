@@ -0,0 +1,190 @@
+import os
+import time
+import asyncio
+import functools
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, BinaryIO, Callable, Dict, Iterator, Optional, Tuple, Union
+
+import main
+import metrics
+
+class PipelineSaturated(Exception):
+    """Raised when the pipeline already holds as many analyses as it will accept."""
+
+class AnalysisPipeline:
+    def __init__(self, extract_concurrency: int = 2, embed_concurrency: int = 1,
+                 llm_concurrency: int = 8, max_pending: int = 16,
+                 min_llm_latency: float = 2.0, llm_fallback: bool = True):
+        """
+        Runs document analyses off the event loop with per-stage concurrency limits.
+
+        Extraction and embedding are CPU bound and run in a thread pool; the LLM
+        call uses the async client. At most max_pending analyses are admitted at
+        once, counting those still waiting for a stage.
+
+        Args:
+            extract_concurrency (int): Documents extracted and chunked at the same time
+            embed_concurrency (int): Embedding and retrieval batches run at the same time
+            llm_concurrency (int): LLM calls in flight at the same time
+            max_pending (int): Analyses admitted before new ones are rejected
+            min_llm_latency (float): Latency budgets below this many seconds skip the LLM and use the heuristic
+            llm_fallback (bool): Answer with the heuristic when the LLM fails or exceeds the latency budget
+        """
+        self.executor = ThreadPoolExecutor(
+            max_workers=extract_concurrency + embed_concurrency,
+            thread_name_prefix="analysis"
+        )
+        self.extract_slots = asyncio.Semaphore(extract_concurrency)
+        self.embed_slots = asyncio.Semaphore(embed_concurrency)
+        self.llm_slots = asyncio.Semaphore(llm_concurrency)
+        # Names the waits for each kind of slot are recorded under
+        self.slot_names = {self.extract_slots: 'extract', self.embed_slots: 'embed', self.llm_slots: 'llm'}
+        self.max_pending = max_pending
+        self.pending = 0
+        self.min_llm_latency = min_llm_latency
+        self.llm_fallback = llm_fallback
+
+    @classmethod
+    def from_env(cls) -> 'AnalysisPipeline':
+        """Create a pipeline configured from environment variables."""
+        return cls(
+            extract_concurrency=int(os.getenv("EXTRACT_CONCURRENCY", "2")),
+            embed_concurrency=int(os.getenv("EMBED_CONCURRENCY", "1")),
+            llm_concurrency=int(os.getenv("LLM_CONCURRENCY", "8")),
+            max_pending=int(os.getenv("MAX_PENDING_ANALYSES", "16")),
+            min_llm_latency=int(os.getenv("MIN_LLM_LATENCY_MS", "2000")) / 1000,
+            llm_fallback=os.getenv("LLM_FALLBACK_HEURISTIC", "true").lower() in ("1", "true", "yes"),
+        )
+
+    @contextmanager
+    def admit(self) -> Iterator[None]:
+        """Reserve a pending slot for one analysis, or raise PipelineSaturated."""
+        if self.pending >= self.max_pending:
+            raise PipelineSaturated(f"{self.pending} analyses already pending")
+        self.pending += 1
+        try:
+            yield
+        finally:
+            self.pending -= 1
+
+    async def run_blocking(self, slots: asyncio.Semaphore, func: Callable, *args, **kwargs):
+        """Run a blocking stage in the executor once a slot for it is free."""
+        async with metrics.acquire(slots, self.slot_names.get(slots, 'other')):
+            loop = asyncio.get_running_loop()
+            # Carry the request's context into the thread so its stage timings are collected
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(self.executor, context.run, functools.partial(func, *args, **kwargs))
+
+    async def analyze_stream(self, source: Union[str, bytes, BinaryIO],
+                             filename: Optional[str] = None) -> AsyncIterator[Tuple[str, Dict]]:
+        """
+        Analyze a document, yielding events as each stage finishes and as the model writes its answer.
+
+        Yields ('stage', {'stage': ...}) when extraction, retrieval and the LLM call
+        start, then the events of RiskAnalyzer.stream_analysis. The first event is
+        yielded as soon as the analysis is admitted, so a caller can wait for it
+        before committing to a response and still refuse with PipelineSaturated.
+        When the LLM fails the heuristic answers in the final 'analysis' event,
+        unless fallback is disabled.
+
+        Args:
+            source (Union[str, bytes, BinaryIO]): Path to the document, or its content in memory
+            filename (Optional[str]): Name of the document; required unless source is a path
+
+        Yields:
+            Tuple[str, Dict]: Event name and its data
+        """
+        with self.admit():
+            yield 'stage', {'stage': 'extract'}
+            chunks = await self.run_blocking(self.extract_slots, main.extract_chunks, source, filename)
+
+            yield 'stage', {'stage': 'retrieve'}
+            similar_docs, candidates, prefilter_stats = await self.run_blocking(
+                self.embed_slots, main.retrieve_context, chunks
+            )
+
+            yield 'stage', {'stage': 'llm'}
+            try:
+                async with metrics.acquire(self.llm_slots, 'llm'):
+                    async for event, data in main.get_risk_analyzer().stream_analysis(candidates, similar_docs):
+                        if event == 'analysis':
+                            data['prefilter'] = prefilter_stats
+                        yield event, data
+            except Exception as e:
+                if not self.llm_fallback:
+                    raise
+                print(f"LLM analysis failed, falling back to heuristic: {e}")
+                analysis = main.get_risk_analyzer().heuristic_analysis(chunks)
+                analysis['fallback_reason'] = 'llm_unavailable'
+                analysis['prefilter'] = prefilter_stats
+                yield 'analysis', analysis
+
+    async def prescore(self, source: Union[str, bytes, BinaryIO], filename: Optional[str] = None) -> Dict:
+        """
+        Score a document with the keyword rules only, skipping retrieval and the LLM.
+
+        Args:
+            source (Union[str, bytes, BinaryIO]): Path to the document, or its content in memory
+            filename (Optional[str]): Name of the document; required unless source is a path
+
+        Returns:
+            Dict: Heuristic risk analysis results
+        """
+        with self.admit():
+            chunks = await self.run_blocking(self.extract_slots, main.extract_chunks, source, filename)
+            return main.get_risk_analyzer().heuristic_analysis(chunks)
+
+    async def analyze(self, source: Union[str, bytes, BinaryIO], filename: Optional[str] = None,
+                      latency_budget: Optional[float] = None) -> Dict:
+        """
+        Analyze a document without blocking the event loop.
+
+        With a latency budget, the LLM is skipped when the budget is too small for it
+        and the keyword heuristic answers instead; the same happens when the LLM call
+        fails or overruns the budget, unless fallback is disabled.
+
+        Args:
+            source (Union[str, bytes, BinaryIO]): Path to the document, or its content in memory
+            filename (Optional[str]): Name of the document; required unless source is a path
+            latency_budget (Optional[float]): Seconds the caller is willing to wait
+
+        Returns:
+            Dict: Risk analysis results; 'mode' is 'llm' or 'heuristic'
+        """
+        with self.admit():
+            started = time.monotonic()
+            chunks = await self.run_blocking(self.extract_slots, main.extract_chunks, source, filename)
+
+            if latency_budget is not None and latency_budget < self.min_llm_latency:
+                analysis = main.get_risk_analyzer().heuristic_analysis(chunks)
+                analysis['fallback_reason'] = 'latency_budget'
+                return analysis
+
+            similar_docs, candidates, prefilter_stats = await self.run_blocking(
+                self.embed_slots, main.retrieve_context, chunks
+            )
+
+            async def call_llm() -> Dict:
+                async with metrics.acquire(self.llm_slots, 'llm'):
+                    return await main.get_risk_analyzer().analyze_document_async(candidates, similar_docs)
+
+            try:
+                if latency_budget is None:
+                    analysis = await call_llm()
+                else:
+                    remaining = latency_budget - (time.monotonic() - started)
+                    analysis = await asyncio.wait_for(call_llm(), timeout=max(remaining, 0))
+            except asyncio.TimeoutError:
+                analysis = main.get_risk_analyzer().heuristic_analysis(chunks)
+                analysis['fallback_reason'] = 'latency_budget'
+            except Exception as e:
+                if not self.llm_fallback:
+                    raise
+                print(f"LLM analysis failed, falling back to heuristic: {e}")
+                analysis = main.get_risk_analyzer().heuristic_analysis(chunks)
+                analysis['fallback_reason'] = 'llm_unavailable'
+
+            analysis['prefilter'] = prefilter_stats
+            return analysis
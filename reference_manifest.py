@@ -0,0 +1,91 @@
+import os
+import json
+import fcntl
+import hashlib
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+class ReferenceManifest:
+    def __init__(self, path: str, chunker_version: str, embedding_model: str):
+        """
+        Record of which reference files are embedded in the vector database.
+
+        Args:
+            path (str): Path to the manifest JSON file
+            chunker_version (str): Version of the chunking logic used to build the entries
+            embedding_model (str): Name of the embedding model used to build the entries
+        """
+        self.path = path
+        self.chunker_version = chunker_version
+        self.embedding_model = embedding_model
+        self.files: Dict[str, Dict] = {}
+        self.compatible = False
+
+    @staticmethod
+    def file_hash(file_path: str) -> str:
+        """Return the SHA-256 of a file's contents."""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @contextmanager
+    def locked(self) -> Iterator['ReferenceManifest']:
+        """Hold an exclusive lock on the manifest while loading, updating and saving it."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path + ".lock", 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self.load()
+                yield self
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def load(self):
+        """Load the manifest, discarding it if it was built with another chunker or model."""
+        self.files = {}
+        self.compatible = False
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        if (data.get('chunker_version') == self.chunker_version
+                and data.get('embedding_model') == self.embedding_model):
+            self.files = data.get('files', {})
+            self.compatible = True
+
+    def save(self):
+        """Write the manifest atomically."""
+        data = {
+            'chunker_version': self.chunker_version,
+            'embedding_model': self.embedding_model,
+            'files': self.files,
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self.compatible = True
+
+    def is_current(self, filename: str, content_hash: str) -> bool:
+        """Check whether a file is already embedded with the given content."""
+        entry = self.files.get(filename)
+        return entry is not None and entry['hash'] == content_hash
+
+    def ids_for(self, filename: str) -> List[str]:
+        """Return the chunk ids stored for a file."""
+        entry = self.files.get(filename)
+        return list(entry['ids']) if entry else []
+
+    def record(self, filename: str, content_hash: str, ids: List[str]):
+        """Record that a file has been embedded under the given chunk ids."""
+        self.files[filename] = {'hash': content_hash, 'ids': ids}
+
+    def remove(self, filename: str):
+        """Forget a file."""
+        self.files.pop(filename, None)
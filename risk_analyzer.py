@@ -1,25 +1,125 @@
 import os
-from typing import List, Dict
-import google.generativeai as genai
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 from dotenv import load_dotenv
 import re
-from functools import lru_cache
 import hashlib
+from analysis_cache import AnalysisCache
+from llm_backends import LLMBackend, create_backend
+from llm_client import LLMClient
+from risk_rules import RiskRules
+from token_budget import PromptBudget, estimate_tokens, join_chunks, normalize_whitespace
+import metrics
 
 load_dotenv()
 
+# Bump whenever the system prompt changes so cached analyses from the old prompt are not reused
+SYSTEM_PROMPT_VERSION = 1
+
+# Format of a risky clause line: [Clause Text] [Severity] [Category] - [Explanation]
+CLAUSE_PATTERN = re.compile(r'(.+?)\s*\[([^\]]+)\]\s*\[([^\]]+)\]\s*-\s*(.+)')
+SEVERITY_RANK = {'high risk': 3, 'medium risk': 2, 'low risk': 1}
+
+SCORE_PATTERN = re.compile(r"Risk Score:\s*(\d+)")
+
+def parse_clause_line(line: str) -> Optional[Tuple[str, str, str]]:
+    """
+    Parse one line of the model's answer as a risky clause.
+
+    Returns:
+        Optional[Tuple[str, str, str]]: "clause - explanation", severity and category,
+        or None when the line is not a fully formatted numbered clause
+    """
+    # Only process lines that look like numbered list items from the LLM
+    if not re.match(r'^\d+\.\s*', line.strip()):
+        return None
+
+    # Remove the LLM's list number and dot prefix
+    line_cleaned = re.sub(r'^\d+\.\s*', '', line.strip())
+
+    # Remove potential original document numbering at the beginning of the line
+    line_cleaned = re.sub(r'^(\d+(\.\d+)*\s+)', '', line_cleaned)
+
+    # Format: [Clause Text] [Severity] [Category] - [Explanation]
+    # This regex is strict and requires all parts to be present; other numbered lines are excluded.
+    match = CLAUSE_PATTERN.match(line_cleaned)
+    if not match:
+        return None
+
+    # Extract groups: (Clause Text), (Severity), (Category), (Explanation)
+    clause_text = match.group(1).strip()
+    severity = match.group(2).strip()
+    category = match.group(3).strip()
+    explanation = match.group(4).strip()
+
+    # Combine clause text and explanation for the risky_clauses array
+    return f"{clause_text} - {explanation}", severity, category
+
+def parse_analysis(analysis_text: str) -> dict:
+    """Parse the analysis text to extract risk score, and fully formatted risky clauses from LLM output."""
+    result = {
+        "risk_score": 0,
+        "risky_clauses": [],
+        "risk_categories": [],
+        "clause_severity": []
+    }
+
+    # Extract risk score
+    score_match = SCORE_PATTERN.search(analysis_text)
+    if score_match:
+        result["risk_score"] = int(score_match.group(1))
+
+    # Extract fully formatted risky clauses, categories, and severity
+    clauses = []
+    categories = []
+    severity_tags = []
+
+    for line in analysis_text.split('\n'):
+        parsed = parse_clause_line(line)
+        if parsed:
+            clause, severity, category = parsed
+            clauses.append(clause)
+            severity_tags.append(severity)
+            categories.append(category)
+
+    result["risky_clauses"] = clauses
+    result["risk_categories"] = categories
+    result["clause_severity"] = severity_tags
+
+    return result
+
 class RiskAnalyzer:
-    def __init__(self):
-        # Configure Gemini 2.0 Flash with optimized settings
-        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-        self.model = genai.GenerativeModel(
-            'gemini-2.0-flash',
-            generation_config={
-                'temperature': 0.1,  # Lower temperature for more focused responses
-                'top_p': 0.8,
-                'top_k': 40,
-                'max_output_tokens': 500,  # Limit output length
-            }
+    def __init__(self, backend: Optional[LLMBackend] = None):
+        # Gemini 2.0 Flash with optimized settings unless another backend is given or selected by LLM_BACKEND
+        self.backend = backend or create_backend()
+        
+        # Rate limits, deadlines, retries and hedging around every model call
+        self.llm = LLMClient.from_env(self.backend)
+        
+        # Keyword rules used for score calibration and the no-LLM heuristic
+        self.rules = RiskRules.load()
+        
+        # Documents longer than the threshold are analyzed in shards concurrently and merged.
+        # Both are estimated tokens, measured like the pre-filter's budget, which the threshold must stay under.
+        self.map_reduce_threshold = int(os.getenv("MAP_REDUCE_THRESHOLD_TOKENS", "6000"))
+        self.shard_size = int(os.getenv("MAP_REDUCE_SHARD_TOKENS", "3000"))
+        self.map_concurrency = int(os.getenv("MAP_REDUCE_CONCURRENCY", "4"))
+        self._map_executor = ThreadPoolExecutor(max_workers=self.map_concurrency, thread_name_prefix="llm-shard")
+        
+        # Token budgets for the document text and reference context of each prompt
+        self.prompt_budget = PromptBudget(
+            max_tokens=int(os.getenv("PROMPT_TOKEN_BUDGET", "20000")),
+            reference_tokens=int(os.getenv("REFERENCE_TOKEN_BUDGET", "2000"))
+        )
+        
+        # Persistent analysis cache shared across workers and restarts
+        ttl = int(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+        self.cache = AnalysisCache(
+            db_path=os.getenv("ANALYSIS_CACHE_PATH", "cache/analysis_cache.sqlite3"),
+            max_entries=int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "1000")),
+            ttl_seconds=ttl if ttl > 0 else None
         )
         
         self.system_prompt = """You are an expert legal document risk analyst focused on identifying significant and unusual risks in a contract from the perspective of the Client. Your goal is to highlight terms that are severely unfavorable, highly one-sided, or represent a major deviation from common, balanced legal practice.
@@ -84,30 +184,28 @@ Top 5 Risky Clauses (Listed in Descending Order of Risk Severity):
 4. [Full Clause text] [Severity] [Risk Category] - [One line explanation of significant risk]
 5. [Full Clause text] [Severity] [Risk Category] - [One line explanation of significant risk]"""
 
-    @lru_cache(maxsize=100)
-    def _get_cached_analysis(self, document_hash: str, context_hash: str) -> str:
-        """Get cached analysis for a document and context combination."""
-        return None
+    def _cache_key(self, document_hash: str, context_hash: str) -> str:
+        """Build the analysis cache key for a document and context combination."""
+        return self.cache.make_key(
+            document=document_hash,
+            context=context_hash,
+            model=self.backend.name,
+            generation_config=self.backend.config,
+            prompt_version=SYSTEM_PROMPT_VERSION,
+            rules_version=self.rules.version
+        )
 
     def _hash_content(self, content: str) -> str:
         """Generate a hash for content to use as cache key."""
-        return hashlib.md5(content.encode()).hexdigest()
+        return hashlib.sha256(content.encode()).hexdigest()
 
     def _calibrate_risk_score(self, score: int, clauses: List[str]) -> int:
         """Calibrate the risk score based on the number and severity of risky clauses."""
         calibrated_score = score
         
         # Check if any significant severity keywords are present in the identified clauses
-        has_severe_keywords = False
-        severe_keywords = ['immediately', 'without cause', 'no rights', 'unlimited', 'waives', 'exclusive', 'notwithstanding', 'indemnify', 'liable for', 'hold harmless'] # Add more high-impact keywords here
-        
-        for clause in clauses:
-            for keyword in severe_keywords:
-                if keyword.lower() in clause.lower():
-                    has_severe_keywords = True
-                    break
-            if has_severe_keywords:
-                break
+        features = self.rules.calibration_features(clauses)
+        has_severe_keywords = features['has_severe']
 
         # If model identified clauses, but none have severe keywords, significantly reduce score (slightly less aggressive reduction)
         if clauses and not has_severe_keywords:
@@ -120,65 +218,58 @@ Top 5 Risky Clauses (Listed in Descending Order of Risk Severity):
         elif num_clauses > 3 and has_severe_keywords:
             calibrated_score = min(100, calibrated_score + 10)
             
-        # Existing adjustment based on individual severity keywords (kept for nuance)
-        individual_severity_keywords = {
-            'immediately': 5,
-            'without cause': 8,
-            'no rights': 5,
-            'unlimited': 8,
-            'any time': 5,
-            'without notice': 5,
-            'waives': 8,
-            'exclusive': 3,
-            'strict': 2
-        }
-        
-        for clause in clauses:
-            for keyword, adjustment in individual_severity_keywords.items():
-                if keyword.lower() in clause.lower():
-                    calibrated_score = min(100, calibrated_score + adjustment)
+        # Adjustment based on individual severity keywords (kept for nuance)
+        calibrated_score = min(100, calibrated_score + features['adjustment'])
         
         # Ensure score is within 0-100
         calibrated_score = max(0, min(100, calibrated_score))
 
         return calibrated_score
 
-    def analyze_document(self, document_chunks: List[Dict], similar_docs: List[Dict]) -> Dict:
+    def heuristic_analysis(self, document_chunks: List[Dict]) -> Dict:
         """
-        Analyze document chunks and provide risk assessment.
+        Fast rule-based risk assessment that does not call the LLM.
         
         Args:
             document_chunks (List[Dict]): List of document chunks to analyze
-            similar_docs (List[Dict]): List of similar reference documents
             
         Returns:
-            Dict: Risk analysis results
+            Dict: Risk analysis results in the same shape as analyze_document
         """
-        # Combine document chunks efficiently
-        document_text = "\n\n".join(chunk['text'] for chunk in document_chunks)
-        
-        # Limit context to top 3 most relevant similar documents
-        context = "\n\nReference Documents:\n" + "\n---\n".join([
-            f"Document: {doc['metadata']['file_name']}\n{doc['text']}"
-            for doc in similar_docs[:3]  # Only use top 3 similar documents
-        ])
+        with metrics.stage("heuristic"):
+            result = self.rules.heuristic_analysis(chunk['text'] for chunk in document_chunks)
+        return {
+            'analysis': result['analysis'],
+            'risk_score': result['risk_score'],
+            'document_chunks': document_chunks,
+            'similar_docs': [],
+            'mode': 'heuristic'
+        }
+
+    def _shard_chunks(self, document_chunks: List[Dict]) -> List[List[Dict]]:
+        """Group consecutive chunks into shards of at most shard_size estimated tokens, or one shard for short documents."""
+        tokens = [estimate_tokens(chunk['text']) for chunk in document_chunks]
+        if sum(tokens) <= self.map_reduce_threshold:
+            return [document_chunks]
         
-        # Generate hashes for caching
-        doc_hash = self._hash_content(document_text)
-        context_hash = self._hash_content(context)
+        shards = []
+        current = []
+        current_size = 0
+        for chunk, chunk_tokens in zip(document_chunks, tokens):
+            if current and current_size + chunk_tokens > self.shard_size:
+                shards.append(current)
+                current = []
+                current_size = 0
+            current.append(chunk)
+            current_size += chunk_tokens
+        if current:
+            shards.append(current)
         
-        # Check cache first
-        cached_analysis = self._get_cached_analysis(doc_hash, context_hash)
-        if cached_analysis:
-            return {
-                'analysis': cached_analysis,
-                'risk_score': self._extract_risk_score(cached_analysis),
-                'document_chunks': document_chunks,
-                'similar_docs': similar_docs
-            }
-        
-        # Create optimized analysis prompt
-        prompt = f"""System: {self.system_prompt}
+        return shards
+
+    def _build_prompt(self, document_text: str, context: str) -> str:
+        """Build the analysis prompt for a document text and its reference context."""
+        return f"""System: {self.system_prompt}
 
 Document to analyze:
 {document_text}
@@ -187,10 +278,165 @@ Document to analyze:
 
 Please analyze the document and provide the risk score and top 5 risky clauses in the exact format specified above."""
 
-        # Get analysis from Gemini 2.0 Flash with optimized settings
-        response = self.model.generate_content(prompt)
-        analysis = response.text
+    def _prepare_analysis(self, document_chunks: List[Dict], similar_docs: List[Dict]) -> Tuple[List[str], str]:
+        """
+        Build the analysis prompts and the cache key.
+        
+        Short documents get a single prompt; long documents get one prompt per shard.
+        
+        Args:
+            document_chunks (List[Dict]): List of document chunks to analyze
+            similar_docs (List[Dict]): List of similar reference documents
+            
+        Returns:
+            Tuple[List[str], str]: The prompts and the cache key
+        """
+        # Characters removed from the prompts, by why, for the savings log
+        saved = {'overlap': 0, 'whitespace': 0, 'budget': 0}
+        
+        # Limit context to top 3 most relevant similar documents; chunks of one reference file are merged
+        references_by_file: Dict[str, List[Dict]] = {}
+        for doc in similar_docs[:3]:
+            references_by_file.setdefault(doc['metadata']['file_name'], []).append(doc)
+        references = []
+        for file_name, docs in references_by_file.items():
+            docs = sorted(docs, key=lambda doc: doc['metadata'].get('start_offset', 0))
+            references.append(self._assemble_text(docs, saved, header=f"Document: {file_name}\n"))
+        fitted = self.prompt_budget.fit_references(references)
+        saved['budget'] += sum(map(len, references)) - sum(map(len, fitted))
+        context = "\n\nReference Documents:\n" + "\n---\n".join(fitted) if fitted else ""
+        
+        # Each shard's text is rebuilt from its chunks without their overlap, then fitted to the budget
+        other_tokens = estimate_tokens(self._build_prompt("", context))
+        context_saved = dict(saved)
+        shard_texts = []
+        shards = self._shard_chunks(document_chunks)
+        for shard in shards:
+            text = self._assemble_text(shard, saved)
+            shard_texts.append(self.prompt_budget.fit_document(text, other_tokens))
+            saved['budget'] += len(text) - len(shard_texts[-1])
+        
+        # Generate hashes for caching
+        doc_hash = self._hash_content("\n\n".join(shard_texts))
+        context_hash = self._hash_content(context)
+        cache_key = self._cache_key(doc_hash, context_hash)
+        
+        # Create optimized analysis prompts
+        prompts = [self._build_prompt(text, context) for text in shard_texts]
+        
+        # The reference context is repeated in every shard's prompt
+        for reason in saved:
+            saved[reason] += context_saved[reason] * (len(prompts) - 1)
+        self._log_savings(prompts, saved)
+        
+        return prompts, cache_key
+
+    def _assemble_text(self, chunks: List[Dict], saved: Dict[str, int], header: str = "") -> str:
+        """Join chunks without their overlap and normalize whitespace, adding the characters saved to saved."""
+        joined = join_chunks(chunks)
+        text = header + normalize_whitespace(joined)
+        # Against the previous assembly, which joined whole chunks with blank lines
+        saved['overlap'] += len("\n\n".join(chunk['text'] for chunk in chunks)) - len(joined)
+        saved['whitespace'] += len(header) + len(joined) - len(text)
+        return text
+
+    def _log_savings(self, prompts: List[str], saved: Dict[str, int]):
+        """Log and count the prompt tokens saved by removing overlap and whitespace and applying the budget."""
+        saved_tokens = {reason: chars // 4 for reason, chars in saved.items()}
+        for reason, tokens in saved_tokens.items():
+            if tokens > 0:
+                metrics.PROMPT_TOKENS_SAVED.inc(tokens, reason=reason)
+        prompt_tokens = sum(estimate_tokens(prompt) for prompt in prompts)
+        total = sum(saved_tokens.values())
+        print(f"Prompt assembly: {prompt_tokens} tokens in {len(prompts)} prompt(s), saved {total} "
+              f"({total / max(prompt_tokens + total, 1):.0%}): {saved_tokens['overlap']} chunk overlap, "
+              f"{saved_tokens['whitespace']} whitespace, {saved_tokens['budget']} over the budget")
+
+    def _merge_shard_analyses(self, analyses: List[str]) -> str:
+        """
+        Deterministically merge shard analyses into one analysis in the standard format.
+        
+        Candidate clauses are ranked by severity, then by their shard's score, then by
+        position; the document score is the highest shard score.
+        """
+        candidates = []
+        seen = set()
+        risk_score = 0
+        for shard_index, analysis in enumerate(analyses):
+            shard_score = self._extract_risk_score(analysis)
+            risk_score = max(risk_score, shard_score)
+            for position, clause in enumerate(self._extract_risky_clauses(analysis)):
+                match = CLAUSE_PATTERN.match(clause)
+                if not match:
+                    continue
+                normalized = " ".join(match.group(1).lower().split())
+                if normalized in seen:
+                    continue
+                seen.add(normalized)
+                severity = SEVERITY_RANK.get(match.group(2).strip().lower(), 0)
+                candidates.append((-severity, -shard_score, shard_index, position, clause))
+        
+        top_clauses = [clause for *_, clause in sorted(candidates)[:5]]
+        
+        lines = [f"Risk Score: {risk_score}", "", "Top 5 Risky Clauses (Listed in Descending Order of Risk Severity):"]
+        if not top_clauses:
+            lines.append("No significant risky clauses found.")
+        lines.extend(f"{i}. {clause}" for i, clause in enumerate(top_clauses, start=1))
+        return "\n".join(lines)
+
+    def _record_call(self, prompt: str, response: Optional[str], seconds: float, outcome: str):
+        """Record the latency and the prompt and response sizes of one model call."""
+        metrics.LLM_CALLS.inc(backend=self.backend.name, outcome=outcome)
+        metrics.STAGE_SECONDS.observe(seconds, stage="llm_call")
+        prompt_tokens = estimate_tokens(prompt)
+        metrics.LLM_CHARACTERS.inc(len(prompt), direction="prompt")
+        metrics.LLM_TOKENS.inc(prompt_tokens, direction="prompt")
+        metrics.LLM_PROMPT_TOKENS.observe(prompt_tokens)
+        if response is not None:
+            metrics.LLM_CHARACTERS.inc(len(response), direction="response")
+            metrics.LLM_TOKENS.inc(estimate_tokens(response), direction="response")
+
+    def _generate(self, prompt: str) -> str:
+        """Call the model for one prompt, recording the call's metrics."""
+        start = time.perf_counter()
+        try:
+            response = self.llm.generate(prompt)
+        except BaseException:
+            self._record_call(prompt, None, time.perf_counter() - start, "error")
+            raise
+        self._record_call(prompt, response, time.perf_counter() - start, "ok")
+        return response
+
+    async def _generate_async(self, prompt: str) -> str:
+        """Call the model for one prompt through the async client, recording the call's metrics."""
+        start = time.perf_counter()
+        try:
+            response = await self.llm.generate_async(prompt)
+        except asyncio.CancelledError:
+            self._record_call(prompt, None, time.perf_counter() - start, "cancelled")
+            raise
+        except BaseException:
+            self._record_call(prompt, None, time.perf_counter() - start, "error")
+            raise
+        self._record_call(prompt, response, time.perf_counter() - start, "ok")
+        return response
+
+    def _cached_result(self, cache_key: str, document_chunks: List[Dict], similar_docs: List[Dict]) -> Optional[Dict]:
+        """Return the cached result for a cache key, or None on a miss."""
+        cached_analysis = self.cache.get(cache_key)
+        if not cached_analysis:
+            return None
         
+        return {
+            'analysis': cached_analysis,
+            'risk_score': self._extract_risk_score(cached_analysis),
+            'document_chunks': document_chunks,
+            'similar_docs': similar_docs,
+            'mode': 'llm'
+        }
+
+    def _finalize_analysis(self, analysis: str, cache_key: str, document_chunks: List[Dict], similar_docs: List[Dict]) -> Dict:
+        """Calibrate and cache a fresh model analysis and build the result."""
         # Extract risk score and clauses
         risk_score = self._extract_risk_score(analysis)
         clauses = self._extract_risky_clauses(analysis)
@@ -201,17 +447,175 @@ Please analyze the document and provide the risk score and top 5 risky clauses i
         # Update the analysis text with calibrated score
         analysis = analysis.replace(f"Risk Score: {risk_score}", f"Risk Score: {calibrated_score}")
         
-        # Cache the analysis
-        self._get_cached_analysis.cache_clear()  # Clear old cache entries
-        self._get_cached_analysis(doc_hash, context_hash)
+        # Cache the calibrated analysis
+        self.cache.set(cache_key, analysis)
         
         return {
             'analysis': analysis,
             'risk_score': calibrated_score,
             'document_chunks': document_chunks,
-            'similar_docs': similar_docs
+            'similar_docs': similar_docs,
+            'mode': 'llm'
         }
 
+    def analyze_document(self, document_chunks: List[Dict], similar_docs: List[Dict]) -> Dict:
+        """
+        Analyze document chunks and provide risk assessment.
+        
+        Args:
+            document_chunks (List[Dict]): List of document chunks to analyze
+            similar_docs (List[Dict]): List of similar reference documents
+            
+        Returns:
+            Dict: Risk analysis results
+        """
+        with metrics.stage("prompt"):
+            prompts, cache_key = self._prepare_analysis(document_chunks, similar_docs)
+        
+        # Check cache first
+        with metrics.stage("cache_lookup"):
+            cached = self._cached_result(cache_key, document_chunks, similar_docs)
+        if cached:
+            return cached
+        
+        with metrics.stage("llm"):
+            if len(prompts) == 1:
+                analysis = self._generate(prompts[0])
+            else:
+                # Map: analyze shards concurrently, then reduce them into one analysis
+                analysis = self._merge_shard_analyses(list(self._map_executor.map(self._generate, prompts)))
+        
+        with metrics.stage("postprocess"):
+            return self._finalize_analysis(analysis, cache_key, document_chunks, similar_docs)
+
+    async def analyze_document_async(self, document_chunks: List[Dict], similar_docs: List[Dict]) -> Dict:
+        """
+        Analyze document chunks without blocking the event loop.
+        
+        Same as analyze_document, but the model is called through the async client.
+        
+        Args:
+            document_chunks (List[Dict]): List of document chunks to analyze
+            similar_docs (List[Dict]): List of similar reference documents
+            
+        Returns:
+            Dict: Risk analysis results
+        """
+        with metrics.stage("prompt"):
+            prompts, cache_key = self._prepare_analysis(document_chunks, similar_docs)
+        
+        # Check cache first
+        with metrics.stage("cache_lookup"):
+            cached = self._cached_result(cache_key, document_chunks, similar_docs)
+        if cached:
+            return cached
+        
+        with metrics.stage("llm"):
+            if len(prompts) == 1:
+                analysis = await self._generate_async(prompts[0])
+            else:
+                analysis = await self._map_reduce_async(prompts)
+        
+        with metrics.stage("postprocess"):
+            return self._finalize_analysis(analysis, cache_key, document_chunks, similar_docs)
+
+    async def _map_reduce_async(self, prompts: List[str]) -> str:
+        """Analyze shards concurrently, then reduce them into one analysis."""
+        slots = asyncio.Semaphore(self.map_concurrency)
+        
+        async def analyze_shard(prompt: str) -> str:
+            async with slots:
+                return await self._generate_async(prompt)
+        
+        analyses = await asyncio.gather(*[analyze_shard(prompt) for prompt in prompts])
+        return self._merge_shard_analyses(analyses)
+
+    async def stream_analysis(self, document_chunks: List[Dict], similar_docs: List[Dict]) -> AsyncIterator[Tuple[str, Dict]]:
+        """
+        Analyze document chunks, yielding the answer's parts as the model writes them.
+        
+        Yields ('score', ...) with the model's score before calibration as soon as its
+        line is complete, then ('clause', ...) for each risky clause, and finally
+        ('analysis', result) with the result analyze_document_async would return.
+        Cached analyses, and long documents whose clauses are only known once their
+        shards are merged, yield their score and clauses all at once.
+        
+        Args:
+            document_chunks (List[Dict]): List of document chunks to analyze
+            similar_docs (List[Dict]): List of similar reference documents
+            
+        Yields:
+            Tuple[str, Dict]: Event name and its data
+        """
+        with metrics.stage("prompt"):
+            prompts, cache_key = self._prepare_analysis(document_chunks, similar_docs)
+        
+        with metrics.stage("cache_lookup"):
+            result = self._cached_result(cache_key, document_chunks, similar_docs)
+        if result is None and len(prompts) > 1:
+            with metrics.stage("llm"):
+                analysis = await self._map_reduce_async(prompts)
+            with metrics.stage("postprocess"):
+                result = self._finalize_analysis(analysis, cache_key, document_chunks, similar_docs)
+        
+        # Number of risky clauses sent, and whether the score was
+        sent = {'clauses': 0, 'score': False}
+        if result is not None:
+            for line in result['analysis'].split('\n'):
+                for event in self._line_events(line, sent):
+                    yield event
+            yield 'analysis', result
+            return
+        
+        prompt = prompts[0]
+        start = time.perf_counter()
+        first_piece = True
+        pieces = []
+        line = ""
+        try:
+            async for piece in self.llm.stream_async(prompt):
+                if first_piece:
+                    metrics.record_stage("llm_first_token", time.perf_counter() - start)
+                    first_piece = False
+                pieces.append(piece)
+                *lines, line = (line + piece).split('\n')
+                for complete_line in lines:
+                    for event in self._line_events(complete_line, sent):
+                        yield event
+        except (asyncio.CancelledError, GeneratorExit):
+            self._record_call(prompt, None, time.perf_counter() - start, "cancelled")
+            raise
+        except BaseException:
+            self._record_call(prompt, None, time.perf_counter() - start, "error")
+            raise
+        
+        analysis = "".join(pieces)
+        elapsed = time.perf_counter() - start
+        self._record_call(prompt, analysis, elapsed, "ok")
+        metrics.record_stage("llm", elapsed)
+        
+        # The answer's last line may not end with a newline
+        for event in self._line_events(line, sent):
+            yield event
+        
+        with metrics.stage("postprocess"):
+            result = self._finalize_analysis(analysis, cache_key, document_chunks, similar_docs)
+        yield 'analysis', result
+
+    def _line_events(self, line: str, sent: Dict) -> List[Tuple[str, Dict]]:
+        """Return the score and clause events for one complete line of the model's answer."""
+        events = []
+        score_match = None if sent['score'] else SCORE_PATTERN.search(line)
+        if score_match:
+            sent['score'] = True
+            events.append(('score', {'risk_score': int(score_match.group(1))}))
+        parsed = parse_clause_line(line)
+        if parsed:
+            clause, severity, category = parsed
+            events.append(('clause', {'index': sent['clauses'], 'clause': clause, 'severity': severity, 'category': category}))
+            sent['clauses'] += 1
+        return events
+
     def _extract_risk_score(self, analysis: str) -> int:
         """Extract risk score from analysis text."""
         try:
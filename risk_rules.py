@@ -0,0 +1,112 @@
+import os
+import re
+import json
+import hashlib
+from typing import Dict, Iterable, List, Optional, Set
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "risk_rules.json")
+
+# Characters that end a sentence when locating the clause around a match
+SENTENCE_END = re.compile(r'[.;\n]')
+
+SEVERITY_ORDER = {'High Risk': 3, 'Medium Risk': 2, 'Low Risk': 1}
+
+class RiskRules:
+    def __init__(self, rules: List[Dict], version: str = ""):
+        """
+        Keyword rules compiled into a single case-insensitive alternation regex.
+
+        Each rule has a phrase plus:
+            severe (bool): Counts as a severe keyword when calibrating LLM scores
+            adjustment (int): Points added to a calibrated score per clause containing the phrase
+            weight (int): Contribution to the heuristic pre-score
+            severity, category (str): Tags used when the phrase flags a clause heuristically
+
+        Args:
+            rules (List[Dict]): The rules
+            version (str): Identifies the rule set; part of the analysis cache key
+        """
+        self.rules = {rule['phrase'].lower(): rule for rule in rules}
+        self.version = version
+        # Longest phrases first so the alternation prefers the most specific match
+        phrases = sorted(self.rules, key=len, reverse=True)
+        self.pattern = re.compile("|".join(re.escape(phrase) for phrase in phrases), re.IGNORECASE)
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> 'RiskRules':
+        """Load rules from a JSON file, by default RISK_RULES_PATH or risk_rules.json next to this module."""
+        path = path or os.getenv("RISK_RULES_PATH", DEFAULT_RULES_PATH)
+        with open(path, 'rb') as f:
+            raw = f.read()
+        return cls(json.loads(raw)['rules'], version=hashlib.sha256(raw).hexdigest()[:16])
+
+    def phrases_in(self, text: str) -> Set[str]:
+        """Return the distinct rule phrases found in a text, in one pass."""
+        return {match.group(0).lower() for match in self.pattern.finditer(text)}
+
+    def calibration_features(self, clauses: Iterable[str]) -> Dict:
+        """
+        Summarize the rule matches of LLM-flagged clauses for score calibration.
+
+        Returns:
+            Dict: 'has_severe' (any severe phrase in any clause) and 'adjustment'
+            (sum of phrase adjustments, each phrase counted once per clause)
+        """
+        has_severe = False
+        adjustment = 0
+        for clause in clauses:
+            for phrase in self.phrases_in(clause):
+                rule = self.rules[phrase]
+                has_severe = has_severe or rule.get('severe', False)
+                adjustment += rule.get('adjustment', 0)
+        return {'has_severe': has_severe, 'adjustment': adjustment}
+
+    def heuristic_analysis(self, texts: Iterable[str], max_clauses: int = 5) -> Dict:
+        """
+        Score a document from rule matches alone, without an LLM.
+
+        Every text (e.g. each chunk) is scanned once; the sentence around each match
+        becomes a candidate clause. Clauses are ranked by severity and total weight,
+        and the answer uses the same format as the LLM analysis.
+
+        Args:
+            texts (Iterable[str]): Document text, whole or in chunks
+            max_clauses (int): Number of clauses to report
+
+        Returns:
+            Dict: 'analysis' text, 'risk_score' and the number of 'matches'
+        """
+        candidates = {}
+        matches = 0
+        for text in texts:
+            for match in self.pattern.finditer(text):
+                matches += 1
+                start = max(text.rfind(char, 0, match.start()) for char in '.;\n') + 1
+                end_match = SENTENCE_END.search(text, match.end())
+                end = end_match.end() if end_match else len(text)
+                sentence = " ".join(text[start:end].split())
+
+                # Overlapping chunks repeat sentences; keep one entry per sentence
+                entry = candidates.setdefault(sentence, {'phrases': set(), 'order': len(candidates)})
+                entry['phrases'].add(match.group(0).lower())
+
+        ranked = []
+        for sentence, entry in candidates.items():
+            rules = [self.rules[phrase] for phrase in entry['phrases']]
+            top = max(rules, key=lambda rule: (rule.get('weight', 0), SEVERITY_ORDER.get(rule['severity'], 0)))
+            weight = sum(rule.get('weight', 0) for rule in rules)
+            ranked.append((-SEVERITY_ORDER.get(top['severity'], 0), -weight, entry['order'], sentence, top))
+        ranked.sort()
+        top_clauses = ranked[:max_clauses]
+        risk_score = min(100, sum(-weight for _, weight, _, _, _ in top_clauses) * 2)
+
+        lines = [f"Risk Score: {risk_score}", "", "Top 5 Risky Clauses (Listed in Descending Order of Risk Severity):"]
+        if not top_clauses:
+            lines.append("No significant risky clauses found.")
+        for i, (_, _, _, sentence, rule) in enumerate(top_clauses, start=1):
+            lines.append(
+                f"{i}. {sentence} [{rule['severity']}] [{rule['category']}] - "
+                f"Contains '{rule['phrase']}', which may disadvantage the Client."
+            )
+
+        return {'analysis': "\n".join(lines), 'risk_score': risk_score, 'matches': matches}
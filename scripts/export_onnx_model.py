@@ -0,0 +1,81 @@
+"""
+Export the embedding model to ONNX and quantize its weights to int8 for EMBEDDING_BACKEND=onnx.
+
+Exporting needs sentence-transformers (with PyTorch), onnx and onnxruntime; serving
+the result needs only onnxruntime and tokenizers. Check the export with
+benchmarks/bench_embedding_backends.py before deploying it.
+
+Usage:
+    python scripts/export_onnx_model.py --output models/all-MiniLM-L6-v2-onnx-int8
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embedding_backends import EMBEDDING_MODEL, DEFAULT_ONNX_MODEL_DIR
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the embedding model to int8 ONNX")
+    parser.add_argument("--model", default=EMBEDDING_MODEL, help="sentence-transformers model to export")
+    parser.add_argument("--output", default=DEFAULT_ONNX_MODEL_DIR, help="Directory the exported model is written to")
+    parser.add_argument("--opset", type=int, default=17)
+    args = parser.parse_args()
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    model = SentenceTransformer(args.model, device="cpu")
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+
+    class TokenEmbeddings(torch.nn.Module):
+        """The transformer without pooling; pooling and normalization run in numpy at inference."""
+
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.model(
+                input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids
+            ).last_hidden_state
+
+    os.makedirs(args.output, exist_ok=True)
+    sample = tokenizer(["An example clause to trace the model with."], return_tensors="pt")
+    input_names = ['input_ids', 'attention_mask', 'token_type_ids']
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fp32_path = os.path.join(tmp, "model-fp32.onnx")
+        print(f"Exporting {args.model} to ONNX...")
+        with torch.no_grad():
+            torch.onnx.export(
+                TokenEmbeddings(transformer),
+                tuple(sample[name] for name in input_names),
+                fp32_path,
+                input_names=input_names,
+                output_names=['token_embeddings'],
+                dynamic_axes={name: {0: 'batch', 1: 'sequence'} for name in input_names + ['token_embeddings']},
+                opset_version=args.opset,
+            )
+
+        # Dynamic quantization: int8 weights, activations quantized on the fly
+        print("Quantizing weights to int8...")
+        quantize_dynamic(fp32_path, os.path.join(args.output, "model.onnx"), weight_type=QuantType.QInt8)
+
+    tokenizer.backend_tokenizer.save(os.path.join(args.output, "tokenizer.json"))
+    with open(os.path.join(args.output, "embedding_config.json"), 'w', encoding='utf-8') as f:
+        json.dump({
+            'name': f"{os.path.basename(args.model)}-onnx-int8",
+            'dim': model.get_sentence_embedding_dimension(),
+            'max_seq_length': model.max_seq_length,
+            'pad_token_id': tokenizer.pad_token_id,
+        }, f, indent=2)
+
+    print(f"Wrote {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Serve a fake OpenAI-compatible chat completions API with injected latency and errors.
+
+Answers come from the offline LocalBackend, so they parse like the real model's.
+Each request waits --latency seconds (plus up to --jitter), or --slow-latency for a
+--slow-rate share of requests to create a latency tail; a --rate-limit-rate share is
+answered 429 with a Retry-After header and an --error-rate share 503. Streaming
+requests ("stream": true) are answered as server-sent events. GET /stats returns
+what was served. Point the analyzer at it with LLM_BACKEND=http:
+
+Usage:
+    python scripts/fake_llm_server.py --port 8080 --latency 0.5 --slow-rate 0.05 --slow-latency 5 --error-rate 0.05
+    LLM_BACKEND=http LLM_HTTP_URL=http://127.0.0.1:8080/v1 uvicorn api:app
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_backends import LocalBackend
+
+def create_app(latency: float = 0.5, jitter: float = 0.1, slow_rate: float = 0.0, slow_latency: float = 5.0,
+               error_rate: float = 0.0, rate_limit_rate: float = 0.0, retry_after: int = 1,
+               stream_piece_chars: int = 20, seed: int = 0) -> FastAPI:
+    """
+    Build the fake server.
+
+    Args:
+        latency (float): Seconds each request waits before answering
+        jitter (float): Random extra seconds, up to this many, added to each wait
+        slow_rate (float): Share of requests that wait slow_latency instead
+        slow_latency (float): Seconds a slow request waits
+        error_rate (float): Share of requests answered 503
+        rate_limit_rate (float): Share of requests answered 429
+        retry_after (int): Retry-After seconds sent with each 429
+        stream_piece_chars (int): Characters per streamed piece
+        seed (int): Random seed for the injected latency and errors
+
+    Returns:
+        FastAPI: The app
+    """
+    app = FastAPI()
+    backend = LocalBackend()
+    rng = random.Random(seed)
+    stats = {'requests': 0, 'ok': 0, 'rate_limited': 0, 'errors': 0, 'slow': 0}
+    app.state.stats = stats
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats['requests'] += 1
+
+        draw = rng.random()
+        if draw < rate_limit_rate:
+            stats['rate_limited'] += 1
+            return JSONResponse({'error': {'message': "Rate limit exceeded"}}, status_code=429,
+                                headers={'Retry-After': str(retry_after)})
+        if draw < rate_limit_rate + error_rate:
+            stats['errors'] += 1
+            return JSONResponse({'error': {'message': "Overloaded"}}, status_code=503)
+
+        wait = latency + rng.uniform(0, jitter)
+        if rng.random() < slow_rate:
+            stats['slow'] += 1
+            wait = slow_latency
+        prompt = body['messages'][-1]['content']
+        answer = backend._complete(prompt)
+
+        if body.get('stream'):
+            pieces = [answer[i:i + stream_piece_chars] for i in range(0, len(answer), stream_piece_chars)]
+
+            async def events():
+                for piece in pieces:
+                    await asyncio.sleep(wait / len(pieces))
+                    yield "data: " + json.dumps({'choices': [{'index': 0, 'delta': {'content': piece}}]}) + "\n\n"
+                yield "data: [DONE]\n\n"
+                stats['ok'] += 1
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        await asyncio.sleep(wait)
+        stats['ok'] += 1
+        return {
+            'id': f"fake-{stats['requests']}",
+            'object': "chat.completion",
+            'created': int(time.time()),
+            'model': body.get('model', "fake"),
+            'choices': [{'index': 0, 'message': {'role': "assistant", 'content': answer}, 'finish_reason': "stop"}],
+        }
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake LLM server with injected latency and errors")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-latency", type=float, default=5.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    app = create_app(
+        latency=args.latency, jitter=args.jitter, slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
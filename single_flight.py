@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Iterator, Optional, Tuple
+
+import metrics
+
+class SingleFlight:
+    def __init__(self, db_path: str = "cache/single_flight.sqlite3", lease_seconds: float = 30.0,
+                 result_ttl_seconds: float = 10.0, poll_interval: float = 0.05, max_poll_interval: float = 0.25):
+        """
+        Runs identical concurrent work once, within a process and across processes sharing db_path.
+
+        The first caller for a key runs the work. Other callers in the same process
+        await the same task; callers in other processes (e.g. gunicorn workers) find
+        the owner's lease in SQLite and poll for the result it stores there. The
+        owner renews its lease while it works, so when it dies the lease expires and
+        a waiting process takes over. Results must be JSON-serializable.
+
+        Args:
+            db_path (str): Path to the SQLite database holding leases and results
+            lease_seconds (float): Time after which a lease that was not renewed is taken over
+            result_ttl_seconds (float): How long a finished result is kept for waiting processes
+            poll_interval (float): First delay between checks for another process's result; doubles up to max_poll_interval
+            max_poll_interval (float): Longest delay between checks
+        """
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.result_ttl_seconds = result_ttl_seconds
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self._owner_pid: Optional[int] = None
+        self._owner_id = ""
+        self.inflight: Dict[str, asyncio.Task] = {}
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS leases (
+                    key TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    result TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+
+    @classmethod
+    def from_env(cls) -> 'SingleFlight':
+        """Create a coalescer configured from environment variables."""
+        return cls(
+            db_path=os.getenv("SINGLE_FLIGHT_PATH", "cache/single_flight.sqlite3"),
+            lease_seconds=float(os.getenv("SINGLE_FLIGHT_LEASE_SECONDS", "30")),
+            result_ttl_seconds=float(os.getenv("SINGLE_FLIGHT_RESULT_TTL_SECONDS", "10")),
+        )
+
+    @property
+    def owner_id(self) -> str:
+        """Identity of this process in leases; regenerated after a fork, e.g. in each preloaded gunicorn worker."""
+        if self._owner_pid != os.getpid():
+            self._owner_pid = os.getpid()
+            self._owner_id = f"{self._owner_pid}-{uuid.uuid4().hex}"
+        return self._owner_id
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # A short-lived connection per operation, as in AnalysisCache; transactions are
+        # begun explicitly so a check and the write that follows it are atomic
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    async def run(self, key: str, func: Callable[[], Awaitable[Dict]]) -> Dict:
+        """
+        Return the result of func for a key, running it only if no identical run is in flight.
+
+        The work runs in its own task, so a caller that goes away does not cancel it
+        for the others. Callers in this process share the owner's result or exception.
+
+        Args:
+            key (str): Identifies the work, e.g. a hash of the uploaded bytes
+            func (Callable[[], Awaitable[Dict]]): Starts the work
+
+        Returns:
+            Dict: The work's result
+        """
+        task = self.inflight.get(key)
+        if task is not None:
+            metrics.COALESCED_REQUESTS.inc(role="waiter")
+        else:
+            task = asyncio.ensure_future(self._run_once(key, func))
+            self.inflight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        return await asyncio.shield(task)
+
+    def _finished(self, key: str, task: asyncio.Task):
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
+        # Mark the exception retrieved: every caller may have gone away
+        if not task.cancelled():
+            task.exception()
+
+    async def _run_once(self, key: str, func: Callable[[], Awaitable[Dict]]) -> Dict:
+        """Run func under the key's lease, or wait for the process holding it."""
+        waited = False
+        while True:
+            acquired, result = await asyncio.to_thread(self._acquire, key)
+            if result is not None:
+                return json.loads(result)
+            if acquired:
+                break
+            if not waited:
+                metrics.COALESCED_REQUESTS.inc(role="remote_waiter")
+                waited = True
+            result = await self._wait(key)
+            if result is not None:
+                return json.loads(result)
+            # The owner released or lost its lease without a result; try to take it over
+
+        if not waited:
+            metrics.COALESCED_REQUESTS.inc(role="owner")
+        renewal = asyncio.ensure_future(self._renew(key))
+        try:
+            result = await func()
+            await asyncio.to_thread(self._store, key, json.dumps(result))
+            return result
+        except BaseException:
+            # Let a waiting process take over at once rather than when the lease expires; shielded
+            # so the release still completes if this task is cancelled again while it runs
+            await asyncio.shield(asyncio.to_thread(self._release, key))
+            raise
+        finally:
+            renewal.cancel()
+
+    async def _wait(self, key: str) -> Optional[str]:
+        """Poll until another process stores the key's result (returned) or gives up its lease (None)."""
+        delay = self.poll_interval
+        while True:
+            await asyncio.sleep(delay)
+            leased, result = await asyncio.to_thread(self._check, key)
+            if result is not None or not leased:
+                return result
+            delay = min(delay * 2, self.max_poll_interval)
+
+    async def _renew(self, key: str):
+        """Extend the lease while the work runs."""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            await asyncio.to_thread(self._extend, key)
+
+    def _acquire(self, key: str) -> Tuple[bool, Optional[str]]:
+        """Take the key's lease unless a live one exists; return whether it was taken, and any stored result."""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT result FROM results WHERE key = ? AND created_at >= ?",
+                (key, now - self.result_ttl_seconds)
+            ).fetchone()
+            if row is not None:
+                return False, row[0]
+            row = conn.execute(
+                "SELECT 1 FROM leases WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is not None:
+                return False, None
+            conn.execute(
+                "INSERT OR REPLACE INTO leases (key, owner, expires_at) VALUES (?, ?, ?)",
+                (key, self.owner_id, now + self.lease_seconds)
+            )
+            return True, None
+
+    def _check(self, key: str) -> Tuple[bool, Optional[str]]:
+        """Return whether the key has a live lease, and its stored result if any."""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT result FROM results WHERE key = ? AND created_at >= ?",
+                (key, now - self.result_ttl_seconds)
+            ).fetchone()
+            if row is not None:
+                return False, row[0]
+            row = conn.execute(
+                "SELECT 1 FROM leases WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            return row is not None, None
+
+    def _extend(self, key: str):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE leases SET expires_at = ? WHERE key = ? AND owner = ?",
+                (time.time() + self.lease_seconds, key, self.owner_id)
+            )
+
+    def _store(self, key: str, result: str):
+        """Store the result, release the lease and drop expired rows."""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, result, created_at) VALUES (?, ?, ?)",
+                (key, result, now)
+            )
+            conn.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, self.owner_id))
+            conn.execute("DELETE FROM results WHERE created_at < ?", (now - self.result_ttl_seconds,))
+            conn.execute("DELETE FROM leases WHERE expires_at < ?", (now,))
+
+    def _release(self, key: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, self.owner_id))
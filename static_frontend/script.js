@@ -1,3 +1,172 @@
+function clauseCard(clauseString, severity, category, index) {
+    const parts = clauseString.split(' - ', 2);
+    const clauseText = parts[0].trim();
+    const explanation = parts.length > 1 && parts[1].trim() !== '' ? parts[1].trim() : 'Explanation not provided.';
+
+    const sequentialNumber = index + 1;
+
+    let severityClass = '';
+    switch (severity.toLowerCase()) {
+        case 'high risk':
+            severityClass = 'severity-high';
+            break;
+        case 'medium risk':
+            severityClass = 'severity-medium';
+            break;
+        case 'low risk':
+            severityClass = 'severity-low';
+            break;
+        default:
+            severityClass = 'severity-unknown';
+    }
+
+    return `
+            <div class="p-4 bg-red-50 rounded-lg border border-red-200">
+                <div class="flex items-start">
+                    <span class="flex-shrink-0 w-6 h-6 bg-red-100 text-red-800 rounded-full flex items-center justify-center font-medium mr-3">${sequentialNumber}</span>
+                    <div class="flex-grow">
+                        <p class="text-red-800 font-medium mb-1">${clauseText}</p>
+                        <div class="flex items-center space-x-2 mb-2">
+                            <span class="text-xs font-semibold px-2.5 py-0.5 rounded ${severityClass}">${severity}</span>
+                            <span class="text-xs font-semibold px-2.5 py-0.5 rounded bg-gray-200 text-gray-800 category-tag">${category}</span>
+                        </div>
+                        <p class="text-red-600 text-sm">${explanation}</p>
+                    </div>
+                </div>
+            </div>
+        `;
+}
+
+function renderScore(score) {
+    document.getElementById('score-value').textContent = `${score}%`;
+    // Update risk indicator position (0-100 to percentage)
+    document.getElementById('risk-indicator').style.left = `${score}%`;
+}
+
+function renderAnalysis(data) {
+    const riskyClauses = document.getElementById('risky-clauses');
+    const clausesList = document.getElementById('clauses-list');
+
+    renderScore(data.risk_score);
+
+    // Display risky clauses if any
+    if (data.risky_clauses && data.risky_clauses.length > 0) {
+        riskyClauses.classList.remove('hidden');
+        clausesList.innerHTML = data.risky_clauses.map((clauseString, index) => clauseCard(
+            clauseString, data.clause_severity[index] || '-', data.risk_categories[index] || '-', index
+        )).join('');
+    } else {
+        riskyClauses.classList.add('hidden');
+    }
+}
+
+// Read the server-sent events of a streaming response, calling onEvent(name, data) for each
+async function readEvents(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) {
+            return;
+        }
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let name = 'message';
+            const dataLines = [];
+            block.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    name = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    dataLines.push(line.slice(5).trimStart());
+                }
+            });
+            if (dataLines.length) {
+                onEvent(name, JSON.parse(dataLines.join('\n')));
+            }
+        }
+    }
+}
+
+const STAGE_LABELS = {
+    extract: 'Reading document...',
+    retrieve: 'Comparing with references...',
+    llm: 'Analyzing...'
+};
+
+// Analyze one file through the streaming endpoint, showing the score and each clause as it arrives
+async function streamAnalysis(file) {
+    const scoreValue = document.getElementById('score-value');
+    const riskyClauses = document.getElementById('risky-clauses');
+    const clausesList = document.getElementById('clauses-list');
+
+    const formData = new FormData();
+    formData.append('file', file, file.name);
+
+    console.log('Sending request to API...');
+    const response = await fetch('http://localhost:8000/analyze/stream', {
+        method: 'POST',
+        headers: {
+            'Accept': 'text/event-stream'
+        },
+        mode: 'cors',
+        credentials: 'omit',
+        body: formData
+    }).catch(error => {
+        console.error('Network error:', error);
+        // More general network/server error handling
+        let userMessage = 'A network error occurred. Please ensure the API server is running.';
+        if (error.name === 'TypeError' && error.message.includes('Failed to fetch')) {
+            // This specific TypeError often indicates network connection issues or CORS problems
+            userMessage = 'Could not connect to the API. Ensure the server is running and accessible at http://localhost:8000. If running locally, also check browser console for CORS issues.';
+        } else {
+            userMessage = `Network error: ${error.message}`;
+        }
+        // Rethrow the error with a more user-friendly message
+        throw new Error(userMessage);
+    });
+
+    console.log('Response status:', response.status);
+    if (!response.ok) {
+        // Handle API errors (e.g., 400, 503 status codes)
+        throw new Error(await readApiError(response));
+    }
+
+    let result = null;
+    await readEvents(response, (event, data) => {
+        switch (event) {
+            case 'stage':
+                scoreValue.textContent = STAGE_LABELS[data.stage] || 'Analyzing...';
+                break;
+            case 'score':
+                // The model's score before calibration; the result replaces it
+                renderScore(data.risk_score);
+                break;
+            case 'clause':
+                riskyClauses.classList.remove('hidden');
+                clausesList.insertAdjacentHTML('beforeend', clauseCard(data.clause, data.severity, data.category, data.index));
+                break;
+            case 'result':
+                result = data;
+                renderAnalysis(data);
+                break;
+            case 'error':
+                throw new Error(data.detail);
+        }
+    });
+
+    if (!result) {
+        throw new Error('The connection closed before the analysis finished.');
+    }
+    console.log('Received data:', result);
+    return result;
+}
+
 async function generateScore() {
     const fileInput = document.getElementById('file-upload');
     const fileIdInput = document.getElementById('file-id');
@@ -14,6 +183,7 @@ async function generateScore() {
     riskIndicator.style.left = '50%';
     riskyClauses.classList.add('hidden');
     clausesList.innerHTML = '';
+    document.getElementById('batch-results').classList.add('hidden');
     errorMessageArea.classList.add('hidden'); // Hide any previous error message
     errorMessageArea.innerHTML = ''; // Clear previous error message content
 
@@ -23,112 +193,16 @@ async function generateScore() {
             throw new Error('Please select a file to analyze');
         }
 
-        const fileToUpload = fileInput.files[0];
-        const selectedFileName = fileToUpload.name; // Store the selected filename
-
-        const formData = new FormData();
-        formData.append('file', fileToUpload, fileToUpload.name);
-
-        console.log('Sending request to API...');
-        const response = await fetch('http://localhost:8000/analyze', {
-            method: 'POST',
-            headers: {
-                'Accept': 'application/json'
-            },
-            mode: 'cors',
-            credentials: 'omit',
-            body: formData
-        }).catch(error => {
-            console.error('Network error:', error);
-            // More general network/server error handling
-            let userMessage = 'A network error occurred. Please ensure the API server is running.';
-            if (error.name === 'TypeError' && error.message.includes('Failed to fetch')) {
-                // This specific TypeError often indicates network connection issues or CORS problems
-                userMessage = 'Could not connect to the API. Ensure the server is running and accessible at http://localhost:8000. If running locally, also check browser console for CORS issues.';
-            } else {
-                userMessage = `Network error: ${error.message}`;
-            }
-            // Rethrow the error with a more user-friendly message
-            throw new Error(userMessage);
-        });
-
-        console.log('Response status:', response.status);
-        if (!response.ok) {
-            const errorText = await response.text();
-            console.error('API Error:', errorText);
-            // Handle API errors (e.g., 400, 500 status codes)
-            let errorMessage = `API request failed with status ${response.status}.`;
-            try {
-                // Attempt to parse error details if the response is JSON
-                const errorJson = JSON.parse(errorText);
-                if (errorJson.detail) {
-                    errorMessage += ` Details: ${errorJson.detail}`;
-                } else {
-                    errorMessage += ` Response: ${errorText}`;
-                }
-            } catch (e) {
-                // If response is not JSON, just show the text
-                errorMessage += ` Response: ${errorText}`;
-            }
-            throw new Error(errorMessage);
+        if (fileInput.files.length > 1) {
+            await generateBatchScores(Array.from(fileInput.files));
+            fileInput.value = ''; // Clear the file input
+            return;
         }
 
-        const data = await response.json();
-        console.log('Received data:', data);
-
-        // Update score display
-        scoreValue.textContent = `${data.risk_score}%`;
-
-        // Update risk indicator position (0-100 to percentage)
-        riskIndicator.style.left = `${data.risk_score}%`;
-
-        // Display risky clauses if any
-        if (data.risky_clauses && data.risky_clauses.length > 0) {
-            riskyClauses.classList.remove('hidden');
-
-            clausesList.innerHTML = data.risky_clauses.map((clauseString, index) => {
-                const parts = clauseString.split(' - ', 2);
-                const clauseText = parts[0].trim();
-                const explanation = parts.length > 1 && parts[1].trim() !== '' ? parts[1].trim() : 'Explanation not provided.';
-
-                const sequentialNumber = index + 1;
-                const category = data.risk_categories[index] || '-';
-                const severity = data.clause_severity[index] || '-';
-
-                let severityClass = '';
-                switch (severity.toLowerCase()) {
-                    case 'high risk':
-                        severityClass = 'severity-high';
-                        break;
-                    case 'medium risk':
-                        severityClass = 'severity-medium';
-                        break;
-                    case 'low risk':
-                        severityClass = 'severity-low';
-                        break;
-                    default:
-                        severityClass = 'severity-unknown';
-                }
+        const fileToUpload = fileInput.files[0];
+        const selectedFileName = fileToUpload.name; // Store the selected filename
 
-                return `
-                <div class="p-4 bg-red-50 rounded-lg border border-red-200">
-                    <div class="flex items-start">
-                        <span class="flex-shrink-0 w-6 h-6 bg-red-100 text-red-800 rounded-full flex items-center justify-center font-medium mr-3">${sequentialNumber}</span>
-                        <div class="flex-grow">
-                            <p class="text-red-800 font-medium mb-1">${clauseText}</p>
-                            <div class="flex items-center space-x-2 mb-2">
-                                <span class="text-xs font-semibold px-2.5 py-0.5 rounded ${severityClass}">${severity}</span>
-                                <span class="text-xs font-semibold px-2.5 py-0.5 rounded bg-gray-200 text-gray-800 category-tag">${category}</span>
-                            </div>
-                            <p class="text-red-600 text-sm">${explanation}</p>
-                        </div>
-                    </div>
-                </div>
-            `;
-            }).join('');
-        } else {
-            riskyClauses.classList.add('hidden');
-        }
+        await streamAnalysis(fileToUpload);
         fileInput.value = ''; // Clear the file input
 
         // Display the filename of the successfully analyzed file
@@ -156,4 +230,97 @@ async function generateScore() {
         riskyClauses.classList.add('hidden'); // Ensure risky clauses are hidden on error
         analyzedFilenameArea.classList.add('hidden'); // Hide filename area on error
     }
-}
\ No newline at end of file
+}
+
+async function readApiError(response) {
+    const errorText = await response.text();
+    let errorMessage = `API request failed with status ${response.status}.`;
+    try {
+        const errorJson = JSON.parse(errorText);
+        errorMessage += errorJson.detail ? ` Details: ${errorJson.detail}` : ` Response: ${errorText}`;
+    } catch (e) {
+        errorMessage += ` Response: ${errorText}`;
+    }
+    return errorMessage;
+}
+
+async function generateBatchScores(files) {
+    const scoreValue = document.getElementById('score-value');
+    const batchResults = document.getElementById('batch-results');
+    const batchProgress = document.getElementById('batch-progress');
+    const batchList = document.getElementById('batch-list');
+
+    const formData = new FormData();
+    files.forEach(file => formData.append('files', file, file.name));
+
+    const response = await fetch('http://localhost:8000/batch', {
+        method: 'POST',
+        headers: {
+            'Accept': 'application/json'
+        },
+        mode: 'cors',
+        credentials: 'omit',
+        body: formData
+    });
+    if (!response.ok) {
+        throw new Error(await readApiError(response));
+    }
+
+    const batch = await response.json();
+    const results = {};
+    scoreValue.textContent = 'Batch submitted';
+    batchResults.classList.remove('hidden');
+
+    // Poll the batch until every job has finished, fetching results as they complete
+    while (true) {
+        const statusResponse = await fetch(`http://localhost:8000/batches/${batch.batch_id}`, { mode: 'cors', credentials: 'omit' });
+        if (!statusResponse.ok) {
+            throw new Error(await readApiError(statusResponse));
+        }
+        const status = await statusResponse.json();
+
+        for (const job of status.jobs) {
+            if (job.status === 'done' && !results[job.job_id]) {
+                const resultResponse = await fetch(`http://localhost:8000/jobs/${job.job_id}/result`, { mode: 'cors', credentials: 'omit' });
+                if (resultResponse.ok) {
+                    results[job.job_id] = await resultResponse.json();
+                }
+            }
+        }
+
+        const finished = status.jobs.filter(job => job.status === 'done' || job.status === 'failed').length;
+        batchProgress.textContent = `${finished} of ${status.jobs.length} documents analyzed`;
+        batchList.innerHTML = status.jobs.map(job => {
+            const result = results[job.job_id];
+            let label = job.status;
+            if (result) {
+                label = `${result.risk_score}%`;
+            } else if (job.status === 'failed') {
+                label = 'Failed';
+            }
+            return `
+            <div class="p-3 bg-gray-50 rounded-lg border border-gray-200 flex justify-between items-center ${result ? 'cursor-pointer hover:bg-gray-100' : ''}" data-job-id="${job.job_id}">
+                <span class="text-sm text-gray-900 truncate mr-3" data-filename></span>
+                <span class="text-sm font-semibold text-gray-800">${label}</span>
+            </div>
+        `;
+        }).join('');
+
+        // File names are user input, so they are set as text rather than HTML.
+        // Clicking a finished document shows its clauses in the main display
+        const filenames = Object.fromEntries(status.jobs.map(job => [job.job_id, job.filename]));
+        batchList.querySelectorAll('[data-job-id]').forEach(row => {
+            row.querySelector('[data-filename]').textContent = filenames[row.dataset.jobId];
+            const result = results[row.dataset.jobId];
+            if (result) {
+                row.onclick = () => renderAnalysis(result);
+            }
+        });
+
+        if (finished === status.jobs.length) {
+            scoreValue.textContent = 'Batch complete';
+            return;
+        }
+        await new Promise(resolve => setTimeout(resolve, 2000));
+    }
+}
@@ -0,0 +1,111 @@
+import re
+from typing import Dict, List
+
+# Whitespace other than line breaks, e.g. the runs of spaces PDF extraction leaves
+_SPACES = re.compile(r"[^\S\n]+")
+_SPACE_AROUND_NEWLINE = re.compile(r" ?\n ?")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of LLM tokens in a text.
+
+    Uses the common approximation of four characters per token, which is close
+    enough for budgeting English contract text without loading a tokenizer.
+    """
+    return (len(text) + 3) // 4
+
+def normalize_whitespace(text: str) -> str:
+    """Collapse runs of spaces to one, drop spaces at line ends and keep at most one blank line in a row."""
+    text = _SPACES.sub(" ", text)
+    text = _SPACE_AROUND_NEWLINE.sub("\n", text)
+    return _BLANK_LINES.sub("\n\n", text).strip()
+
+def join_chunks(chunks: List[Dict]) -> str:
+    """
+    Rebuild the text of chunks in order without repeating the overlap between them.
+
+    A chunk that starts before the previous one ended, by the start_offset and
+    end_offset in their metadata, adds only its text past that end. Other chunks,
+    including those without offsets, are separated by a blank line.
+
+    Args:
+        chunks (List[Dict]): Chunks of one document, in document order
+
+    Returns:
+        str: The chunks' text
+    """
+    parts = []
+    end = None  # End offset of the text added so far, while it is known
+    for chunk in chunks:
+        text = chunk['text']
+        metadata = chunk.get('metadata') or {}
+        start, chunk_end = metadata.get('start_offset'), metadata.get('end_offset')
+        # Offsets are only trusted when the text is exactly the span they give
+        has_offsets = start is not None and chunk_end is not None and chunk_end - start == len(text)
+
+        if has_offsets and end is not None and start < end:
+            if chunk_end > end:
+                parts.append(text[end - start:])
+                end = chunk_end
+            continue
+
+        if parts:
+            parts.append("\n\n")
+        parts.append(text)
+        end = chunk_end if has_offsets else None
+    return "".join(parts)
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to at most max_tokens estimated tokens, at a line break or else a space where possible."""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind("\n", 0, max_chars + 1)
+    if cut <= 0:
+        cut = text.rfind(" ", 0, max_chars + 1)
+    if cut <= 0:
+        cut = max_chars
+    return text[:cut].rstrip()
+
+class PromptBudget:
+    def __init__(self, max_tokens: int = 20000, reference_tokens: int = 2000):
+        """
+        Fits the document text and reference context of a prompt into token budgets.
+
+        References are packed whole, closest first, into reference_tokens; the first
+        that does not fit is cut to the space left and the rest are dropped. The
+        document text gets what remains of max_tokens after the rest of the prompt,
+        and is cut at a line break when longer.
+
+        Args:
+            max_tokens (int): Estimated tokens per prompt, or 0 for no limit
+            reference_tokens (int): Estimated tokens of reference context per prompt, or 0 for no limit
+        """
+        self.max_tokens = max_tokens
+        self.reference_tokens = reference_tokens
+
+    def fit_references(self, references: List[str]) -> List[str]:
+        """Return the references, closest first, that fit the reference budget."""
+        if self.reference_tokens <= 0:
+            return list(references)
+        kept = []
+        remaining = self.reference_tokens
+        for reference in references:
+            tokens = estimate_tokens(reference)
+            if tokens <= remaining:
+                kept.append(reference)
+                remaining -= tokens
+                continue
+            cut = truncate_to_tokens(reference, remaining)
+            # A cut that leaves no more than the document's name is not worth sending
+            if "\n" in cut:
+                kept.append(cut)
+            break
+        return kept
+
+    def fit_document(self, document_text: str, other_tokens: int) -> str:
+        """Return the document text cut to what the budget leaves after other_tokens of prompt."""
+        if self.max_tokens <= 0:
+            return document_text
+        return truncate_to_tokens(document_text, max(self.max_tokens - other_tokens, 0))
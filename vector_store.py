@@ -0,0 +1,255 @@
+import os
+import json
+import uuid
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+class VectorStore:
+    """Interface for where EmbeddingManager keeps chunk embeddings."""
+
+    name = "base"
+
+    def add(self, ids: List[str], embeddings: np.ndarray, documents: List[str], metadatas: List[Dict]):
+        """Store chunks with their embeddings."""
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]):
+        """Remove chunks by id."""
+        raise NotImplementedError
+
+    def query(self, embeddings: np.ndarray, n_results: int) -> List[List[Dict]]:
+        """Return the closest chunks (id, text, metadata, cosine distance) for each query embedding."""
+        raise NotImplementedError
+
+    def ids(self) -> List[str]:
+        """Return the ids of every stored chunk."""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        """Return the number of stored chunks."""
+        raise NotImplementedError
+
+class ChromaVectorStore(VectorStore):
+    name = "chroma"
+
+    def __init__(self, persist_directory: str, collection_name: str):
+        import chromadb
+        from chromadb.config import Settings
+
+        self.client = chromadb.Client(Settings(
+            persist_directory=persist_directory,
+            is_persistent=True
+        ))
+        self.collection = self.client.get_or_create_collection(
+            name=collection_name,
+            metadata={"hnsw:space": "cosine"}
+        )
+
+    def add(self, ids: List[str], embeddings: np.ndarray, documents: List[str], metadatas: List[Dict]):
+        self.collection.add(
+            embeddings=embeddings.tolist(),
+            documents=documents,
+            metadatas=metadatas,
+            ids=ids
+        )
+
+    def delete(self, ids: List[str]):
+        if ids:
+            self.collection.delete(ids=ids)
+
+    def query(self, embeddings: np.ndarray, n_results: int) -> List[List[Dict]]:
+        results = self.collection.query(
+            query_embeddings=embeddings.tolist(),
+            n_results=n_results,
+            include=['documents', 'metadatas', 'distances']
+        )
+
+        per_query = []
+        for q in range(len(embeddings)):
+            hits = []
+            for i in range(len(results['ids'][q])):
+                hits.append({
+                    'id': results['ids'][q][i],
+                    'text': results['documents'][q][i],
+                    'metadata': results['metadatas'][q][i],
+                    'distance': results['distances'][q][i]
+                })
+            per_query.append(hits)
+        return per_query
+
+    def ids(self) -> List[str]:
+        return self.collection.get(include=[])['ids']
+
+    def count(self) -> int:
+        return self.collection.count()
+
+class NumpyVectorStore(VectorStore):
+    """
+    In-process exact-search index.
+
+    Embeddings are stored L2-normalized in one contiguous float32 file that is
+    memory-mapped read-only, so forked workers share its pages. A query is one
+    matrix multiply followed by argpartition for the top results. Writes rewrite
+    the files and are meant for the small, rarely changing reference corpus;
+    other processes pick the new version up on their next query.
+    """
+
+    name = "numpy"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.records_path = os.path.join(directory, "records.json")
+        self._lock = threading.Lock()
+        self._version = None
+        self._ids: List[str] = []
+        self._documents: List[str] = []
+        self._metadatas: List[Dict] = []
+        self._matrix: Optional[np.ndarray] = None
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """(Re)load the index if the files on disk changed since the last load."""
+        try:
+            version = os.stat(self.records_path).st_mtime_ns
+        except FileNotFoundError:
+            version = None
+        if version == self._version:
+            return
+
+        with self._lock:
+            if version is None:
+                self._ids, self._documents, self._metadatas, self._matrix = [], [], [], None
+            else:
+                with open(self.records_path, 'r', encoding='utf-8') as f:
+                    records = json.load(f)
+                self._ids = records['ids']
+                self._documents = records['documents']
+                self._metadatas = records['metadatas']
+                self._matrix = None
+                if self._ids:
+                    self._matrix = np.memmap(
+                        os.path.join(self.directory, records['matrix_file']),
+                        dtype=np.float32, mode='r', shape=(len(self._ids), records['dim'])
+                    )
+            self._version = version
+
+    def _write(self, ids: List[str], matrix: Optional[np.ndarray], documents: List[str], metadatas: List[Dict]):
+        """Write a new version of the index; the records file is replaced last so readers never see a partial index."""
+        previous = None
+        if os.path.exists(self.records_path):
+            with open(self.records_path, 'r', encoding='utf-8') as f:
+                previous = json.load(f).get('matrix_file')
+
+        matrix_file = f"embeddings-{uuid.uuid4().hex}.f32"
+        dim = 0
+        if matrix is not None and len(ids):
+            dim = matrix.shape[1]
+            np.ascontiguousarray(matrix, dtype=np.float32).tofile(os.path.join(self.directory, matrix_file))
+
+        tmp_path = self.records_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'matrix_file': matrix_file,
+                'dim': dim,
+                'ids': ids,
+                'documents': documents,
+                'metadatas': metadatas,
+            }, f)
+        os.replace(tmp_path, self.records_path)
+
+        # Processes still mapping the old file keep reading it until they reload
+        if previous and previous != matrix_file:
+            try:
+                os.remove(os.path.join(self.directory, previous))
+            except FileNotFoundError:
+                pass
+        self._version = None
+        self._load()
+
+    def add(self, ids: List[str], embeddings: np.ndarray, documents: List[str], metadatas: List[Dict]):
+        self._load()
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings = embeddings / np.maximum(norms, 1e-12)
+
+        # Adding an existing id replaces it, as with Chroma's upsert
+        replaced = set(ids)
+        keep = [i for i, existing in enumerate(self._ids) if existing not in replaced]
+        parts = [embeddings]
+        if self._matrix is not None and keep:
+            parts.insert(0, np.asarray(self._matrix[keep]))
+
+        self._write(
+            [self._ids[i] for i in keep] + list(ids),
+            np.vstack(parts),
+            [self._documents[i] for i in keep] + list(documents),
+            [self._metadatas[i] for i in keep] + list(metadatas)
+        )
+
+    def delete(self, ids: List[str]):
+        self._load()
+        removed = set(ids)
+        keep = [i for i, existing in enumerate(self._ids) if existing not in removed]
+        if len(keep) == len(self._ids):
+            return
+
+        self._write(
+            [self._ids[i] for i in keep],
+            np.asarray(self._matrix[keep]) if keep else None,
+            [self._documents[i] for i in keep],
+            [self._metadatas[i] for i in keep]
+        )
+
+    def query(self, embeddings: np.ndarray, n_results: int) -> List[List[Dict]]:
+        self._load()
+        if self._matrix is None:
+            return [[] for _ in range(len(embeddings))]
+
+        queries = np.asarray(embeddings, dtype=np.float32)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+        # Cosine similarity of every query against every stored chunk in one multiply
+        similarities = queries @ self._matrix.T
+        k = min(n_results, similarities.shape[1])
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+
+        per_query = []
+        for q in range(len(queries)):
+            order = top[q][np.argsort(-similarities[q, top[q]])]
+            per_query.append([{
+                'id': self._ids[i],
+                'text': self._documents[i],
+                'metadata': self._metadatas[i],
+                'distance': float(1.0 - similarities[q, i])
+            } for i in order])
+        return per_query
+
+    def ids(self) -> List[str]:
+        self._load()
+        return list(self._ids)
+
+    def count(self) -> int:
+        self._load()
+        return len(self._ids)
+
+def create_vector_store(name: str, persist_directory: str, collection_name: str) -> VectorStore:
+    """
+    Create the vector store backend selected by name.
+
+    Args:
+        name (str): 'chroma' or 'numpy'
+        persist_directory (str): Directory holding the store's files
+        collection_name (str): Name of the collection
+
+    Returns:
+        VectorStore: The store
+    """
+    name = name.lower()
+    if name == "chroma":
+        return ChromaVectorStore(persist_directory, collection_name)
+    if name == "numpy":
+        return NumpyVectorStore(os.path.join(persist_directory, f"numpy_{collection_name}"))
+    raise ValueError(f"Unknown vector store: {name}")